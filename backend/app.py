@@ -1,35 +1,364 @@
-from flask import Flask, request, jsonify, g
+from flask import Flask, request, jsonify, g, Response, send_file, stream_with_context
 from flask_cors import CORS
 import sqlite3
-import bcrypt
 import os
+import base64
+import binascii
+import json
+import queue
+import secrets
+import sys
+import time
+import uuid
+from collections import namedtuple
+from contextlib import closing
 from datetime import datetime
+import blob_migration
+import config
 import crypto_utils
+import db_setup
+import logging_setup
+import wire
+from auth import Identity, SessionTokens, TokenError
+from db_pool import ConnectionPool
+from key_pool import KeyPairPool
+from message_hub import MessageHub
+from logging_setup import fields
+from metrics import registry, InstrumentedConnection, SlowRequestProfiler
+from passwords import PasswordHasher, HasherBusy
+from retention import RetentionReaper
+from shards import ShardRouter
+from user_index import PREFIX_END, UsernameIndex
+from write_queue import GroupCommitWriter
 
 app = Flask(__name__)
-CORS(app)
+# ETag is exposed so browsers can revalidate public keys with If-None-Match
+CORS(app, expose_headers=['ETag'])
 
-DATABASE = 'encrypted_echo.db'
+logging_setup.configure_logging(
+    level=config.LOG_LEVEL,
+    sample_rate=config.LOG_SAMPLE_RATE,
+    max_field_chars=config.LOG_MAX_FIELD_CHARS
+)
+log = logging_setup.get_logger('app')
+
+DATABASE = config.DATABASE
+
+# Run pending migrations once at startup; route handlers read the cached
+# column map instead of introspecting the database on every request.
+SCHEMA = db_setup.setup_database(DATABASE)
+
+# Long-lived WAL connections, so readers don't block writers and prepared
+# statements survive between requests
+POOL_OPTIONS = dict(
+    size=config.DB_POOL_SIZE,
+    timeout=config.DB_POOL_TIMEOUT,
+    statement_cache=config.DB_STATEMENT_CACHE,
+    factory=InstrumentedConnection,
+    pragmas={
+        "journal_mode": config.DB_JOURNAL_MODE,
+        "synchronous": config.DB_SYNCHRONOUS,
+        "busy_timeout": config.DB_BUSY_TIMEOUT_MS,
+        "mmap_size": config.DB_MMAP_SIZE,
+        "cache_size": config.DB_CACHE_SIZE,
+    },
+)
+pool = ConnectionPool(DATABASE, **POOL_OPTIONS)
+
+# Optional message sharding: with SHARD_COUNT > 1 messages live in shard
+# files picked by receiver_id, and DATABASE only holds the user directory
+router = None
+if config.SHARD_COUNT > 1:
+    router = ShardRouter(DATABASE, config.SHARD_DIR, config.SHARD_COUNT, **POOL_OPTIONS)
+    with closing(sqlite3.connect(DATABASE)) as _conn:
+        if _conn.execute("SELECT EXISTS (SELECT 1 FROM messages)").fetchone()[0]:
+            log.warning("messages table isn't empty but sharding is on; run shards.py rebalance",
+                        extra=fields(database=DATABASE))
+
+# Optional group commit: /send hands its INSERT to a writer thread that
+# commits many senders' rows in one transaction (one writer per shard)
+writers = None
+if config.WRITE_BEHIND_ENABLED:
+    writers = [
+        GroupCommitWriter(
+            message_pool,
+            max_batch=config.WRITE_BATCH_MAX,
+            max_latency=config.WRITE_BATCH_LATENCY_MS / 1000
+        )
+        for message_pool in (router.pools if router else [pool])
+    ]
+
+def get_writer(receiver_id):
+    """The group-commit writer for receiver_id's messages, or None"""
+    if writers is None:
+        return None
+    return writers[router.shard_for(receiver_id) if router else 0]
+
+# Sorted usernames in memory, so /users pages and typeahead searches are a
+# couple of bisects instead of a query per keystroke
+user_index = None
+if config.USER_INDEX_ENABLED:
+    with closing(sqlite3.connect(DATABASE)) as _conn:
+        user_index = UsernameIndex(refresh_interval=config.USER_INDEX_REFRESH).load(_conn)
+
+# Signed session tokens let message routes skip bcrypt and the username lookup
+if not config.SECRET_KEY:
+    log.warning("ECHO_SECRET_KEY is not set; session tokens won't survive a restart or work across workers")
+tokens = SessionTokens(
+    config.SECRET_KEY or secrets.token_urlsafe(32),
+    ttl=config.TOKEN_TTL,
+    refresh_window=config.TOKEN_REFRESH_WINDOW,
+)
+
+# bcrypt runs in worker processes so logins don't starve the other routes
+hasher = PasswordHasher(
+    rounds=config.BCRYPT_ROUNDS,
+    workers=config.HASH_WORKERS,
+    max_pending=config.HASH_MAX_PENDING,
+)
+
+# RSA keygen takes tens of milliseconds, so /crypto_demo takes key pairs
+# generated ahead of time on a worker process. The pool starts filling on
+# the first /crypto_demo request, not at import.
+key_pool = KeyPairPool(
+    high_water=config.KEY_POOL_SIZE,
+    low_water=config.KEY_POOL_LOW_WATER,
+    workers=config.KEY_POOL_WORKERS,
+)
+
+# Rewrite rows stored before BLOB storage, in the shard files as well;
+# /messages reads both formats meanwhile
+if config.BLOB_MIGRATION_AUTOSTART:
+    blob_migration.start_background(
+        [DATABASE] + (router.paths if router else []),
+        batch_size=config.BLOB_MIGRATION_BATCH,
+        pause=config.BLOB_MIGRATION_PAUSE
+    )
+
+# Deletes expired messages in small batches and shrinks the files afterwards
+reaper = RetentionReaper(
+    [DATABASE] + (router.paths if router else []),
+    interval=config.RETENTION_INTERVAL,
+    batch_size=config.RETENTION_BATCH,
+    pause=config.RETENTION_PAUSE,
+    vacuum_pages=config.RETENTION_VACUUM_PAGES,
+).start()
+
+# Wakes up /messages/stream clients when send_message() commits a message
+hub = MessageHub()
+
+# --- Instrumentation ---
+profiler = None
+if config.PROFILE_SLOW_REQUEST_MS:
+    profiler = SlowRequestProfiler(
+        threshold=config.PROFILE_SLOW_REQUEST_MS / 1000,
+        interval=config.PROFILE_SAMPLE_INTERVAL_MS / 1000
+    )
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler:
+        profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        duration = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        registry.observe('http_request_duration_seconds', (('method', request.method), ('route', route)), duration)
+        registry.inc('http_requests_total', (('method', request.method), ('route', route), ('status', str(response.status_code))))
+        if profiler:
+            profiler.finish(f"{request.method} {route}", duration)
+    return response
+
+registry.gauge('db_pool_connections', 'Pooled SQLite connections by state',
+               lambda: dict(zip(((('state', 'open'),), (('state', 'idle'),)), pool.stats())))
+if router:
+    registry.gauge('shard_pool_connections', 'Pooled shard connections by shard and state',
+                   lambda: {
+                       (('shard', str(index)), ('state', state)): value
+                       for index, shard_pool in enumerate(router.pools)
+                       for state, value in zip(('open', 'idle'), shard_pool.stats())
+                   })
+registry.gauge('stream_subscribers', 'Clients waiting on /messages/stream', lambda: hub.subscriber_count())
+registry.gauge('password_hasher_pending', 'bcrypt jobs queued or running', lambda: hasher.pending())
+registry.gauge('write_queue_pending', 'Inserts waiting for the group-commit writer',
+               lambda: sum(writer.pending() for writer in writers or ()))
+registry.gauge('database_bytes', 'SQLite file size and reclaimable free bytes by database',
+               lambda: {
+                   (('database', path), ('kind', kind)): size[f"{kind}_bytes"]
+                   for path, size in reaper.stats()["databases"].items()
+                   for kind in ('file', 'free')
+               })
+registry.gauge('key_pool_available', 'Pre-generated RSA key pairs ready for use', lambda: key_pool.available())
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        g.db = pool.acquire()
     return g.db
 
+def get_shard_db(receiver_id):
+    """Connection for receiver_id's messages (the main one when not sharded)"""
+    if router is None:
+        return get_db()
+    index = router.shard_for(receiver_id)
+    shard_dbs = g.setdefault('shard_dbs', {})
+    if index not in shard_dbs:
+        shard_dbs[index] = router.pools[index].acquire()
+    return shard_dbs[index]
+
 @app.teardown_appcontext
 def close_connection(exception):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        pool.release(db)
+    for index, shard_db in g.pop('shard_dbs', {}).items():
+        router.pools[index].release(shard_db)
+
+# --- Binary fields ---
+# Ciphertext, wrapped keys and nonces are stored as raw BLOBs and only
+# base64-encoded at the JSON boundary. Rows written before the switch may
+# still hold base64 TEXT until blob_migration.py has rewritten them.
+
+def decode_b64(value):
+    """Decode an optional base64 field from a request (raises ValueError)"""
+    if value is None or isinstance(value, bytes):
+        return value  # absent, or raw bytes from the binary wire format
+    if not isinstance(value, str):
+        raise ValueError("Expected a base64 string")
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error as e:
+        raise ValueError(str(e))
+
+def encode_b64(value):
+    """Encode a stored binary field for a JSON response"""
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    return value  # legacy TEXT row, already base64
+
+# --- Streaming responses ---
+# Large lists are written out while the cursor is still being read, so memory
+# stays flat and the first byte doesn't wait for the last row. Clients can ask
+# for NDJSON (one JSON document per line) with ?format=ndjson or
+# 'Accept: application/x-ndjson' to process rows as they arrive. Message lists
+# are also available as binary frames (see wire.py).
+STREAM_FETCH_ROWS = 200          # rows per fetchmany()
+STREAM_CHUNK_BYTES = 64 * 1024   # bytes buffered before each write
+
+def to_json(value):
+    return json.dumps(value, separators=(',', ':'))
+
+def wants_ndjson():
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+def wants_frames():
+    return request.args.get('format') == 'frames' or request.accept_mimetypes.best == wire.MIMETYPE
 
-def describe_table(table_name):
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    columns = cursor.execute(f"PRAGMA table_info({table_name})").fetchall()
-    conn.close()
-    return [col[1] for col in columns]  # col[1] is name
+def iter_rows(cursor, size=STREAM_FETCH_ROWS):
+    """Iterate a cursor's result set without materialising it"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+def stream_json_list(items, key=None, trailer=None):
+    """
+    Stream items as a JSON array, or as {key: [...], **trailer()} when key is
+    given. trailer() runs after the last item, so it can report totals or
+    cursors. In NDJSON mode each item is a line, followed by the trailer line.
+    """
+    ndjson = wants_ndjson()
+    
+    def fragments():
+        if ndjson:
+            for item in items:
+                yield to_json(item) + "\n"
+            if trailer:
+                yield to_json(trailer()) + "\n"
+            return
+        
+        yield f'{{{to_json(key)}:[' if key else '['
+        separator = ''
+        for item in items:
+            yield separator + to_json(item)
+            separator = ','
+        if key:
+            tail = trailer() if trailer else {}
+            yield ']' + ''.join(f',{to_json(name)}:{to_json(value)}' for name, value in tail.items()) + '}'
+        else:
+            yield ']'
+    
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    # stream_with_context keeps the pooled connection checked out until we finish
+    return Response(stream_with_context(buffered(fragments())), mimetype=mimetype)
+
+def stream_frames(rows, trailer):
+    """Stream message rows as wire MESSAGE frames, then trailer() as a PAGE_END frame"""
+    def frames():
+        for row in rows:
+            yield wire.encode_message(row)
+        tail = trailer()
+        yield wire.encode_page_end(tail["next_cursor"], tail["has_more"])
+    
+    return Response(stream_with_context(buffered(frames())), mimetype=wire.MIMETYPE)
+
+def buffered(fragments):
+    """Join small str or bytes fragments into writes of about STREAM_CHUNK_BYTES"""
+    buffer = []
+    size = 0
+    for fragment in fragments:
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= STREAM_CHUNK_BYTES:
+            yield fragment[:0].join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield buffer[0][:0].join(buffer)
+
+# --- Session tokens ---
+# Message routes take the acting user from an 'Authorization: Bearer' token
+# when there is one, and from the username in the request otherwise.
+
+def lookup_user_id(username):
+    """Id of a username, from user_index when it has seen it, else a query"""
+    if user_index is not None:
+        user_id = user_index.lookup(username)
+        if user_id is not None:
+            return user_id
+    user = get_db().execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    return user['id'] if user else None
+
+def authenticate(username, unknown="User does not exist"):
+    """
+    Return the acting user's Identity, or an error response tuple.
+    A valid token gives the id without touching the database; a username
+    sent alongside it must be the token's. Without a token the username is
+    looked up, unless AUTH_REQUIRED is set.
+    """
+    authorization = request.authorization
+    if authorization is not None:
+        if authorization.type != 'bearer' or not authorization.token:
+            return jsonify({"error": "Authorization must be a Bearer token"}), 401, {"WWW-Authenticate": "Bearer"}
+        try:
+            identity = tokens.verify(authorization.token)
+        except TokenError as e:
+            return jsonify({"error": str(e)}), 401, {"WWW-Authenticate": "Bearer"}
+        if username and username != identity.username:
+            return jsonify({"error": "Token does not belong to this user"}), 403
+        return identity
+    
+    if config.AUTH_REQUIRED:
+        return jsonify({"error": "Authentication required"}), 401, {"WWW-Authenticate": "Bearer"}
+    user_id = lookup_user_id(username) if username else None
+    if user_id is None:
+        return jsonify({"error": unknown}), 400
+    return Identity(user_id, username)
 
 # --- Register route ---
 @app.route('/register', methods=['POST'])
@@ -48,43 +377,25 @@ def register():
             return jsonify({"error": "Username and password are required."}), 400
 
         # Hash the password
-        hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_pw = hasher.hash(password)
 
         # Store in database
         db = get_db()
         cursor = db.cursor()
         
         try:
-            # Check if the users table has a public_key column
-            columns = describe_table('users')
-            
-            if 'public_key' in columns:
-                cursor.execute(
-                    "INSERT INTO users (username, password_hash, public_key) VALUES (?, ?, ?)", 
-                    (username, hashed_pw, public_key)
-                )
-            else:
-                cursor.execute(
-                    "INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-                    (username, hashed_pw)
-                )
-                
-                # If public_key column doesn't exist, try to add it
-                try:
-                    cursor.execute("ALTER TABLE users ADD COLUMN public_key TEXT")
-                    # Update the user we just inserted
-                    cursor.execute(
-                        "UPDATE users SET public_key = ? WHERE username = ?",
-                        (public_key, username)
-                    )
-                except sqlite3.OperationalError:
-                    # Ignore error if column already exists or can't be added
-                    pass
-                    
+            cursor.execute(
+                "INSERT INTO users (username, password_hash, public_key) VALUES (?, ?, ?)", 
+                (username, hashed_pw, public_key)
+            )
             db.commit()
+            if user_index is not None:
+                user_index.add(cursor.lastrowid, username)
             return jsonify({"message": "User registered successfully!"}), 201
         except sqlite3.IntegrityError:
             return jsonify({"error": "Username already exists"}), 400
+    except HasherBusy:
+        return jsonify({"error": "Server is busy, please retry shortly."}), 503, {"Retry-After": "1"}
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
@@ -108,13 +419,45 @@ def login():
         cursor = db.cursor()
         user = cursor.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
         
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password_hash']):
+        if user and hasher.verify(password, user['password_hash']):
+            # Upgrade hashes made with an older work factor while we have the password
+            if hasher.needs_rehash(user['password_hash']):
+                try:
+                    cursor.execute(
+                        "UPDATE users SET password_hash = ? WHERE id = ?",
+                        (hasher.hash(password), user['id'])
+                    )
+                    db.commit()
+                except HasherBusy:
+                    pass  # Try again on a later login
             return jsonify({
                 "message": "Login successful!",
-                "user_id": user['id']
+                "user_id": user['id'],
+                "token": tokens.issue(user['id'], user['username']),
+                "expires_in": tokens.ttl
             }), 200
         else:
             return jsonify({"error": "Invalid credentials"}), 401
+    except HasherBusy:
+        return jsonify({"error": "Server is busy, please retry shortly."}), 503, {"Retry-After": "1"}
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+# --- Refresh token route ---
+@app.route('/refresh', methods=['POST'])
+def refresh_token():
+    """Trade a token for a new one, no password needed, until TOKEN_REFRESH_WINDOW after the login"""
+    try:
+        authorization = request.authorization
+        if authorization is None or authorization.type != 'bearer' or not authorization.token:
+            return jsonify({"error": "A Bearer token is required."}), 401, {"WWW-Authenticate": "Bearer"}
+        
+        try:
+            identity, token = tokens.refresh(authorization.token)
+        except TokenError as e:
+            return jsonify({"error": str(e)}), 401, {"WWW-Authenticate": "Bearer"}
+        
+        return jsonify({"user_id": identity.user_id, "token": token, "expires_in": tokens.ttl}), 200
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
@@ -130,53 +473,170 @@ def get_user_public_key():
         db = get_db()
         cursor = db.cursor()
         
-        # Check if the users table has a public_key column
-        columns = describe_table('users')
-        
-        if 'public_key' not in columns:
-            return jsonify({"error": "Public key not available."}), 404
-        
         # Get the user's public key
         user = cursor.execute("SELECT public_key FROM users WHERE username = ?", (username,)).fetchone()
         
         if not user or not user['public_key']:
             return jsonify({"error": "User not found or public key not available."}), 404
         
-        return jsonify({
+        # Clients that already hold this key get a 304 with no body
+        etag = crypto_utils.key_fingerprint(user['public_key'])
+        if request.if_none_match.contains(etag):
+            return conditional_response(Response(status=304), etag)
+        
+        return conditional_response(jsonify({
             "username": username,
             "public_key": user['public_key']
-        }), 200
+        }), etag), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+def conditional_response(response, etag):
+    """Tag a response so clients revalidate with If-None-Match"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# --- Get Multiple User Public Keys route ---
+PUBLIC_KEYS_BATCH_MAX = 500
+
+@app.route('/user_public_keys', methods=['POST'])
+def get_user_public_keys():
+    """
+    Look up many public keys in one query.
+    Body: {"usernames": [...]}; unknown users or users without a key are
+    listed under "missing". Supports If-None-Match like /user_public_key.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "Invalid JSON or missing Content-Type header"}), 400
+        
+        usernames = data.get('usernames')
+        if not isinstance(usernames, list) or not usernames or not all(isinstance(u, str) for u in usernames):
+            return jsonify({"error": "A non-empty list of usernames is required."}), 400
+        
+        if len(usernames) > PUBLIC_KEYS_BATCH_MAX:
+            return jsonify({"error": f"At most {PUBLIC_KEYS_BATCH_MAX} usernames per request."}), 400
+        
+        # Keep request order but query each name once
+        usernames = list(dict.fromkeys(usernames))
+        
+        db = get_db()
+        cursor = db.cursor()
+        
+        placeholders = ", ".join("?" * len(usernames))
+        rows = cursor.execute(
+            f"SELECT username, public_key FROM users WHERE username IN ({placeholders}) AND public_key IS NOT NULL",
+            tuple(usernames)
+        ).fetchall()
+        found = {row['username']: row['public_key'] for row in rows}
+        
+        keys = [{"username": name, "public_key": found[name]} for name in usernames if name in found]
+        missing = [name for name in usernames if name not in found]
+        
+        # The combined ETag changes whenever any of the requested keys does
+        etag = crypto_utils.key_fingerprint("\n".join(
+            f"{key['username']}:{crypto_utils.key_fingerprint(key['public_key'])}" for key in keys
+        ) + "\n" + ",".join(missing))
+        if request.if_none_match.contains(etag):
+            return conditional_response(Response(status=304), etag)
+        
+        return conditional_response(jsonify({
+            "keys": keys,
+            "missing": missing
+        }), etag), 200
         
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 # --- Get Users route ---
+USERS_PAGE_SIZE = 50
+USERS_PAGE_MAX = 200
+
+def find_users(after, prefix, limit):
+    """(id, username) rows in username order from the users.username index"""
+    conditions = []
+    params = []
+    if after is not None:
+        conditions.append("username > ?")
+        params.append(after)
+    if prefix:
+        # A range rather than LIKE, which is case-insensitive and can't use the index
+        conditions.append("username >= ? AND username < ?")
+        params.extend([prefix, prefix + PREFIX_END])
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    return get_db().execute(
+        f"SELECT id, username FROM users {where}ORDER BY username LIMIT ?", params + [limit]
+    ).fetchall()
+
 @app.route('/users', methods=['GET'])
 def get_users():
+    """
+    One page of the user directory in username order.
+    - q: only usernames starting with q (typeahead)
+    - after: the next_cursor of the previous page
+    """
     try:
-        db = get_db()
-        cursor = db.cursor()
-        users = cursor.execute("SELECT id, username FROM users").fetchall()
+        prefix = request.args.get('q', '')
+        after = request.args.get('after') or None
+        try:
+            limit = parse_id_arg('limit')
+        except ValueError:
+            return jsonify({"error": "limit must be a non-negative integer."}), 400
+        limit = min(limit or USERS_PAGE_SIZE, USERS_PAGE_MAX)
         
-        # Convert to list of dictionaries
-        users_list = []
-        for user in users:
-            users_list.append({
-                "id": user['id'],
-                "username": user['username']
-            })
+        # One extra row tells whether another page exists
+        if user_index is not None:
+            user_index.refresh(get_db)
+            rows = user_index.page(after, prefix, limit + 1)
+        else:
+            rows = find_users(after, prefix, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
-        return jsonify(users_list), 200
+        users = ({"id": user_id, "username": username} for user_id, username in rows)
+        trailer = {"next_cursor": rows[-1][1] if has_more else None, "has_more": has_more}
+        return stream_json_list(users, key="users", trailer=lambda: trailer), 200
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
 # --- Send Message route ---
+INSERT_MESSAGE_SQL = (
+    "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv, expires_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+def message_expiry(ttl, now=None):
+    """
+    expires_at for a message sent now with an optional per-message ttl in
+    seconds; a deployment-wide MESSAGE_TTL caps it. Raises ValueError.
+    """
+    if ttl is not None and (isinstance(ttl, bool) or not isinstance(ttl, int) or ttl <= 0):
+        raise ValueError("ttl must be a positive number of seconds.")
+    ttls = [value for value in (ttl, config.MESSAGE_TTL) if value]
+    if not ttls:
+        return None
+    return int(time.time() if now is None else now) + min(ttls)
+
 @app.route('/send', methods=['POST'])
 def send_message():
+    """
+    Send one message. The body is JSON with base64 fields, or a wire SEND
+    frame with raw bytes (Content-Type: application/x-echo-frames).
+    """
     try:
-        data = request.get_json()
-        print(f"Received message data: {data}")
+        if request.mimetype == wire.MIMETYPE:
+            try:
+                data = wire.decode_send(request.get_data())
+            except ValueError as e:
+                return jsonify({"error": f"Invalid frame: {e}"}), 400
+        else:
+            data = request.get_json()
+        log.debug("send received", extra=fields(payload=data))
         
         if not data:
             return jsonify({"error": "Invalid JSON or missing Content-Type header"}), 400
@@ -187,165 +647,870 @@ def send_message():
         encrypted_key = data.get('encrypted_key')
         nonce = data.get('iv')  # Note: 'iv' from frontend is stored as 'nonce' in crypto_utils
         
-        if not sender_username or not receiver_username or not encrypted_msg:
+        if not (sender_username or request.authorization) or not receiver_username or not encrypted_msg:
             return jsonify({"error": "Sender, receiver, and encrypted message are required."}), 400
+        
+        try:
+            encrypted_msg = decode_b64(encrypted_msg)
+            encrypted_key = decode_b64(encrypted_key)
+            nonce = decode_b64(nonce)
+        except ValueError:
+            return jsonify({"error": "encrypted_msg, encrypted_key and iv must be base64 encoded."}), 400
+        
+        try:
+            expires_at = message_expiry(data.get('ttl'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Get user IDs
-        db = get_db()
-        cursor = db.cursor()
-        
-        # Get sender ID
-        sender = cursor.execute("SELECT id FROM users WHERE username = ?", (sender_username,)).fetchone()
-        if not sender:
-            return jsonify({"error": "Sender does not exist"}), 400
-        sender_id = sender['id']
+        sender = authenticate(sender_username, unknown="Sender does not exist")
+        if not isinstance(sender, Identity):
+            return sender
+        sender_id, sender_username = sender
         
-        # Get receiver ID
-        receiver = cursor.execute("SELECT id FROM users WHERE username = ?", (receiver_username,)).fetchone()
-        if not receiver:
+        receiver_id = lookup_user_id(receiver_username)
+        if receiver_id is None:
             return jsonify({"error": "Receiver does not exist"}), 400
-        receiver_id = receiver['id']
         
-        print(f"Sender ID: {sender_id}, Receiver ID: {receiver_id}")
+        log.info("sending message", extra=fields(sender_id=sender_id, receiver_id=receiver_id))
         
-        # Check if the messages table has the necessary columns
-        columns = describe_table('messages')
+        # Store the message
+        row = (sender_id, receiver_id, encrypted_msg, encrypted_key, nonce, expires_at)
+        writer = get_writer(receiver_id)
+        if writer:
+            # Blocks until the writer has committed the batch holding our row
+            message_id = writer.submit(INSERT_MESSAGE_SQL, row).result()
+        else:
+            shard_db = get_shard_db(receiver_id)
+            shard_cursor = shard_db.cursor()
+            shard_cursor.execute(INSERT_MESSAGE_SQL, row)
+            shard_db.commit()
+            message_id = shard_cursor.lastrowid
         
-        # Ensure the messages table has columns for encryption data
-        if 'encrypted_key' not in columns:
-            try:
-                cursor.execute("ALTER TABLE messages ADD COLUMN encrypted_key TEXT")
-            except sqlite3.OperationalError:
-                # Ignore error if column already exists
-                pass
+        # Push the new message to any streaming clients of the receiver
+        hub.publish(receiver_id, message_to_dict({
+            "id": message_id,
+            "sender": sender_username,
+            "encrypted_message": encrypted_msg,
+            "encrypted_key": encrypted_key,
+            "iv": nonce
+        }))
+        return jsonify({"message": "Message sent successfully!"}), 201
                 
-        if 'iv' not in columns:
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+# --- Send Batch route ---
+SEND_BATCH_MAX = 500
+
+def resolve_user_ids(cursor, usernames):
+    """Map usernames to user ids with a single IN query (unknown names are left out)"""
+    names = {name for name in usernames if isinstance(name, str) and name}
+    if not names:
+        return {}
+    placeholders = ", ".join("?" * len(names))
+    rows = cursor.execute(
+        f"SELECT id, username FROM users WHERE username IN ({placeholders})",
+        tuple(names)
+    ).fetchall()
+    return {row['username']: row['id'] for row in rows}
+
+@app.route('/send_batch', methods=['POST'])
+def send_batch():
+    """
+    Send many messages from one sender in a single request and transaction.
+    Body: {"sender": ..., "messages": [{"receiver", "encrypted_msg", "encrypted_key", "iv"}, ...]}
+    An optional "ttl" applies to every message unless one sets its own.
+    Each item is reported as sent (with its id) or failed, in request order.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "Invalid JSON or missing Content-Type header"}), 400
+        
+        sender_username = data.get('sender')
+        envelopes = data.get('messages')
+        
+        if not (sender_username or request.authorization) or not isinstance(envelopes, list) or not envelopes:
+            return jsonify({"error": "Sender and a non-empty list of messages are required."}), 400
+        
+        if len(envelopes) > SEND_BATCH_MAX:
+            return jsonify({"error": f"At most {SEND_BATCH_MAX} messages per batch."}), 400
+        
+        sender = authenticate(sender_username, unknown="Sender does not exist")
+        if not isinstance(sender, Identity):
+            return sender
+        sender_id, sender_username = sender
+        
+        db = get_db()
+        cursor = db.cursor()
+        
+        # Resolve every receiver with one query
+        receiver_ids = resolve_user_ids(cursor, [
+            envelope.get('receiver') for envelope in envelopes if isinstance(envelope, dict)
+        ])
+        
+        results = []
+        pending = []  # (result, (encrypted_msg, encrypted_key, iv), receiver_id) for rows to insert
+        for index, envelope in enumerate(envelopes):
+            receiver_username = envelope.get('receiver') if isinstance(envelope, dict) else None
+            result = {"index": index, "receiver": receiver_username}
+            results.append(result)
+            
+            if not receiver_username or not envelope.get('encrypted_msg'):
+                result.update(status="failed", error="Receiver and encrypted message are required.")
+                continue
+            if receiver_username not in receiver_ids:
+                result.update(status="failed", error="Receiver does not exist")
+                continue
             try:
-                cursor.execute("ALTER TABLE messages ADD COLUMN iv TEXT")
-            except sqlite3.OperationalError:
-                # Ignore error if column already exists
-                pass
+                values = (
+                    decode_b64(envelope['encrypted_msg']),
+                    decode_b64(envelope.get('encrypted_key')),
+                    decode_b64(envelope.get('iv'))
+                )
+            except ValueError:
+                result.update(status="failed", error="encrypted_msg, encrypted_key and iv must be base64 encoded.")
+                continue
+            try:
+                values += (message_expiry(envelope.get('ttl', data.get('ttl'))),)
+            except ValueError as e:
+                result.update(status="failed", error=str(e))
+                continue
+            pending.append((result, values, receiver_ids[receiver_username]))
+        
+        # One transaction per shard; without sharding that's a single one
+        by_shard = {}
+        for item in pending:
+            by_shard.setdefault(router.shard_for(item[2]) if router else 0, []).append(item)
+        
+        for shard_pending in by_shard.values():
+            shard_db = get_shard_db(shard_pending[0][2])
+            shard_cursor = shard_db.cursor()
+            shard_cursor.executemany(
+                INSERT_MESSAGE_SQL,
+                [
+                    (sender_id, receiver_id) + values
+                    for _, values, receiver_id in shard_pending
+                ]
+            )
+            # Rows inserted by one statement inside our write transaction get
+            # consecutive AUTOINCREMENT ids ending at last_insert_rowid()
+            last_id = shard_cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            shard_db.commit()
+            
+            first_id = last_id - len(shard_pending) + 1
+            for offset, (result, values, receiver_id) in enumerate(shard_pending):
+                result.update(status="sent", id=first_id + offset)
+                hub.publish(receiver_id, message_to_dict({
+                    "id": first_id + offset,
+                    "sender": sender_username,
+                    "encrypted_message": values[0],
+                    "encrypted_key": values[1],
+                    "iv": values[2]
+                }))
+        
+        return jsonify({
+            "sent": len(pending),
+            "failed": len(results) - len(pending),
+            "results": results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+# --- Send Multi-recipient route ---
+@app.route('/send_multi', methods=['POST'])
+def send_multi():
+    """
+    Send one message body to many recipients.
+    Body: {"sender", "encrypted_msg", "iv", "recipients": [{"receiver", "encrypted_key"}, ...], "ttl"?}
+    The ciphertext is stored once in message_bodies; each recipient gets a
+    messages row holding only their wrapped key (see crypto_utils.encrypt_for_recipients).
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "Invalid JSON or missing Content-Type header"}), 400
+        
+        sender_username = data.get('sender')
+        encrypted_msg = data.get('encrypted_msg')
+        nonce = data.get('iv')
+        recipients = data.get('recipients')
+        
+        if not (sender_username or request.authorization) or not encrypted_msg or not isinstance(recipients, list) or not recipients:
+            return jsonify({"error": "Sender, encrypted message and a non-empty list of recipients are required."}), 400
+        
+        if len(recipients) > SEND_BATCH_MAX:
+            return jsonify({"error": f"At most {SEND_BATCH_MAX} recipients per message."}), 400
         
-        # Store the message
         try:
-            if 'encrypted_key' in columns and 'iv' in columns:
-                cursor.execute(
-                    "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv) VALUES (?, ?, ?, ?, ?)", 
-                    (sender_id, receiver_id, encrypted_msg, encrypted_key, nonce)
-                )
-            else:
-                cursor.execute(
-                    "INSERT INTO messages (sender_id, receiver_id, encrypted_message) VALUES (?, ?, ?)", 
-                    (sender_id, receiver_id, encrypted_msg)
-                )
-            db.commit()
-            return jsonify({"message": "Message sent successfully!"}), 201
-        except Exception as insert_error:
-            print(f"Error inserting message: {insert_error}")
+            encrypted_msg = decode_b64(encrypted_msg)
+            nonce = decode_b64(nonce)
+        except ValueError:
+            return jsonify({"error": "encrypted_msg and iv must be base64 encoded."}), 400
+        
+        try:
+            expires_at = message_expiry(data.get('ttl'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        sender = authenticate(sender_username, unknown="Sender does not exist")
+        if not isinstance(sender, Identity):
+            return sender
+        sender_id, sender_username = sender
+        
+        db = get_db()
+        cursor = db.cursor()
+        
+        receiver_ids = resolve_user_ids(cursor, [
+            recipient.get('receiver') for recipient in recipients if isinstance(recipient, dict)
+        ])
+        
+        results = []
+        pending = []  # (result, encrypted_key, receiver_id)
+        for index, recipient in enumerate(recipients):
+            receiver_username = recipient.get('receiver') if isinstance(recipient, dict) else None
+            result = {"index": index, "receiver": receiver_username}
+            results.append(result)
             
-            # If there was an error, try creating the table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sender_id INTEGER,
-                receiver_id INTEGER,
-                encrypted_message TEXT,
-                encrypted_key TEXT,
-                iv TEXT,
-                FOREIGN KEY(sender_id) REFERENCES users(id),
-                FOREIGN KEY(receiver_id) REFERENCES users(id)
+            if not receiver_username or not recipient.get('encrypted_key'):
+                result.update(status="failed", error="Receiver and encrypted key are required.")
+                continue
+            if receiver_username not in receiver_ids:
+                result.update(status="failed", error="Receiver does not exist")
+                continue
+            try:
+                encrypted_key = decode_b64(recipient['encrypted_key'])
+            except ValueError:
+                result.update(status="failed", error="encrypted_key must be base64 encoded.")
+                continue
+            pending.append((result, encrypted_key, receiver_ids[receiver_username]))
+        
+        # The body is stored once per shard that has a recipient
+        by_shard = {}
+        for item in pending:
+            by_shard.setdefault(router.shard_for(item[2]) if router else 0, []).append(item)
+        
+        for shard_pending in by_shard.values():
+            shard_db = get_shard_db(shard_pending[0][2])
+            shard_cursor = shard_db.cursor()
+            shard_cursor.execute(
+                "INSERT INTO message_bodies (sender_id, encrypted_message, iv) VALUES (?, ?, ?)",
+                (sender_id, encrypted_msg, nonce)
             )
-            ''')
-            db.commit()
+            body_id = shard_cursor.lastrowid
+            shard_cursor.executemany(
+                "INSERT INTO messages (sender_id, receiver_id, encrypted_key, body_id, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (sender_id, receiver_id, encrypted_key, body_id, expires_at)
+                    for _, encrypted_key, receiver_id in shard_pending
+                ]
+            )
+            # Consecutive ids, as in send_batch()
+            last_id = shard_cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            shard_db.commit()
+            
+            first_id = last_id - len(shard_pending) + 1
+            for offset, (result, encrypted_key, receiver_id) in enumerate(shard_pending):
+                result.update(status="sent", id=first_id + offset)
+                hub.publish(receiver_id, message_to_dict({
+                    "id": first_id + offset,
+                    "sender": sender_username,
+                    "encrypted_message": encrypted_msg,
+                    "encrypted_key": encrypted_key,
+                    "iv": nonce
+                }))
+        
+        return jsonify({
+            "sent": len(pending),
+            "failed": len(results) - len(pending),
+            "results": results
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+# --- Attachment routes ---
+@app.route('/attachments', methods=['POST'])
+def upload_attachment():
+    """
+    Store an encrypted attachment, streaming the request body to disk.
+    Query: sender (or a Bearer token), receiver. Header X-Encrypted-Key: the
+    receiver's wrapped content key. Body: the ciphertext in crypto_utils'
+    segmented stream format, sent as application/octet-stream. Memory use
+    doesn't depend on the attachment size.
+    """
+    try:
+        sender_username = request.args.get('sender')
+        receiver_username = request.args.get('receiver')
+        encrypted_key = request.headers.get('X-Encrypted-Key')
+        
+        if not (sender_username or request.authorization) or not receiver_username or not encrypted_key:
+            return jsonify({"error": "Sender, receiver and X-Encrypted-Key are required."}), 400
+        
+        if request.content_length is not None and request.content_length > config.ATTACHMENT_MAX_BYTES:
+            return jsonify({"error": "Attachment is too large."}), 413
+        
+        sender = authenticate(sender_username, unknown="Sender does not exist")
+        if not isinstance(sender, Identity):
+            return sender
+        
+        receiver_id = lookup_user_id(receiver_username)
+        if receiver_id is None:
+            return jsonify({"error": "Receiver does not exist"}), 400
+        
+        os.makedirs(config.ATTACHMENT_DIR, exist_ok=True)
+        path = os.path.join(config.ATTACHMENT_DIR, uuid.uuid4().hex)
+        partial_path = path + '.part'
+        
+        size = 0
+        try:
+            with open(partial_path, 'wb') as f:
+                for chunk in crypto_utils.iter_file(request.stream):
+                    if size == 0 and not chunk.startswith(crypto_utils.STREAM_MAGIC[:len(chunk)]):
+                        return jsonify({"error": "Body is not an encrypted stream."}), 400
+                    size += len(chunk)
+                    if size > config.ATTACHMENT_MAX_BYTES:
+                        return jsonify({"error": "Attachment is too large."}), 413
+                    f.write(chunk)
+            
+            if size < crypto_utils.STREAM_HEADER_SIZE + crypto_utils.STREAM_TAG_SIZE:
+                return jsonify({"error": "Body is not an encrypted stream."}), 400
             
-            # Try the insert again
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        
+        db = get_db()
+        cursor = db.cursor()
+        try:
             cursor.execute(
-                "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv) VALUES (?, ?, ?, ?, ?)", 
-                (sender_id, receiver_id, encrypted_msg, encrypted_key, nonce)
+                "INSERT INTO attachments (sender_id, receiver_id, encrypted_key, size, path) VALUES (?, ?, ?, ?, ?)",
+                (sender.user_id, receiver_id, encrypted_key, size, path)
             )
             db.commit()
-            return jsonify({"message": "Message sent successfully (after table creation)!"}), 201
-                
+        except Exception:
+            os.remove(path)
+            raise
+        
+        return jsonify({
+            "message": "Attachment stored successfully!",
+            "attachment_id": cursor.lastrowid,
+            "size": size
+        }), 201
+        
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+@app.route('/attachments/<int:attachment_id>', methods=['GET'])
+def download_attachment(attachment_id):
+    """Stream an encrypted attachment back to its sender or receiver (username or a Bearer token)"""
+    try:
+        username = request.args.get('username')
+        
+        if not username and not request.authorization:
+            return jsonify({"error": "Username is required."}), 400
+        
+        user = authenticate(username)
+        if not isinstance(user, Identity):
+            return user
+        
+        attachment = get_db().execute("""
+            SELECT a.path, a.size, a.encrypted_key, a.sender_id, a.receiver_id, s.username as sender
+            FROM attachments a
+            JOIN users s ON a.sender_id = s.id
+            WHERE a.id = ?
+        """, (attachment_id,)).fetchone()
+        
+        if not attachment or user.user_id not in (attachment['sender_id'], attachment['receiver_id']):
+            return jsonify({"error": "Attachment not found."}), 404
+        
+        # send_file streams from disk in blocks rather than reading it all
+        response = send_file(
+            # Rows stored before ATTACHMENT_DIR was made absolute hold a path
+            # relative to the database's directory, the working directory then
+            os.path.join(config.DATABASE_DIR, attachment['path']),
+            mimetype='application/octet-stream',
+            conditional=False,
+            etag=False
+        )
+        response.headers['X-Encrypted-Key'] = attachment['encrypted_key']
+        response.headers['X-Sender'] = attachment['sender']
+        return response
+        
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 # --- Get Messages route ---
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_PAGE_MAX = 200
+
+# Keyset pagination queries, served by the messages(receiver_id, id) index
+# (multi-recipient messages keep their ciphertext and iv in message_bodies)
+MESSAGES_SELECT = """
+    SELECT m.id, u.username as sender,
+        COALESCE(m.encrypted_message, b.encrypted_message) as encrypted_message,
+        m.encrypted_key,
+        COALESCE(m.iv, b.iv) as iv
+    FROM messages m
+    JOIN users u ON m.sender_id = u.id
+    LEFT JOIN message_bodies b ON m.body_id = b.id
+"""
+
+# Expired messages stay hidden until the retention reaper deletes them
+NOT_EXPIRED = "(m.expires_at IS NULL OR m.expires_at > CAST(strftime('%s', 'now') AS INTEGER))"
+
+def keyset_queries(where):
+    """Build the (latest, before_id, since_id) page queries for a WHERE clause"""
+    where = f"{where} AND {NOT_EXPIRED}"
+    return (
+        MESSAGES_SELECT + f"WHERE {where} ORDER BY m.id DESC LIMIT ?",
+        MESSAGES_SELECT + f"WHERE {where} AND m.id < ? ORDER BY m.id DESC LIMIT ?",
+        MESSAGES_SELECT + f"WHERE {where} AND m.id > ? ORDER BY m.id ASC LIMIT ?",
+    )
+
+MESSAGES_LATEST_QUERY, MESSAGES_BEFORE_QUERY, MESSAGES_SINCE_QUERY = keyset_queries("m.receiver_id = ?")
+
+def message_to_dict(msg):
+    """Convert a message row into the JSON shape returned to clients"""
+    message_dict = {
+        "id": msg['id'],
+        "sender": msg['sender'],
+        "encrypted_msg": encode_b64(msg['encrypted_message'])
+    }
+    
+    # Add encryption data if available
+    if msg['encrypted_key']:
+        message_dict['encrypted_key'] = encode_b64(msg['encrypted_key'])
+        
+    if msg['iv']:
+        message_dict['iv'] = encode_b64(msg['iv'])
+    
+    return message_dict
+
+def parse_id_arg(name):
+    """Read an optional non-negative integer query parameter"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"{name} must be non-negative")
+    return value
+
+def parse_page_args():
+    """Read since_id, before_id and limit for a paged message list (raises ValueError)"""
+    try:
+        since_id = parse_id_arg('since_id')
+        before_id = parse_id_arg('before_id')
+        limit = parse_id_arg('limit')
+    except ValueError:
+        raise ValueError("since_id, before_id and limit must be non-negative integers.")
+    if since_id is not None and before_id is not None:
+        raise ValueError("Use either since_id or before_id, not both.")
+    if not limit:
+        limit = MESSAGES_PAGE_SIZE
+    return since_id, before_id, min(limit, MESSAGES_PAGE_MAX)
+
+def message_page(cursor, queries, params, since_id, before_id, limit):
+    """
+    Stream one page as {messages, next_cursor, has_more}, or as wire frames,
+    using the (latest, before_id, since_id) queries from keyset_queries()
+    """
+    latest_query, before_query, since_query = queries
+    # Fetch one extra row to find out whether another page exists
+    if since_id is not None:
+        cursor.execute(since_query, params + (since_id, limit + 1))
+    elif before_id is not None:
+        cursor.execute(before_query, params + (before_id, limit + 1))
+    else:
+        cursor.execute(latest_query, params + (limit + 1,))
+    
+    page = {"count": 0, "last_id": None, "has_more": False}
+    
+    def rows():
+        for msg in iter_rows(cursor):
+            if page["count"] == limit:
+                page["has_more"] = True
+                break
+            page["count"] += 1
+            page["last_id"] = msg['id']
+            yield msg
+    
+    def trailer():
+        log.debug("found messages", extra=fields(params=params, count=page['count']))
+        if since_id is not None:
+            next_cursor = page["last_id"] if page["last_id"] is not None else since_id
+        else:
+            next_cursor = page["last_id"] if page["has_more"] else None
+        return {"next_cursor": next_cursor, "has_more": page["has_more"]}
+    
+    if wants_frames():
+        return stream_frames(rows(), trailer)
+    return stream_json_list((message_to_dict(msg) for msg in rows()), key="messages", trailer=trailer)
+
 @app.route('/messages', methods=['GET'])
 def get_messages():
+    """
+    Return one page of the user's inbox.
+    - no cursor: the newest messages, newest first
+    - before_id: messages older than before_id, newest first
+    - since_id: messages newer than since_id, oldest first (for polling)
+    next_cursor is the value to pass in the same parameter to get the next
+    page; for since_id it is always set so pollers can keep using it.
+    'Accept: application/x-echo-frames' returns the page as binary frames.
+    """
     try:
         username = request.args.get('username')
         
-        if not username:
+        if not username and not request.authorization:
             return jsonify({"error": "Username is required."}), 400
         
-        db = get_db()
-        cursor = db.cursor()
+        try:
+            since_id, before_id, limit = parse_page_args()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Get user id
-        user = cursor.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
-        if not user:
-            return jsonify({"error": "User does not exist"}), 400
+        user = authenticate(username)
+        if not isinstance(user, Identity):
+            return user
+        
+        user_id = user.user_id
+        log.debug("getting messages", extra=fields(user_id=user_id))
+        
+        return message_page(
+            get_shard_db(user_id).cursor(),
+            (MESSAGES_LATEST_QUERY, MESSAGES_BEFORE_QUERY, MESSAGES_SINCE_QUERY),
+            (user_id,), since_id, before_id, limit
+        ), 200
+            
+    except Exception as e:
+        log.exception("error retrieving messages")
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+# --- Inbox summary routes ---
+# inbox_summary is maintained by triggers (see db_setup.create_inbox_summary),
+# so these never scan the inbox itself
+CONVERSATION_QUERIES = keyset_queries("m.receiver_id = ? AND m.sender_id = ?")
+ACK_STATES = ('delivered', 'read')
+
+@app.route('/inbox', methods=['GET'])
+def get_inbox():
+    """One entry per sender: unread count and newest message id, newest first"""
+    try:
+        username = request.args.get('username')
+        
+        if not username and not request.authorization:
+            return jsonify({"error": "Username is required."}), 400
+        
+        user = authenticate(username)
+        if not isinstance(user, Identity):
+            return user
+        
+        shard_db = get_shard_db(user.user_id)
+        rows = shard_db.execute("""
+            SELECT s.sender_id, u.username as sender, s.unread_count, s.last_message_id
+            FROM inbox_summary s
+            JOIN users u ON s.sender_id = u.id
+            WHERE s.receiver_id = ?
+            ORDER BY s.last_message_id DESC
+        """, (user.user_id,)).fetchall()
         
-        user_id = user['id']
-        print(f"Getting messages for user ID: {user_id}")
+        # Expired messages count until the reaper deletes them, but /messages
+        # already hides them. The unary + keeps the lookup on the expires_at
+        # index, which only holds the few awaiting the reaper, not the inbox.
+        expired_unread = dict(shard_db.execute("""
+            SELECT m.sender_id, COUNT(*) FROM messages m
+            WHERE m.expires_at <= CAST(strftime('%s', 'now') AS INTEGER)
+                AND +m.receiver_id = ? AND m.read_at IS NULL
+            GROUP BY m.sender_id
+        """, (user.user_id,)).fetchall())
         
-        # Check message table columns
-        columns = describe_table('messages')
+        conversations = [{
+            "sender": row['sender'],
+            "unread_count": row['unread_count'] - expired_unread.get(row['sender_id'], 0),
+            "last_message_id": row['last_message_id']
+        } for row in rows]
+        
+        return jsonify({
+            "conversations": conversations,
+            "unread_count": sum(conversation['unread_count'] for conversation in conversations)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+@app.route('/conversation', methods=['GET'])
+def get_conversation():
+    """
+    Messages from one sender (`with`) to the user, paged like /messages.
+    Served from the messages(receiver_id, sender_id, id) index.
+    """
+    try:
+        username = request.args.get('username')
+        other = request.args.get('with')
+        
+        if not (username or request.authorization) or not other:
+            return jsonify({"error": "username and with are required."}), 400
         
         try:
-            # Get all columns from messages table
-            query = """
-                SELECT m.id, u.username as sender, m.encrypted_message, 
-            """
-            
-            # Add encrypted_key and iv columns if they exist
-            params = []
-            if 'encrypted_key' in columns:
-                query += "m.encrypted_key, "
-            else:
-                query += "NULL as encrypted_key, "
-                
-            if 'iv' in columns:
-                query += "m.iv "
-            else:
-                query += "NULL as iv "
-                
-            # Complete the query
-            query += """
-                FROM messages m
-                JOIN users u ON m.sender_id = u.id
-                WHERE m.receiver_id = ?
-                ORDER BY m.id DESC
-            """
-            
-            message_rows = cursor.execute(query, (user_id,)).fetchall()
-            
-            print(f"Found {len(message_rows)} messages")
+            since_id, before_id, limit = parse_page_args()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        user = authenticate(username)
+        if not isinstance(user, Identity):
+            return user
+        other_id = lookup_user_id(other)
+        if other_id is None:
+            return jsonify({"error": "User does not exist"}), 400
+        
+        return message_page(
+            get_shard_db(user.user_id).cursor(), CONVERSATION_QUERIES,
+            (user.user_id, other_id), since_id, before_id, limit
+        ), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+@app.route('/messages/ack', methods=['POST'])
+def ack_messages():
+    """
+    Mark received messages delivered or read.
+    Body: {"username", "state": "delivered"|"read" (default read), and either
+    "ids": [...] or "with": sender plus optional "up_to_id"}.
+    Reading a message also marks it delivered. Under RETENTION_DELETE_AFTER
+    the acked messages expire RETENTION_ACK_GRACE seconds later.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "Invalid JSON or missing Content-Type header"}), 400
+        
+        username = data.get('username')
+        state = data.get('state', 'read')
+        ids = data.get('ids')
+        other = data.get('with')
+        up_to_id = data.get('up_to_id')
+        
+        if not (username or request.authorization) or state not in ACK_STATES:
+            return jsonify({"error": "username and a state of 'delivered' or 'read' are required."}), 400
+        if (ids is None) == (other is None):
+            return jsonify({"error": "Pass either ids or with."}), 400
+        if ids is not None and (not isinstance(ids, list) or len(ids) > SEND_BATCH_MAX
+                                or not all(isinstance(i, int) for i in ids)):
+            return jsonify({"error": f"ids must be a list of at most {SEND_BATCH_MAX} integers."}), 400
+        if up_to_id is not None and not isinstance(up_to_id, int):
+            return jsonify({"error": "up_to_id must be an integer."}), 400
+        
+        user = authenticate(username)
+        if not isinstance(user, Identity):
+            return user
+        user_id = user.user_id
+        other_id = lookup_user_id(other) if other else None
+        if other and other_id is None:
+            return jsonify({"error": "User does not exist"}), 400
+        
+        now = int(time.time())
+        if state == 'read':
+            update = "UPDATE messages SET read_at = ?, delivered_at = COALESCE(delivered_at, ?)"
+            params = [now, now]
+        else:
+            update = "UPDATE messages SET delivered_at = ?"
+            params = [now]
+        if config.RETENTION_DELETE_AFTER in ('delivered', state):
+            # Delete-after-ack: leave the actual delete to the retention reaper
+            update += ", expires_at = MIN(COALESCE(expires_at, ?), ?)"
+            params.extend([now + config.RETENTION_ACK_GRACE] * 2)
+        # Only the receiver can ack, and acking twice keeps the first time
+        where = f" WHERE receiver_id = ? AND {state}_at IS NULL"
+        params.append(user_id)
+        if ids is not None:
+            where += f" AND id IN ({', '.join('?' * len(ids))})"
+            params.extend(ids)
+        else:
+            where += " AND sender_id = ?"
+            params.append(other_id)
+            if up_to_id is not None:
+                where += " AND id <= ?"
+                params.append(up_to_id)
+        
+        shard_db = get_shard_db(user_id)
+        updated = shard_db.execute(update + where, params).rowcount
+        shard_db.commit()
+        
+        return jsonify({"updated": updated}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+# --- Stream Messages route ---
+STREAM_TIMEOUT = 25        # default seconds to hold a long-poll / SSE connection
+STREAM_MAX_TIMEOUT = 300
+STREAM_HEARTBEAT = 15      # seconds between SSE keepalive comments
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(message):
+    """Format a message as a Server-Sent Event"""
+    return f"id: {message['id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+
+# An open /messages/stream request: the hub subscription plus anything the
+# catch-up query found. Shared with the asyncio entry point in asgi_app.py.
+InboxStream = namedtuple('InboxStream', ['user_id', 'subscriber', 'backlog', 'since_id', 'timeout', 'sse'])
+
+def parse_inbox_stream():
+    """
+    Validate a /messages/stream request and authenticate the user.
+    Returns an InboxStream with no subscriber yet, or an error response tuple.
+    """
+    username = request.args.get('username')
+    
+    if not username and not request.authorization:
+        return jsonify({"error": "Username is required."}), 400
+    
+    try:
+        since_id = parse_id_arg('since_id')
+        if since_id is None and request.headers.get('Last-Event-ID'):
+            since_id = int(request.headers['Last-Event-ID'])
+        timeout = parse_id_arg('timeout')
+    except ValueError:
+        return jsonify({"error": "since_id and timeout must be non-negative integers."}), 400
+    
+    if timeout is None:
+        timeout = STREAM_TIMEOUT
+    timeout = min(timeout, STREAM_MAX_TIMEOUT)
+    
+    user = authenticate(username)
+    if not isinstance(user, Identity):
+        return user
+    
+    sse = 'text/event-stream' in request.headers.get('Accept', '')
+    return InboxStream(user.user_id, None, [], since_id, timeout, sse)
+
+def subscribe_inbox_stream(stream, subscriber=None, db=None):
+    """
+    Subscribe to the hub and run the catch-up query on db (by default the
+    request's connection for the user's shard). Returns the InboxStream with
+    its subscriber and backlog; the caller must hub.unsubscribe() once it is
+    done with the stream.
+    """
+    # Subscribe before the catch-up query so nothing sent in between is lost
+    subscriber = hub.subscribe(stream.user_id, subscriber)
+    
+    try:
+        backlog = []
+        since_id = stream.since_id
+        if since_id is not None:
+            db = db or get_shard_db(stream.user_id)
+            rows = db.execute(MESSAGES_SINCE_QUERY, (stream.user_id, since_id, MESSAGES_PAGE_MAX)).fetchall()
+            backlog = [message_to_dict(msg) for msg in rows]
+            if backlog:
+                since_id = backlog[-1]['id']
+    except Exception:
+        hub.unsubscribe(stream.user_id, subscriber)
+        raise
+    
+    return stream._replace(subscriber=subscriber, backlog=backlog, since_id=since_id)
+
+def open_inbox_stream(subscriber=None):
+    """parse_inbox_stream() then subscribe_inbox_stream(): an InboxStream or an error response tuple"""
+    stream = parse_inbox_stream()
+    if not isinstance(stream, InboxStream):
+        return stream
+    return subscribe_inbox_stream(stream, subscriber)
+
+def long_poll_result(stream, messages_list):
+    """Build the long-poll response body from the backlog or the messages that arrived"""
+    return {
+        "messages": messages_list,
+        "next_cursor": messages_list[-1]['id'] if messages_list else stream.since_id,
+        "has_more": len(stream.backlog) >= MESSAGES_PAGE_MAX
+    }
+
+@app.route('/messages/stream', methods=['GET'])
+def stream_messages():
+    """
+    Deliver new messages as they are sent.
+    Clients sending 'Accept: text/event-stream' get an SSE stream that stays
+    open for `timeout` seconds; everyone else gets a long-poll that returns as
+    soon as at least one message is available (or empty after `timeout`).
+    since_id (or SSE's Last-Event-ID header) replays anything missed first.
+    """
+    try:
+        stream = parse_inbox_stream()
+        if not isinstance(stream, InboxStream):
+            return stream
+        
+        if stream.sse:
+            message_pool = router.pool_for(stream.user_id) if router else pool
             
-            # Build the response
-            messages_list = []
-            for msg in message_rows:
-                message_dict = {
-                    "id": msg['id'],
-                    "sender": msg['sender'],
-                    "encrypted_msg": msg['encrypted_message']
-                }
-                
-                # Add encryption data if available
-                if 'encrypted_key' in columns and msg['encrypted_key']:
-                    message_dict['encrypted_key'] = msg['encrypted_key']
+            def generate():
+                # Subscribing here rather than in the view means a client that
+                # goes away before the first chunk leaves no subscription behind
+                # (a generator that never started never runs its finally)
+                opened = None
+                try:
+                    # The request's pooled connection is gone by now, so the
+                    # catch-up query borrows one just for itself
+                    db = message_pool.acquire()
+                    try:
+                        opened = subscribe_inbox_stream(stream, db=db)
+                    finally:
+                        message_pool.release(db)
                     
-                if 'iv' in columns and msg['iv']:
-                    message_dict['iv'] = msg['iv']
-                
-                messages_list.append(message_dict)
-            
-            return jsonify(messages_list), 200
-            
-        except Exception as specific_error:
-            print(f"Error retrieving messages: {specific_error}")
-            raise specific_error
+                    last_id = opened.since_id or 0
+                    deadline = time.monotonic() + opened.timeout
+                    for message in opened.backlog:
+                        yield sse_event(message)
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        try:
+                            message = opened.subscriber.get(timeout=min(remaining, STREAM_HEARTBEAT))
+                        except queue.Empty:
+                            yield ": keepalive\n\n"
+                            continue
+                        # Skip anything the catch-up query already delivered
+                        if message['id'] > last_id:
+                            last_id = message['id']
+                            yield sse_event(message)
+                finally:
+                    if opened is not None:
+                        hub.unsubscribe(opened.user_id, opened.subscriber)
             
+            return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+        
+        stream = subscribe_inbox_stream(stream)
+        subscriber = stream.subscriber
+        
+        # Long-poll fallback
+        try:
+            messages_list = stream.backlog
+            if not messages_list:
+                try:
+                    messages_list = [subscriber.get(timeout=stream.timeout)]
+                except queue.Empty:
+                    pass
+                # Collect anything else that arrived at the same time
+                while True:
+                    try:
+                        messages_list.append(subscriber.get_nowait())
+                    except queue.Empty:
+                        break
+                if stream.since_id is not None:
+                    messages_list = [msg for msg in messages_list if msg['id'] > stream.since_id]
+        finally:
+            hub.unsubscribe(stream.user_id, subscriber)
+        
+        return jsonify(long_poll_result(stream, messages_list)), 200
+        
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
@@ -362,8 +1527,8 @@ def crypto_demo():
         if not data or not data.get('message'):
             return jsonify({"error": "Message is required"}), 400
             
-        # Generate a key pair
-        key_pair = crypto_utils.generate_rsa_key_pair()
+        # Take a pre-generated key pair (generated inline if the pool is empty)
+        key_pair = key_pool.get()
         
         # Encrypt the message
         encrypted = crypto_utils.encrypt_message(
@@ -376,7 +1541,8 @@ def crypto_demo():
             key_pair['private_key'], 
             encrypted['encrypted_message'],
             encrypted['encrypted_key'],
-            encrypted['nonce']
+            encrypted['nonce'],
+            trusted_key=True  # generated by key_pool, no need to re-validate it
         )
         
         return jsonify({
@@ -396,17 +1562,29 @@ def crypto_demo():
 @app.route('/dbinfo', methods=['GET'])
 def db_info():
     try:
-        users_columns = describe_table('users')
-        messages_columns = describe_table('messages')
-        
         return jsonify({
-            "users_table": users_columns,
-            "messages_table": messages_columns
+            "schema_version": SCHEMA.version,
+            "blob_migration": {
+                path: blob_migration.progress(path) for path in [DATABASE] + (router.paths if router else [])
+            },
+            "shards": router.paths if router else None,
+            "retention": reaper.stats(),
+            "users_table": list(SCHEMA.tables['users']),
+            "messages_table": list(SCHEMA.tables['messages'])
         }), 200
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
+# --- Metrics route ---
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 # --- Run the app ---
 if __name__ == '__main__':
+    # The bcrypt and keygen workers start from a fork server, which would
+    # re-import this script as __main__, startup threads and all. They only
+    # need library modules, so don't tell them where it is.
+    sys.modules['__main__'].__file__ = None
     # Run the app
     app.run(debug=False, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,295 @@
+"""
+asyncio (ASGI) entry point serving the same routes as app.py.
+
+    uvicorn asgi_app:app --port 5000
+
+/messages/stream runs natively on the event loop: a waiting client is an
+asyncio queue subscribed to the hub, not a blocked thread, so one process
+can hold thousands of idle SSE and long-poll connections. Its database work
+(user lookup and catch-up query) runs on the worker pool.
+
+Every other route is handed to the Flask app on a bounded thread pool of
+ASGI_WORKERS threads, so bcrypt, SQLite and crypto calls never block the
+loop. Responses are sent as the Flask app produces them, so streamed
+/messages and /users responses stay streamed.
+"""
+import asyncio
+import io
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as flask_app
+import config
+from logging_setup import fields, get_logger
+from metrics import registry
+
+log = get_logger('asgi')
+
+STREAM_PATH = '/messages/stream'
+SPOOL_MAX_BYTES = 1024 * 1024  # request bodies above this are spooled to disk
+
+
+class LoopSubscriber:
+    """
+    Hub subscriber that hands messages to an asyncio.Queue.
+    MessageHub.publish() runs on a request thread, so the put is scheduled
+    onto the loop instead of touching the queue directly.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put_nowait(self, message):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+
+class EchoASGI:
+    def __init__(self, wsgi_app, workers):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if scope['path'] == STREAM_PATH and scope['method'] == 'GET':
+                await self.stream_messages(scope, receive, send)
+            else:
+                await self.call_wsgi(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            event = await receive()
+            if event['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif event['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- WSGI bridge ---
+
+    async def call_wsgi(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            while True:
+                event = await receive()
+                if event['type'] == 'http.disconnect':
+                    return
+                body.write(event.get('body', b''))
+                if not event.get('more_body'):
+                    break
+            body.seek(0)
+
+            environ = build_environ(scope, body)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._run_wsgi, environ, send, loop)
+        finally:
+            body.close()
+
+    def _run_wsgi(self, environ, send, loop):
+        # Runs on a worker thread; each send is handed back to the loop and
+        # awaited, so a slow client applies backpressure to the response
+        def push(event):
+            asyncio.run_coroutine_threadsafe(send(event), loop).result()
+
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response_start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start.update(status=int(status.split(' ', 1)[0]), headers=[
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ])
+            return lambda data: None  # the legacy write() callable isn't used by Flask
+
+        def send_start():
+            if not response_start.get('sent'):
+                response_start['sent'] = True
+                push({'type': 'http.response.start', 'status': response_start['status'],
+                      'headers': response_start['headers']})
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    send_start()
+                    push({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_start()
+            push({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Runs Flask's teardown, which returns the pooled connection
+            if hasattr(result, 'close'):
+                result.close()
+
+    # --- /messages/stream ---
+
+    async def stream_messages(self, scope, receive, send):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        subscriber = LoopSubscriber(loop)
+        environ = build_environ(scope, None)
+        stream, response = await loop.run_in_executor(self.executor, _open_inbox_stream, environ, subscriber)
+
+        if stream is None:
+            await send({'type': 'http.response.start', 'status': response.status_code,
+                        'headers': _asgi_headers(response.headers)})
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            _record(response.status_code, started)
+            return
+
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            if stream.sse:
+                await self._send_events(stream, subscriber, disconnected, response, send)
+            else:
+                await self._long_poll(stream, subscriber, disconnected, response, send)
+        finally:
+            disconnected.cancel()
+            flask_app.hub.unsubscribe(stream.user_id, subscriber)
+        _record(200, started)
+
+    async def _send_events(self, stream, subscriber, disconnected, response, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': _asgi_headers(response.headers)})
+        for message in stream.backlog:
+            await send_body(send, flask_app.sse_event(message))
+
+        last_id = stream.since_id or 0
+        deadline = time.monotonic() + stream.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = await _next_message(subscriber, disconnected, min(remaining, flask_app.STREAM_HEARTBEAT))
+            if disconnected.done():
+                return
+            if message is None:
+                await send_body(send, ": keepalive\n\n")
+            elif message['id'] > last_id:
+                # Skip anything the catch-up query already delivered
+                last_id = message['id']
+                await send_body(send, flask_app.sse_event(message))
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _long_poll(self, stream, subscriber, disconnected, response, send):
+        messages_list = stream.backlog
+        if not messages_list:
+            message = await _next_message(subscriber, disconnected, stream.timeout)
+            if disconnected.done():
+                return
+            messages_list = [message] if message is not None else []
+            # Collect anything else that arrived at the same time
+            while not subscriber.queue.empty():
+                messages_list.append(subscriber.queue.get_nowait())
+            if stream.since_id is not None:
+                messages_list = [msg for msg in messages_list if msg['id'] > stream.since_id]
+
+        # Same serialisation as jsonify() on the sync route
+        response.set_data(flask_app.app.json.response(flask_app.long_poll_result(stream, messages_list)).get_data())
+        await send({'type': 'http.response.start', 'status': 200, 'headers': _asgi_headers(response.headers)})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+def _open_inbox_stream(environ, subscriber):
+    """
+    Worker thread: run the shared validation and catch-up query inside a
+    Flask request context so get_db() and request.args behave as usual.
+    Returns (InboxStream or None, response); for an open stream the response
+    carries only the headers, after the app's after_request hooks (CORS).
+    """
+    app = flask_app.app
+    with app.request_context(environ):
+        try:
+            result = flask_app.open_inbox_stream(subscriber)
+        except Exception as e:
+            result = flask_app.jsonify({"error": f"An error occurred: {str(e)}"}), 500
+        if not isinstance(result, flask_app.InboxStream):
+            return None, app.process_response(app.make_response(result))
+        if result.sse:
+            response = app.response_class(mimetype='text/event-stream', headers=flask_app.SSE_HEADERS)
+        else:
+            response = app.response_class(mimetype='application/json')
+        return result, app.process_response(response)
+
+
+def _asgi_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _next_message(subscriber, disconnected, timeout):
+    """Wait for the next hub message; None on timeout or disconnect"""
+    getter = asyncio.ensure_future(subscriber.queue.get())
+    done, _ = await asyncio.wait({getter, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    if getter in done:
+        return getter.result()
+    getter.cancel()
+    return None
+
+
+async def send_body(send, text):
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+
+def _record(status, started):
+    # Native routes skip Flask's after_request hook, so record them here
+    route = (('method', 'GET'), ('route', STREAM_PATH))
+    registry.observe('http_request_duration_seconds', route, time.perf_counter() - started)
+    registry.inc('http_requests_total', route + (('status', str(status)),))
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ (PEP 3333)"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body if body is not None else io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', ()):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        # Repeated headers are joined, as a WSGI server would
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+app = EchoASGI(flask_app.app, workers=config.ASGI_WORKERS)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # Keep the fork server from re-importing this script (see app.py)
+    sys.modules['__main__'].__file__ = None
+
+    log.info("starting ASGI server", extra=fields(workers=config.ASGI_WORKERS))
+    uvicorn.run(app, host='127.0.0.1', port=5000, log_level='warning')
@@ -0,0 +1,69 @@
+"""
+Signed session tokens.
+
+login() checks the password with bcrypt once and hands out a token holding
+the user's id and username, signed with SECRET_KEY. Routes that accept a
+token check its signature and age in memory, with no bcrypt and no users
+lookup. /refresh trades a token for a new one, so long-running clients
+don't have to log in again every TOKEN_TTL seconds. Tokens carry the time
+of the login they descend from, and refreshing stops TOKEN_REFRESH_WINDOW
+seconds after it, so a leaked token can't be kept alive forever.
+"""
+import time
+from collections import namedtuple
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from metrics import registry
+
+registry.describe('session_tokens_total', 'counter', 'Session tokens issued and checked, by outcome')
+
+Identity = namedtuple('Identity', ['user_id', 'username'])
+
+
+class TokenError(Exception):
+    """Raised for a malformed, tampered or expired token"""
+
+
+class SessionTokens:
+    """
+    Issues and checks tokens. A token is accepted for `ttl` seconds after
+    it was issued, and it and its refreshed successors can be refreshed
+    until `refresh_window` seconds after the login.
+    """
+
+    def __init__(self, secret_key, ttl=900, refresh_window=7 * 24 * 3600):
+        self.ttl = ttl
+        self.refresh_window = max(refresh_window, ttl)
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='echo-session')
+
+    def issue(self, user_id, username, login_time=None):
+        """New token; login_time (epoch seconds) defaults to now, i.e. a fresh login"""
+        registry.inc('session_tokens_total', (('result', 'issued'),))
+        return self._serializer.dumps([user_id, username, int(time.time()) if login_time is None else login_time])
+
+    def _load(self, token, max_age):
+        try:
+            user_id, username, login_time = self._serializer.loads(token, max_age=max_age)
+        except SignatureExpired:
+            registry.inc('session_tokens_total', (('result', 'expired'),))
+            raise TokenError("Token expired")
+        except (BadSignature, TypeError, ValueError):
+            registry.inc('session_tokens_total', (('result', 'invalid'),))
+            raise TokenError("Invalid token")
+        return Identity(user_id, username), login_time
+
+    def verify(self, token):
+        """Return the token's Identity (raises TokenError)"""
+        identity, _login_time = self._load(token, self.ttl)
+        registry.inc('session_tokens_total', (('result', 'valid'),))
+        return identity
+
+    def refresh(self, token):
+        """Return (Identity, new token) while the token's login is within refresh_window (raises TokenError)"""
+        identity, login_time = self._load(token, self.refresh_window)
+        if time.time() - login_time > self.refresh_window:
+            registry.inc('session_tokens_total', (('result', 'expired'),))
+            raise TokenError("Session expired, please log in again")
+        registry.inc('session_tokens_total', (('result', 'refreshed'),))
+        return identity, self.issue(*identity, login_time=login_time)
@@ -0,0 +1,14 @@
+"""
+Benchmarks for the Encrypted Echo backend. Run from the backend directory:
+
+    python -m benchmarks                      # micro-benchmarks + scenarios, JSON report
+    python -m benchmarks.micro                # crypto_utils and bcrypt only
+    python -m benchmarks.scenarios            # end-to-end against the Flask app
+    python -m benchmarks.login_throughput     # /login at several bcrypt costs
+    python -m benchmarks.write_behind         # /send with per-request commits vs. group commit
+    python -m benchmarks.shard_writes         # write throughput vs. number of message shards
+    python -m benchmarks.wire_format          # bytes and server CPU per 1,000 messages, JSON vs. frames
+    python -m benchmarks.asgi_capacity        # idle long-polls each entry point can hold
+
+Each benchmark runs against a scratch database in a temporary directory.
+"""
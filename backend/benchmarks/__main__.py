@@ -0,0 +1,66 @@
+"""
+Run the micro-benchmarks and end-to-end scenarios and write one JSON report.
+
+    python -m benchmarks --output bench.json
+    python -m benchmarks --quick           # small dataset, for a smoke run
+
+Reports include the git commit so results can be compared across commits.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks import micro, scenarios
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    parser.add_argument('--quick', action='store_true', help='1k users / 20k messages, fewer iterations')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-scenarios', action='store_true')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.users, args.messages, args.iterations = 1000, 20000, 5
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+        },
+    }
+    if not args.skip_micro:
+        report['micro'] = micro.run(args.iterations)
+    if not args.skip_scenarios:
+        report['scenarios'] = scenarios.run(
+            users=args.users, messages=args.messages, requests=args.iterations * 10
+        )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Concurrent-connection capacity of the sync (Flask threaded server) and async
+(asgi_app.py on uvicorn) entry points.
+
+Opens N idle long-poll connections to /messages/stream, then times ordinary
+requests while they are held. Reports, per mode and connection count, how
+many long-polls were accepted, the latency of the other requests, and the
+server's resident memory and thread count.
+
+    python -m benchmarks.asgi_capacity --connections 100 1000 2000
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+
+from benchmarks.common import free_port, http_request, process_stats, start_server, summarize
+
+PROBE_TIMEOUT = 10  # seconds before a timed request counts as failed
+
+
+async def _hold(port, path, opened, release):
+    # A raw socket per client; only the request is sent, the response is
+    # awaited until the benchmark releases the connection
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return False
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('ascii'))
+        await writer.drain()
+        opened.append(1)
+        await release.wait()
+        return True
+    finally:
+        writer.close()
+
+
+async def _measure(port, pid, connections, requests, hold_timeout):
+    loop = asyncio.get_running_loop()
+    path = f'/messages/stream?username=idle&timeout={hold_timeout}'
+    opened = []
+    release = asyncio.Event()
+    holders = [asyncio.ensure_future(_hold(port, path, opened, release)) for _ in range(connections)]
+
+    # Let the server pick up every connection before timing anything
+    deadline = time.monotonic() + 30
+    while len(opened) + sum(1 for h in holders if h.done()) < connections and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(1)
+
+    def probe():
+        start = time.perf_counter()
+        status, _, _ = http_request(port, 'GET', '/user_public_key?username=idle', timeout=PROBE_TIMEOUT)
+        return status == 200, time.perf_counter() - start
+
+    latencies, failed = [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        try:
+            ok, latency = await loop.run_in_executor(None, probe)
+        except OSError:
+            ok, latency = False, 0
+        if ok:
+            latencies.append(latency)
+        else:
+            failed += 1
+    elapsed = time.perf_counter() - started
+    loaded = process_stats(pid)
+
+    release.set()
+    await asyncio.gather(*holders, return_exceptions=True)
+    return len(opened), latencies, failed, elapsed, loaded
+
+
+def capacity(mode, connections, requests, hold_timeout=120):
+    port = free_port()
+    server = start_server(mode, port, bcrypt_rounds=4, key_pool_size=0)
+    try:
+        http_request(port, 'POST', '/register', {'username': 'idle', 'password': 'pw', 'public_key': 'PK'})
+        idle_stats = process_stats(server.pid)
+        held, latencies, failed, elapsed, loaded = asyncio.run(
+            _measure(port, server.pid, connections, requests, hold_timeout)
+        )
+        return summarize(f'capacity_{mode}', latencies, elapsed, failed, connections=connections,
+                         held=held, idle=idle_stats, loaded=loaded)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(connection_counts=(100, 1000), requests=50):
+    # Every held connection is a file descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(connection_counts) * 2 + 256)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    results = []
+    for connections in connection_counts:
+        for mode in ('wsgi', 'asgi'):
+            results.append(capacity(mode, connections, requests))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.connections, args.requests), indent=2))
+
+
+if __name__ == '__main__':
+    main()
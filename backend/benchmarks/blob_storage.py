@@ -0,0 +1,97 @@
+"""
+Database size and /messages latency before and after the BLOB migration.
+
+Seeds a scratch database with legacy base64 TEXT messages, measures it,
+runs blob_migration plus VACUUM, and measures again.
+
+    python -m benchmarks.blob_storage --messages 20000 --payload 512
+"""
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+
+def seed_legacy_rows(db_path, messages, payload):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (username, password_hash) VALUES (?, 'x')",
+            [('bench_sender',), ('bench_receiver',)]
+        )
+        sender_id, receiver_id = 1, 2
+        conn.executemany(
+            "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv) VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    sender_id, receiver_id,
+                    base64.b64encode(os.urandom(payload)).decode(),
+                    base64.b64encode(os.urandom(256)).decode(),
+                    base64.b64encode(os.urandom(12)).decode(),
+                )
+                for _ in range(messages)
+            )
+        )
+    conn.close()
+
+
+def measure(client, db_path, requests):
+    import blob_migration
+
+    used, file_size = blob_migration.database_size(db_path)
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get('/messages?username=bench_receiver&limit=200')
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return {
+        'data_bytes': used,
+        'file_bytes': file_size,
+        'messages_p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'messages_mean_ms': round(statistics.mean(latencies) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--payload', type=int, default=512, help='ciphertext bytes per message')
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='echo-bench-')
+    db_path = os.path.join(tmpdir, 'bench.db')
+    os.environ['ECHO_DATABASE'] = db_path
+    os.environ['ECHO_BLOB_MIGRATION_AUTOSTART'] = '0'
+    import app as echo_app
+    import blob_migration
+
+    seed_legacy_rows(db_path, args.messages, args.payload)
+    client = echo_app.app.test_client()
+
+    before = measure(client, db_path, args.requests)
+    started = time.perf_counter()
+    converted = blob_migration.run(db_path, batch_size=500)
+    migration_seconds = time.perf_counter() - started
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("VACUUM")
+    conn.close()
+    after = measure(client, db_path, args.requests)
+
+    print(json.dumps({
+        'messages': args.messages,
+        'payload_bytes': args.payload,
+        'converted': converted,
+        'migration_seconds': round(migration_seconds, 3),
+        'before': before,
+        'after': after,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
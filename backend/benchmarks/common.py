@@ -0,0 +1,151 @@
+"""Shared helpers for the benchmark scripts."""
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, latencies, elapsed, failed=0, **params):
+    """Build one JSON-ready result: throughput plus p50/p95/p99 in milliseconds"""
+    result = {
+        'name': name,
+        'params': params,
+        'ops': len(latencies),
+        'failed': failed,
+        'seconds': round(elapsed, 4),
+        'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+    if latencies:
+        result.update(
+            p50_ms=round(statistics.median(latencies) * 1000, 3),
+            p95_ms=round(percentile(latencies, 95) * 1000, 3),
+            p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        )
+    return result
+
+
+def time_calls(fn, iterations):
+    """Call fn(i) serially; return (latencies, elapsed)"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - started
+
+
+def time_concurrent(fn, iterations, concurrency):
+    """
+    Call fn(i) from `concurrency` threads. fn returns True on success.
+    Returns (latencies of successful calls, failures, elapsed).
+    """
+    def timed(i):
+        start = time.perf_counter()
+        ok = fn(i)
+        return ok, time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for ok, latency in outcomes if ok]
+    return latencies, len(outcomes) - len(latencies), elapsed
+
+
+def load_app(**settings):
+    """
+    Import the Flask app against a scratch database. Settings are passed as
+    ECHO_* environment variables, which config.py reads at import time, so
+    this only takes effect for the first import in a process.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='echo-bench-')
+    os.environ['ECHO_DATABASE'] = os.path.join(tmpdir, 'bench.db')
+    os.environ['ECHO_BLOB_MIGRATION_AUTOSTART'] = '0'
+    for name, value in settings.items():
+        os.environ[f'ECHO_{name.upper()}'] = str(value)
+    import app as echo_app
+    return echo_app
+
+
+# Commands serving the app over real sockets, for benchmarks that need them
+SERVER_COMMANDS = {
+    # Flask's threaded server: one thread per open connection
+    'wsgi': lambda port: [sys.executable, '-c',
+                          "import logging, app; logging.getLogger('werkzeug').setLevel(logging.WARNING); "
+                          f"app.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    # asgi_app.py on uvicorn: one event loop plus ASGI_WORKERS threads
+    'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi_app:app',
+                          '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, startup_timeout=30, **settings):
+    """Serve the app in a subprocess against a scratch database; returns the Popen"""
+    env = dict(os.environ)
+    env['ECHO_DATABASE'] = os.path.join(tempfile.mkdtemp(prefix='echo-bench-'), 'bench.db')
+    env['ECHO_BLOB_MIGRATION_AUTOSTART'] = '0'
+    env['ECHO_LOG_LEVEL'] = 'WARNING'
+    for name, value in settings.items():
+        env[f'ECHO_{name.upper()}'] = str(value)
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(SERVER_COMMANDS[mode](port), cwd=backend, env=env,
+                               stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{mode} server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{mode} server didn't start within {startup_timeout}s")
+
+
+def http_request(port, method, path, body=None, headers=None, timeout=30):
+    """Make one request; returns (status, headers dict, body bytes)"""
+    headers = dict(headers or {})
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+        headers.setdefault('Content-Type', 'application/json')
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, {k.lower(): v for k, v in response.getheaders()}, response.read()
+    finally:
+        connection.close()
+
+
+def process_stats(pid):
+    """Resident memory (MiB) and thread count of a process, from /proc"""
+    stats = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name == 'VmRSS':
+                stats['rss_mb'] = round(int(value.split()[0]) / 1024, 1)
+            elif name == 'Threads':
+                stats['threads'] = int(value)
+    return stats
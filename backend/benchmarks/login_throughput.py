@@ -0,0 +1,61 @@
+"""
+Login throughput at different bcrypt work factors.
+
+Registers one user per cost in a scratch database, then fires concurrent
+/login requests through the Flask test client and reports logins/second
+and latency percentiles.
+
+    python -m benchmarks.login_throughput --costs 4 8 10 12 --requests 64 --concurrency 8
+"""
+import argparse
+import json
+import os
+
+from benchmarks.common import load_app, summarize, time_concurrent
+
+
+def run(costs, requests, concurrency, workers):
+    echo_app = load_app()
+    from passwords import PasswordHasher
+
+    client_app = echo_app.app
+    results = []
+
+    for cost in costs:
+        echo_app.hasher.shutdown()
+        echo_app.hasher = PasswordHasher(rounds=cost, workers=workers, max_pending=requests)
+
+        username = f"bench_{cost}"
+        client_app.test_client().post('/register', json={
+            'username': username, 'password': 'bench-password', 'public_key': None
+        })
+
+        def login(_):
+            response = client_app.test_client().post('/login', json={
+                'username': username, 'password': 'bench-password'
+            })
+            return response.status_code == 200
+
+        latencies, failed, elapsed = time_concurrent(login, requests, concurrency)
+        # Failures are 503s once the hashing queue is full
+        results.append(summarize('login', latencies, elapsed, failed,
+                                 cost=cost, concurrency=concurrency, workers=workers))
+
+    echo_app.hasher.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--costs', type=int, nargs='+', default=[4, 8, 10, 12])
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='hash worker processes (0 = inline on the request thread)')
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.costs, args.requests, args.concurrency, args.workers), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Micro-benchmarks for crypto_utils and bcrypt.
+
+    python -m benchmarks.micro --iterations 20
+"""
+import argparse
+import json
+import os
+
+import bcrypt
+
+import crypto_utils
+from benchmarks.common import summarize, time_calls
+
+PAYLOAD_SIZES = [64, 1024, 16 * 1024, 256 * 1024, 1024 * 1024]
+BCRYPT_COSTS = [4, 8, 10, 12]
+
+
+def bench_keygen(iterations):
+    latencies, elapsed = time_calls(lambda _: crypto_utils.generate_rsa_key_pair(), iterations)
+    return summarize('generate_rsa_key_pair', latencies, elapsed, key_size=2048)
+
+
+def bench_encrypt_decrypt(iterations, sizes):
+    key_pair = crypto_utils.generate_rsa_key_pair()
+    results = []
+    for size in sizes:
+        message = os.urandom(size // 2).hex()  # encrypt_message takes text
+        encrypted = [None] * iterations
+
+        def encrypt(i):
+            encrypted[i] = crypto_utils.encrypt_message(key_pair['public_key'], message)
+
+        def decrypt(i):
+            item = encrypted[i]
+            crypto_utils.decrypt_message(
+                key_pair['private_key'], item['encrypted_message'], item['encrypted_key'], item['nonce']
+            )
+
+        latencies, elapsed = time_calls(encrypt, iterations)
+        results.append(summarize('encrypt_message', latencies, elapsed, payload_bytes=size))
+        latencies, elapsed = time_calls(decrypt, iterations)
+        results.append(summarize('decrypt_message', latencies, elapsed, payload_bytes=size))
+    return results
+
+
+def bench_bcrypt(iterations, costs):
+    results = []
+    for cost in costs:
+        hashed = bcrypt.hashpw(b'bench-password', bcrypt.gensalt(cost))
+        latencies, elapsed = time_calls(lambda _: bcrypt.hashpw(b'bench-password', bcrypt.gensalt(cost)), iterations)
+        results.append(summarize('bcrypt_hashpw', latencies, elapsed, cost=cost))
+        latencies, elapsed = time_calls(lambda _: bcrypt.checkpw(b'bench-password', hashed), iterations)
+        results.append(summarize('bcrypt_checkpw', latencies, elapsed, cost=cost))
+    return results
+
+
+def run(iterations=20, sizes=PAYLOAD_SIZES, costs=BCRYPT_COSTS):
+    results = [bench_keygen(iterations)]
+    results += bench_encrypt_decrypt(iterations, sizes)
+    # bcrypt at cost 12+ takes ~0.25 s per call; keep those runs short
+    results += bench_bcrypt(max(1, iterations // 4), costs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--sizes', type=int, nargs='+', default=PAYLOAD_SIZES)
+    parser.add_argument('--costs', type=int, nargs='+', default=BCRYPT_COSTS)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.iterations, args.sizes, args.costs), indent=2))
+
+
+if __name__ == '__main__':
+    main()
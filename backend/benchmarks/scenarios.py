@@ -0,0 +1,138 @@
+"""
+End-to-end scenarios against the Flask app through its test client.
+
+Seeds a scratch database, then runs a register storm, a login storm, send
+fan-out (one /send per recipient vs. one /send_batch), inbox reads and
+recipient typeahead searches against /users.
+
+    python -m benchmarks.scenarios --users 10000 --messages 1000000
+"""
+import argparse
+import base64
+import json
+import os
+import random
+
+from benchmarks import seed as seeding
+from benchmarks.common import load_app, summarize, time_concurrent
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def register_storm(client, requests, concurrency):
+    def register(i):
+        response = client.post('/register', json={
+            'username': f"storm{i:07d}", 'password': seeding.SEED_PASSWORD, 'public_key': 'PK'
+        })
+        return response.status_code == 201
+
+    latencies, failed, elapsed = time_concurrent(register, requests, concurrency)
+    return summarize('register_storm', latencies, elapsed, failed, concurrency=concurrency)
+
+
+def login_storm(client, users, requests, concurrency):
+    def login(i):
+        response = client.post('/login', json={
+            'username': seeding.username(i % users), 'password': seeding.SEED_PASSWORD
+        })
+        return response.status_code == 200
+
+    latencies, failed, elapsed = time_concurrent(login, requests, concurrency)
+    return summarize('login_storm', latencies, elapsed, failed, concurrency=concurrency)
+
+
+def send_fanout(client, users, recipients, payload):
+    body = _b64(os.urandom(payload))
+    key = _b64(os.urandom(256))
+    iv = _b64(os.urandom(12))
+    targets = [seeding.username(i % users) for i in range(1, recipients + 1)]
+    sender = seeding.username(0)
+
+    def send_one(i):
+        response = client.post('/send', json={
+            'sender': sender, 'receiver': targets[i], 'encrypted_msg': body, 'encrypted_key': key, 'iv': iv
+        })
+        return response.status_code == 201
+
+    latencies, failed, elapsed = time_concurrent(send_one, recipients, 1)
+    single = summarize('send_fanout_single', latencies, elapsed, failed, recipients=recipients)
+
+    def send_batch(_):
+        response = client.post('/send_batch', json={
+            'sender': sender,
+            'messages': [
+                {'receiver': target, 'encrypted_msg': body, 'encrypted_key': key, 'iv': iv}
+                for target in targets
+            ]
+        })
+        return response.status_code == 200 and response.get_json()['failed'] == 0
+
+    latencies, failed, elapsed = time_concurrent(send_batch, 1, 1)
+    batch = summarize('send_fanout_batch', latencies, elapsed, failed, recipients=recipients)
+    batch['messages_per_sec'] = round(recipients / elapsed, 2) if elapsed else None
+    single['messages_per_sec'] = single['ops_per_sec']
+    return [single, batch]
+
+
+def inbox_reads(client, users, requests, concurrency, limit):
+    rng = random.Random(42)
+    readers = [seeding.username(rng.randrange(users)) for _ in range(requests)]
+
+    def read(i):
+        response = client.get(f'/messages?username={readers[i]}&limit={limit}')
+        response.get_data()  # drain the streamed body
+        return response.status_code == 200
+
+    latencies, failed, elapsed = time_concurrent(read, requests, concurrency)
+    return summarize('inbox_reads', latencies, elapsed, failed, concurrency=concurrency, limit=limit)
+
+
+def user_search(client, users, requests, concurrency):
+    rng = random.Random(7)
+    # What a recipient picker sends as someone types: a few characters of a name
+    prefixes = [seeding.username(rng.randrange(users))[:rng.randint(5, 9)] for _ in range(requests)]
+
+    def search(i):
+        response = client.get(f'/users?q={prefixes[i]}&limit=10')
+        response.get_data()
+        return response.status_code == 200
+
+    latencies, failed, elapsed = time_concurrent(search, requests, concurrency)
+    return summarize('user_search', latencies, elapsed, failed, concurrency=concurrency, users=users)
+
+
+def run(users=10000, messages=1000000, requests=200, concurrency=8, recipients=200,
+        payload=256, bcrypt_cost=4):
+    echo_app = load_app(bcrypt_rounds=bcrypt_cost)
+    seed_stats = seeding.seed(echo_app.DATABASE, users, messages, payload=payload, bcrypt_cost=bcrypt_cost)
+    client = echo_app.app.test_client()
+
+    results = [
+        register_storm(client, requests, concurrency),
+        login_storm(client, users, requests, concurrency),
+    ]
+    results += send_fanout(client, users, min(recipients, users - 1), payload)
+    results.append(inbox_reads(client, users, requests, concurrency, limit=50))
+    results.append(user_search(client, users, requests, concurrency))
+    echo_app.hasher.shutdown()
+    return {'seed': seed_stats, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--recipients', type=int, default=200)
+    parser.add_argument('--bcrypt-cost', type=int, default=4)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.users, args.messages, args.requests, args.concurrency,
+                         args.recipients, bcrypt_cost=args.bcrypt_cost), indent=2))
+
+
+if __name__ == '__main__':
+    main()
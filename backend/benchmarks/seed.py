@@ -0,0 +1,64 @@
+"""Fast synthetic data for the end-to-end scenarios."""
+import os
+import random
+import sqlite3
+import time
+
+import bcrypt
+
+import crypto_utils
+
+SEED_PASSWORD = 'bench-password'
+SEED_BATCH = 10000
+
+
+def username(i):
+    return f"user{i:07d}"
+
+
+def seed(db_path, users, messages, payload=256, bcrypt_cost=4, rng_seed=1234):
+    """
+    Insert `users` users and `messages` messages between random pairs.
+    Every user shares one password hash and one RSA public key, so seeding
+    is bound by SQLite rather than by key generation. Returns timings.
+    """
+    rng = random.Random(rng_seed)
+    password_hash = bcrypt.hashpw(SEED_PASSWORD.encode('utf-8'), bcrypt.gensalt(bcrypt_cost))
+    public_key = crypto_utils.generate_rsa_key_pair()['public_key']
+    body = os.urandom(payload)
+    wrapped_key = os.urandom(256)
+    nonce = os.urandom(12)
+
+    conn = sqlite3.connect(db_path)
+    started = time.perf_counter()
+    with conn:
+        first_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]) + 1
+        conn.executemany(
+            "INSERT INTO users (username, password_hash, public_key) VALUES (?, ?, ?)",
+            ((username(i), password_hash, public_key) for i in range(users))
+        )
+    users_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    remaining = messages
+    while remaining > 0:
+        batch = min(SEED_BATCH, remaining)
+        rows = [
+            (first_id + rng.randrange(users), first_id + rng.randrange(users), body, wrapped_key, nonce)
+            for _ in range(batch)
+        ]
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        remaining -= batch
+    messages_seconds = time.perf_counter() - started
+    conn.close()
+
+    return {
+        'users': users,
+        'messages': messages,
+        'users_seconds': round(users_seconds, 3),
+        'messages_seconds': round(messages_seconds, 3),
+    }
@@ -0,0 +1,96 @@
+"""
+Message write throughput as the number of shards grows.
+
+Starts several writer processes, each inserting messages for random
+receivers through shards.ShardRouter, one transaction per message like
+/send. With one shard every writer queues on the same write lock; with N
+shards, writers to different shards commit in parallel. Scaling needs one
+core per writer process, so run it on a multi-core machine.
+
+    python -m benchmarks.shard_writes --shards 1 2 4 8 --writers 8 --messages 2000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import db_setup
+from benchmarks.common import summarize
+from shards import ShardRouter
+
+INSERT = ("INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv) "
+          "VALUES (?, ?, ?, ?, ?)")
+
+
+def _pool_options(synchronous):
+    return dict(size=1, timeout=60, pragmas={
+        'journal_mode': 'WAL', 'synchronous': synchronous, 'busy_timeout': 60000,
+    })
+
+
+def _writer(args):
+    directory, shard_dir, count, users, messages, synchronous, seed = args
+    router = ShardRouter(directory, shard_dir, count, **_pool_options(synchronous))
+    rng = random.Random(seed)
+    body, key, iv = os.urandom(256), os.urandom(256), os.urandom(12)
+    latencies = []
+    try:
+        for _ in range(messages):
+            receiver_id = rng.randint(1, users)
+            pool = router.pool_for(receiver_id)
+            start = time.perf_counter()
+            conn = pool.acquire()
+            try:
+                conn.execute(INSERT, (1, receiver_id, body, key, iv))
+                conn.commit()
+            finally:
+                pool.release(conn)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        router.close()
+    return latencies
+
+
+def run(shard_counts, writers, messages, users, synchronous):
+    results = []
+    for count in shard_counts:
+        tmpdir = tempfile.mkdtemp(prefix='echo-shards-')
+        directory = os.path.join(tmpdir, 'directory.db')
+        shard_dir = os.path.join(tmpdir, 'shards')
+        db_setup.setup_database(directory)
+        with sqlite3.connect(directory) as conn:
+            conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, 'x')",
+                             [(f"shard_user{i}",) for i in range(users)])
+        # Create the shard files up front so the writers only open them
+        ShardRouter(directory, shard_dir, count).close()
+
+        jobs = [(directory, shard_dir, count, users, messages, synchronous, seed) for seed in range(writers)]
+        started = time.perf_counter()
+        with multiprocessing.Pool(writers) as pool:
+            per_writer = pool.map(_writer, jobs)
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for writer_latencies in per_writer for latency in writer_latencies]
+        results.append(summarize('shard_writes', latencies, elapsed, shards=count, writers=writers,
+                                 synchronous=synchronous, cpus=os.cpu_count()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--writers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--messages', type=int, default=2000, help='messages per writer')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--synchronous', default='FULL', help='SQLite synchronous pragma for the run')
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.shards, args.writers, args.messages, args.users, args.synchronous), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Peak Python memory while serving one large inbox through /messages.
+
+Seeds inboxes of increasing size and reads each one in a single streamed
+response, tracking peak allocations with tracemalloc. With streaming the
+peak should stay roughly flat as the inbox grows.
+
+    python -m benchmarks.streaming_memory --sizes 10000 100000 1000000 --format json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+
+def seed_inbox(db_path, receiver, count, payload):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO users (username, password_hash) VALUES ('bench_sender', 'x')")
+        conn.execute("INSERT INTO users (username, password_hash) VALUES (?, 'x')", (receiver,))
+        sender_id = conn.execute("SELECT id FROM users WHERE username = 'bench_sender'").fetchone()[0]
+        receiver_id = conn.execute("SELECT id FROM users WHERE username = ?", (receiver,)).fetchone()[0]
+        body = os.urandom(payload)
+        conn.executemany(
+            "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv) VALUES (?, ?, ?, ?, ?)",
+            ((sender_id, receiver_id, body, body[:32], body[:12]) for _ in range(count))
+        )
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--payload', type=int, default=256, help='ciphertext bytes per message')
+    parser.add_argument('--format', choices=['json', 'ndjson'], default='json')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='echo-bench-')
+    db_path = os.path.join(tmpdir, 'bench.db')
+    os.environ['ECHO_DATABASE'] = db_path
+    os.environ['ECHO_BLOB_MIGRATION_AUTOSTART'] = '0'
+    import app as echo_app
+
+    # Serve the whole inbox in one response
+    echo_app.MESSAGES_PAGE_MAX = max(args.sizes)
+    client = echo_app.app.test_client()
+
+    results = []
+    for size in args.sizes:
+        receiver = f"bench_receiver_{size}"
+        seed_inbox(db_path, receiver, size, args.payload)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = client.get(
+            f'/messages?username={receiver}&limit={size}&format={args.format}',
+            buffered=False
+        )
+        first_byte = None
+        total_bytes = 0
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            total_bytes += len(chunk)
+        response.close()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append({
+            'messages': size,
+            'response_bytes': total_bytes,
+            'peak_python_mb': round(peak / 1024 / 1024, 2),
+            'first_byte_ms': round(first_byte * 1000, 2),
+            'total_seconds': round(elapsed, 2),
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
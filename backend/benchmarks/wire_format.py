@@ -0,0 +1,116 @@
+"""
+Bytes on the wire and server CPU per 1,000 messages, JSON vs. binary frames.
+
+Sends --messages messages through /send in each format, then pages through
+the receiver's inbox with /messages. Request bodies are built before the
+clock starts, so the CPU figures cover the Flask side (routing, parsing,
+base64 or framing, SQLite) plus the test client. Also reports what the
+client spends decoding a fetched page in each format.
+
+    python -m benchmarks.wire_format --messages 5000 --payload 256
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+from benchmarks.common import load_app
+
+PAGE = 200
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _per_thousand(value, messages):
+    return round(value * 1000 / messages, 3)
+
+
+def run(messages, payload):
+    echo_app = load_app(db_synchronous='OFF', key_pool_size=0, retention_interval=0)
+    import wire
+
+    client = echo_app.app.test_client()
+    body, key, iv = os.urandom(payload), os.urandom(256), os.urandom(12)
+    formats = {
+        'json': dict(
+            send=lambda sender, receiver: dict(json={
+                'sender': sender, 'receiver': receiver,
+                'encrypted_msg': _b64(body), 'encrypted_key': _b64(key), 'iv': _b64(iv)
+            }),
+            accept='application/json',
+            decode=lambda data: [
+                (base64.b64decode(m['encrypted_msg']), base64.b64decode(m['encrypted_key']),
+                 base64.b64decode(m['iv']))
+                for m in json.loads(data)['messages']
+            ],
+        ),
+        'frames': dict(
+            send=lambda sender, receiver: dict(data=wire.encode_send(sender, receiver, body, key, iv),
+                                               content_type=wire.MIMETYPE),
+            accept=wire.MIMETYPE,
+            decode=lambda data: wire.decode_messages(data)[0],
+        ),
+    }
+
+    results = []
+    for name, fmt in formats.items():
+        sender, receiver = f"wire_{name}_sender", f"wire_{name}_receiver"
+        for username in (sender, receiver):
+            client.post('/register', json={'username': username, 'password': 'bench-password', 'public_key': 'PK'})
+
+        requests = [fmt['send'](sender, receiver) for _ in range(messages)]
+        sent_bytes = sum(len(request.get('data') or json.dumps(request['json'])) for request in requests)
+        cpu = time.process_time()
+        failed = sum(client.post('/send', **request).status_code != 201 for request in requests)
+        send_cpu = time.process_time() - cpu
+
+        pages = []
+        cpu = time.process_time()
+        cursor_cpu = 0.0  # reading next_cursor is client work; leave it out
+        cursor = None
+        while True:
+            url = f"/messages?username={receiver}&limit={PAGE}"
+            if cursor is not None:
+                url += f"&before_id={cursor}"
+            data = client.get(url, headers={'Accept': fmt['accept']}).get_data()
+            pages.append(data)
+            started = time.process_time()
+            cursor = json.loads(data)['next_cursor'] if name == 'json' else wire.decode_messages(data)[1]
+            cursor_cpu += time.process_time() - started
+            if cursor is None:
+                break
+        fetch_cpu = time.process_time() - cpu - cursor_cpu
+
+        started = time.perf_counter()
+        fetched = sum(len(fmt['decode'](data)) for data in pages)
+        decode_seconds = time.perf_counter() - started
+
+        results.append({
+            'format': name,
+            'messages': messages,
+            'payload': payload,
+            'failed': failed,
+            'fetched': fetched,
+            'send_bytes_per_1k': _per_thousand(sent_bytes, messages),
+            'fetch_bytes_per_1k': _per_thousand(sum(len(data) for data in pages), messages),
+            'send_cpu_ms_per_1k': _per_thousand(send_cpu * 1000, messages),
+            'fetch_cpu_ms_per_1k': _per_thousand(fetch_cpu * 1000, messages),
+            'client_decode_ms_per_1k': _per_thousand(decode_seconds * 1000, messages),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--payload', type=int, default=256, help='ciphertext bytes per message')
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.messages, args.payload), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+/send throughput with per-request commits vs. the group-commit writer.
+
+Fires /send requests from an increasing number of concurrent senders through
+the Flask test client and reports messages/second for each mode. Runs with
+synchronous=FULL by default so every commit waits for the disk, which is the
+cost group commit amortises.
+
+    python -m benchmarks.write_behind --senders 1 4 16 64 --requests 2000
+"""
+import argparse
+import base64
+import json
+import os
+
+from benchmarks.common import load_app, summarize, time_concurrent
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def run(senders, requests, max_batch, latency_ms, synchronous):
+    echo_app = load_app(db_synchronous=synchronous, key_pool_size=0)
+    from write_queue import GroupCommitWriter
+
+    client_app = echo_app.app
+    users = max(senders)
+    for i in range(users + 1):
+        client_app.test_client().post('/register', json={
+            'username': f"writer{i:04d}", 'password': 'bench-password', 'public_key': 'PK'
+        })
+    payload = {'encrypted_msg': _b64(os.urandom(256)), 'encrypted_key': _b64(os.urandom(256)),
+               'iv': _b64(os.urandom(12))}
+
+    def send(i):
+        response = client_app.test_client().post('/send', json={
+            'sender': f"writer{i % users + 1:04d}", 'receiver': 'writer0000', **payload
+        })
+        return response.status_code == 201
+
+    results = []
+    for mode in ('per_request', 'group_commit'):
+        for concurrency in senders:
+            if mode == 'group_commit':
+                echo_app.writers = [GroupCommitWriter(echo_app.pool, max_batch=max_batch,
+                                                      max_latency=latency_ms / 1000)]
+            try:
+                latencies, failed, elapsed = time_concurrent(send, requests, concurrency)
+            finally:
+                for writer in echo_app.writers or ():
+                    writer.shutdown()
+                echo_app.writers = None
+            results.append(summarize('send', latencies, elapsed, failed, mode=mode, senders=concurrency,
+                                     synchronous=synchronous, max_batch=max_batch, latency_ms=latency_ms))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--senders', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--latency-ms', type=float, default=2.0)
+    parser.add_argument('--synchronous', default='FULL', help='SQLite synchronous pragma for the run')
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.senders, args.requests, args.max_batch, args.latency_ms, args.synchronous),
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Rewrite base64 TEXT ciphertext, wrapped keys and nonces as raw BLOBs.
+
+Runs in small batches, each in its own short transaction, so /send is never
+locked out for long. Progress is checkpointed in each file's
+migration_progress, so an interrupted run picks up where it stopped. With
+sharding on, the shard files are migrated too: rebalancing copies rows as
+they are, TEXT included. The app starts it in a background thread; it can
+also be run by hand:
+
+    python blob_migration.py --db encrypted_echo.db --vacuum
+    python blob_migration.py --db encrypted_echo.db --shards 4 --shard-dir shards
+"""
+import argparse
+import base64
+import binascii
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from logging_setup import fields, get_logger
+
+log = get_logger('blob_migration')
+
+# Binary columns per table
+BLOB_COLUMNS = {
+    'messages': ('encrypted_message', 'encrypted_key', 'iv'),
+    'message_bodies': ('encrypted_message', 'iv'),
+}
+
+
+def _decode(value):
+    if isinstance(value, str):
+        try:
+            return base64.b64decode(value, validate=True)
+        except binascii.Error:
+            return value  # Not base64; leave it alone
+    return value
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=config.DB_BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {config.DB_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def _progress_name(table):
+    return f"blob:{table}"
+
+
+def migrate_batch(conn, table, after_id, batch_size):
+    """
+    Convert one batch of rows with id > after_id.
+    Returns (last_id, rows_converted), or (None, 0) once the table is done.
+    """
+    columns = BLOB_COLUMNS[table]
+    rows = conn.execute(
+        f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, batch_size)
+    ).fetchall()
+    if not rows:
+        return None, 0
+
+    updates = []
+    for row in rows:
+        values = tuple(_decode(value) for value in row[1:])
+        if values != tuple(row[1:]):
+            updates.append(values + (row[0],))
+
+    last_id = rows[-1][0]
+    with conn:
+        conn.executemany(
+            f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+            updates
+        )
+        conn.execute(
+            "INSERT INTO migration_progress (name, last_id) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id",
+            (_progress_name(table), last_id)
+        )
+    return last_id, len(updates)
+
+
+def progress(db_path):
+    """Return {table: {"last_id", "done"}} for every table being migrated"""
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute("SELECT name, last_id, done FROM migration_progress").fetchall()
+    finally:
+        conn.close()
+    by_name = {name: (last_id, done) for name, last_id, done in rows}
+    result = {}
+    for table in BLOB_COLUMNS:
+        last_id, done = by_name.get(_progress_name(table), (0, 0))
+        result[table] = {"last_id": last_id, "done": bool(done)}
+    return result
+
+
+def run(db_path, batch_size=500, pause=0.0, stop_event=None):
+    """Migrate every table, resuming from the last checkpoint. Returns rows converted per table."""
+    converted = {}
+    conn = _connect(db_path)
+    try:
+        for table in BLOB_COLUMNS:
+            row = conn.execute(
+                "SELECT last_id, done FROM migration_progress WHERE name = ?", (_progress_name(table),)
+            ).fetchone()
+            last_id, done = row if row else (0, 0)
+            converted[table] = 0
+            if done:
+                continue
+
+            while stop_event is None or not stop_event.is_set():
+                next_id, count = migrate_batch(conn, table, last_id, batch_size)
+                if next_id is None:
+                    with conn:
+                        conn.execute(
+                            "INSERT INTO migration_progress (name, last_id, done) VALUES (?, ?, 1) "
+                            "ON CONFLICT(name) DO UPDATE SET done = 1",
+                            (_progress_name(table), last_id)
+                        )
+                    break
+                last_id = next_id
+                converted[table] += count
+                if pause:
+                    time.sleep(pause)
+    finally:
+        conn.close()
+    return converted
+
+
+def start_background(db_paths, batch_size=500, pause=0.05):
+    """
+    Migrate each database (the main one and any shard files), one after
+    another, in a daemon thread. Returns None if they are all done already.
+    """
+    pending = [path for path in db_paths if not all(state["done"] for state in progress(path).values())]
+    if not pending:
+        return None
+
+    def target():
+        for db_path in pending:
+            try:
+                converted = run(db_path, batch_size=batch_size, pause=pause)
+                log.info("BLOB migration finished", extra=fields(database=db_path, converted=converted))
+            except Exception:
+                log.exception("BLOB migration stopped", extra=fields(database=db_path))
+
+    thread = threading.Thread(target=target, name='blob-migration', daemon=True)
+    thread.start()
+    return thread
+
+
+def database_size(db_path):
+    """Return (bytes used by pages in use, total file bytes)"""
+    conn = _connect(db_path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return (page_count - free_pages) * page_size, os.path.getsize(db_path)
+
+
+if __name__ == '__main__':
+    import db_setup
+    import shards
+
+    parser = argparse.ArgumentParser(description="Convert base64 TEXT message fields to BLOBs")
+    parser.add_argument('--db', default=config.DATABASE)
+    parser.add_argument('--shards', type=int, default=config.SHARD_COUNT, help='also migrate this many shard files')
+    parser.add_argument('--shard-dir', default=config.SHARD_DIR)
+    parser.add_argument('--batch-size', type=int, default=config.BLOB_MIGRATION_BATCH)
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between batches')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to shrink the file')
+    args = parser.parse_args()
+
+    db_setup.migrate(args.db)
+    paths = [args.db]
+    if args.shards > 1:
+        paths += [shards.shard_path(args.shard_dir, index) for index in range(args.shards)]
+        for index, path in enumerate(paths[1:]):
+            shards.setup_shard(path, index)
+
+    for path in paths:
+        used_before, file_before = database_size(path)
+        started = time.perf_counter()
+        converted = run(path, batch_size=args.batch_size, pause=args.pause)
+        elapsed = time.perf_counter() - started
+        if args.vacuum:
+            conn = sqlite3.connect(path, isolation_level=None)
+            conn.execute("VACUUM")
+            conn.close()
+        used_after, file_after = database_size(path)
+
+        print(f"{path}: converted rows: {converted} in {elapsed:.2f}s")
+        print(f"  Data size: {used_before} -> {used_after} bytes")
+        print(f"  File size: {file_before} -> {file_after} bytes")
@@ -0,0 +1,89 @@
+import os
+
+# Settings can be overridden with environment variables of the same name
+# prefixed with ECHO_, e.g. ECHO_DB_POOL_SIZE=16.
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(f"ECHO_{name}")
+    if value is None or value == '':
+        return default
+    return cast(value)
+
+
+# --- Database ---
+DATABASE = _env('DATABASE', 'encrypted_echo.db')
+DATABASE_DIR = os.path.dirname(os.path.abspath(DATABASE))
+
+# Connection pool: long-lived connections shared by request threads
+DB_POOL_SIZE = _env('DB_POOL_SIZE', 8, int)
+DB_POOL_TIMEOUT = _env('DB_POOL_TIMEOUT', 10.0, float)  # seconds to wait for a free connection
+DB_STATEMENT_CACHE = _env('DB_STATEMENT_CACHE', 256, int)  # prepared statements kept per connection
+
+# Per-connection pragmas
+DB_JOURNAL_MODE = _env('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = _env('DB_SYNCHRONOUS', 'NORMAL')
+DB_BUSY_TIMEOUT_MS = _env('DB_BUSY_TIMEOUT_MS', 5000, int)
+DB_MMAP_SIZE = _env('DB_MMAP_SIZE', 256 * 1024 * 1024, int)  # bytes
+DB_CACHE_SIZE = _env('DB_CACHE_SIZE', -64 * 1024, int)  # negative = KiB, i.e. 64 MiB
+
+# Message shards: messages are split across SHARD_COUNT files by receiver_id;
+# 1 keeps them in DATABASE. Split existing messages with `python shards.py rebalance`.
+SHARD_COUNT = _env('SHARD_COUNT', 1, int)
+SHARD_DIR = _env('SHARD_DIR', 'shards')
+
+# Group commit for /send: one writer thread batches inserts into shared transactions
+WRITE_BEHIND_ENABLED = _env('WRITE_BEHIND_ENABLED', 0, int)
+WRITE_BATCH_MAX = _env('WRITE_BATCH_MAX', 64, int)  # statements per transaction
+WRITE_BATCH_LATENCY_MS = _env('WRITE_BATCH_LATENCY_MS', 2.0, float)  # max wait for a batch to fill
+
+# --- User directory (GET /users) ---
+USER_INDEX_ENABLED = _env('USER_INDEX_ENABLED', 1, int)  # 0 = page and search with SQLite queries
+USER_INDEX_REFRESH = _env('USER_INDEX_REFRESH', 1.0, float)  # seconds between catch-ups with other workers
+
+# --- Message retention (retention.py) ---
+MESSAGE_TTL = _env('MESSAGE_TTL', 0, int)  # seconds before a message expires; 0 = keep until acked/forever
+RETENTION_DELETE_AFTER = _env('RETENTION_DELETE_AFTER', '')  # 'delivered' or 'read': expire once acked
+RETENTION_ACK_GRACE = _env('RETENTION_ACK_GRACE', 0, int)  # seconds an acked message is kept
+RETENTION_INTERVAL = _env('RETENTION_INTERVAL', 60.0, float)  # seconds between reaper passes; 0 = off
+RETENTION_BATCH = _env('RETENTION_BATCH', 500, int)  # rows deleted per transaction
+RETENTION_PAUSE = _env('RETENTION_PAUSE', 0.05, float)  # seconds between batches
+RETENTION_VACUUM_PAGES = _env('RETENTION_VACUUM_PAGES', 2048, int)  # pages released per pass; 0 = no vacuum
+
+# --- Session tokens (auth.py) ---
+SECRET_KEY = _env('SECRET_KEY', '')  # signs tokens; empty = random per process (tokens die with it)
+TOKEN_TTL = _env('TOKEN_TTL', 900, int)  # seconds a token is accepted
+TOKEN_REFRESH_WINDOW = _env('TOKEN_REFRESH_WINDOW', 7 * 24 * 3600, int)  # seconds after login /refresh works; then log in again
+AUTH_REQUIRED = _env('AUTH_REQUIRED', 0, int)  # 1 = message routes refuse requests without a token
+
+# --- Password hashing ---
+BCRYPT_ROUNDS = _env('BCRYPT_ROUNDS', 12, int)  # work factor for new hashes
+HASH_WORKERS = _env('HASH_WORKERS', os.cpu_count() or 1, int)  # 0 = hash on the request thread
+HASH_MAX_PENDING = _env('HASH_MAX_PENDING', 0, int)  # queued jobs before 503; 0 = 8 per worker
+
+# --- asyncio entry point (asgi_app.py) ---
+ASGI_WORKERS = _env('ASGI_WORKERS', 32, int)  # threads running the Flask routes
+
+# --- Pre-generated RSA key pairs (/crypto_demo) ---
+KEY_POOL_SIZE = _env('KEY_POOL_SIZE', 16, int)  # high-water mark; 0 = always generate inline
+KEY_POOL_LOW_WATER = _env('KEY_POOL_LOW_WATER', 8, int)  # refill when fewer than this are ready
+KEY_POOL_WORKERS = _env('KEY_POOL_WORKERS', 1, int)  # keygen processes; 0 = refill thread generates
+
+# --- Attachments ---
+# A relative ATTACHMENT_DIR is taken from DATABASE_DIR, not the working directory
+ATTACHMENT_DIR = os.path.join(DATABASE_DIR, _env('ATTACHMENT_DIR', 'attachments'))
+ATTACHMENT_MAX_BYTES = _env('ATTACHMENT_MAX_BYTES', 100 * 1024 * 1024, int)
+
+# --- Background BLOB migration (base64 TEXT -> raw BLOB) ---
+BLOB_MIGRATION_AUTOSTART = _env('BLOB_MIGRATION_AUTOSTART', 1, int)
+BLOB_MIGRATION_BATCH = _env('BLOB_MIGRATION_BATCH', 500, int)  # rows per transaction
+BLOB_MIGRATION_PAUSE = _env('BLOB_MIGRATION_PAUSE', 0.05, float)  # seconds between batches
+
+# --- Profiling ---
+PROFILE_SLOW_REQUEST_MS = _env('PROFILE_SLOW_REQUEST_MS', 0, int)  # dump hot stacks above this; 0 = off
+PROFILE_SAMPLE_INTERVAL_MS = _env('PROFILE_SAMPLE_INTERVAL_MS', 5, int)
+
+# --- Logging ---
+LOG_LEVEL = _env('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = _env('LOG_SAMPLE_RATE', 1.0, float)  # fraction of DEBUG/INFO records kept
+LOG_MAX_FIELD_CHARS = _env('LOG_MAX_FIELD_CHARS', 64, int)  # longer string fields are truncated
@@ -1,9 +1,16 @@
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import os
 import base64
+import hashlib
+import threading
 
+from metrics import registry
+
+@registry.timed('crypto_operation_duration_seconds', operation='rsa_generate')
 def generate_rsa_key_pair():
     """Generate an RSA key pair and return it in PEM format"""
     private_key = rsa.generate_private_key(
@@ -33,13 +40,65 @@ def load_public_key(pem_key):
     """Load a public key from PEM format"""
     return serialization.load_pem_public_key(pem_key.encode('utf-8'))
 
-def load_private_key(pem_key):
-    """Load a private key from PEM format"""
+def key_fingerprint(pem_key):
+    """Return a stable hex fingerprint for a PEM (or other text) encoded key"""
+    if isinstance(pem_key, str):
+        pem_key = pem_key.encode('utf-8')
+    return hashlib.sha256(pem_key.strip()).hexdigest()
+
+class PublicKeyCache:
+    """
+    Bounded LRU cache of parsed public keys, keyed by the fingerprint of the
+    PEM they were parsed from. A changed key has a new fingerprint, so it is
+    parsed afresh and the old entry simply ages out.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # fingerprint -> key
+        self._lock = threading.Lock()
+
+    def get(self, pem_key):
+        """Return the parsed key for pem_key, parsing it on a miss"""
+        fingerprint = key_fingerprint(pem_key)
+        with self._lock:
+            public_key = self._entries.get(fingerprint)
+            if public_key is not None:
+                self._entries.move_to_end(fingerprint)
+                return public_key
+
+        # Parse outside the lock; a racing thread just parses it twice
+        public_key = load_public_key(pem_key)
+        with self._lock:
+            self._entries[fingerprint] = public_key
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return public_key
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+public_key_cache = PublicKeyCache()
+
+def get_public_key(pem_key):
+    """Load a public key through the shared cache"""
+    return public_key_cache.get(pem_key)
+
+def load_private_key(pem_key, trusted=False):
+    """
+    Load a private key from PEM format.
+    RSA keys are checked for consistency on load, which costs about as much
+    as a decryption; pass trusted=True for keys this server generated itself.
+    """
     return serialization.load_pem_private_key(
         pem_key.encode('utf-8'),
-        password=None
+        password=None,
+        unsafe_skip_rsa_key_validation=trusted
     )
 
+@registry.timed('crypto_operation_duration_seconds', operation='rsa_encrypt')
 def rsa_encrypt(public_key, data):
     """Encrypt data with RSA public key"""
     if isinstance(data, str):
@@ -56,6 +115,7 @@ def rsa_encrypt(public_key, data):
     
     return base64.b64encode(encrypted).decode('utf-8')
 
+@registry.timed('crypto_operation_duration_seconds', operation='rsa_decrypt')
 def rsa_decrypt(private_key, encrypted_data):
     """Decrypt data with RSA private key"""
     if isinstance(encrypted_data, str):
@@ -76,6 +136,7 @@ def generate_aes_key():
     """Generate a random AES key"""
     return os.urandom(32)  # 256 bit key (32 bytes)
 
+@registry.timed('crypto_operation_duration_seconds', operation='aes_encrypt')
 def aes_encrypt(key, plaintext):
     """Encrypt data with AES-GCM"""
     if isinstance(plaintext, str):
@@ -96,6 +157,7 @@ def aes_encrypt(key, plaintext):
         'nonce': base64.b64encode(nonce).decode('utf-8')
     }
 
+@registry.timed('crypto_operation_duration_seconds', operation='aes_decrypt')
 def aes_decrypt(key, encrypted_data, nonce):
     """Decrypt data with AES-GCM"""
     if isinstance(encrypted_data, str):
@@ -112,6 +174,102 @@ def aes_decrypt(key, encrypted_data, nonce):
     
     return plaintext.decode('utf-8')
 
+# --- Streaming (segmented) AES-GCM ---
+# For payloads too large to hold in memory the plaintext is cut into fixed-size
+# chunks, each sealed separately (the STREAM construction). Layout:
+#   header:   magic (4) | chunk size (4, big-endian) | nonce prefix (7)
+#   segments: AES-GCM(chunk) + tag (16), the last one may be shorter
+# Segment nonce = prefix | counter (4, big-endian) | final flag (1), and the
+# header is authenticated with every segment. Flagging the final segment means
+# a stream truncated at a segment boundary fails to decrypt.
+STREAM_MAGIC = b'EES1'
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_NONCE_PREFIX_SIZE = 7
+STREAM_HEADER_SIZE = len(STREAM_MAGIC) + 4 + STREAM_NONCE_PREFIX_SIZE
+STREAM_TAG_SIZE = 16
+_STREAM_MAX_SEGMENTS = 2 ** 32
+
+def _stream_nonce(prefix, counter, final):
+    if counter >= _STREAM_MAX_SEGMENTS:
+        raise ValueError("Stream too long for a single key")
+    return prefix + counter.to_bytes(4, 'big') + (b'\x01' if final else b'\x00')
+
+def _rechunk(chunks, size):
+    """Regroup an iterable of byte strings into pieces of exactly `size` bytes (last may be shorter)"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    yield bytes(buffer)
+
+def iter_file(fileobj, size=STREAM_CHUNK_SIZE):
+    """Yield a binary file-like object in pieces of up to `size` bytes"""
+    while True:
+        chunk = fileobj.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+def encrypt_stream(key, chunks, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encrypt an iterable of plaintext byte strings with segmented AES-GCM.
+    Yields the header followed by one sealed segment per chunk_size bytes,
+    holding at most two chunks in memory at once.
+    """
+    aesgcm = AESGCM(key)
+    prefix = os.urandom(STREAM_NONCE_PREFIX_SIZE)
+    header = STREAM_MAGIC + chunk_size.to_bytes(4, 'big') + prefix
+    yield header
+
+    # Look one chunk ahead so the final segment can be flagged
+    pieces = _rechunk(chunks, chunk_size)
+    current = next(pieces)
+    counter = 0
+    for following in pieces:
+        if not following and len(current) == chunk_size:
+            # Plaintext ended exactly on a chunk boundary
+            break
+        yield aesgcm.encrypt(_stream_nonce(prefix, counter, False), current, header)
+        current = following
+        counter += 1
+    yield aesgcm.encrypt(_stream_nonce(prefix, counter, True), current, header)
+
+def decrypt_stream(key, chunks):
+    """
+    Decrypt an iterable of byte strings produced by encrypt_stream().
+    Yields plaintext chunks as each segment is authenticated; raises
+    cryptography.exceptions.InvalidTag on tampering or truncation.
+    """
+    aesgcm = AESGCM(key)
+    buffer = bytearray()
+    header = None
+    segment_size = None
+    counter = 0
+
+    for chunk in chunks:
+        buffer += chunk
+        if header is None:
+            if len(buffer) < STREAM_HEADER_SIZE:
+                continue
+            header = bytes(buffer[:STREAM_HEADER_SIZE])
+            del buffer[:STREAM_HEADER_SIZE]
+            if header[:4] != STREAM_MAGIC:
+                raise ValueError("Not an encrypted stream")
+            segment_size = int.from_bytes(header[4:8], 'big') + STREAM_TAG_SIZE
+            prefix = header[8:]
+        # Only segments followed by more data can be non-final
+        while len(buffer) > segment_size:
+            segment = bytes(buffer[:segment_size])
+            del buffer[:segment_size]
+            yield aesgcm.decrypt(_stream_nonce(prefix, counter, False), segment, header)
+            counter += 1
+
+    if header is None:
+        raise ValueError("Encrypted stream is truncated")
+    yield aesgcm.decrypt(_stream_nonce(prefix, counter, True), bytes(buffer), header)
+
 def encrypt_message(recipient_public_key_pem, message):
     """
     Full encryption workflow:
@@ -124,7 +282,7 @@ def encrypt_message(recipient_public_key_pem, message):
     
     encrypted_message = aes_encrypt(aes_key, message)
 
-    public_key = load_public_key(recipient_public_key_pem)
+    public_key = get_public_key(recipient_public_key_pem)
  
     encrypted_key = rsa_encrypt(public_key, aes_key)
 
@@ -134,14 +292,58 @@ def encrypt_message(recipient_public_key_pem, message):
         'nonce': encrypted_message['nonce']
     }
 
-def decrypt_message(private_key_pem, encrypted_message, encrypted_key, nonce):
+# RSA operations release the GIL, so key wraps for many recipients run in parallel
+_wrap_executor = None
+_wrap_executor_lock = threading.Lock()
+
+def _get_wrap_executor():
+    global _wrap_executor
+    if _wrap_executor is None:
+        with _wrap_executor_lock:
+            if _wrap_executor is None:
+                _wrap_executor = ThreadPoolExecutor(
+                    max_workers=os.cpu_count() or 1,
+                    thread_name_prefix='rsa-wrap'
+                )
+    return _wrap_executor
+
+def encrypt_for_recipients(recipient_public_key_pems, message):
+    """
+    Multi-recipient encryption workflow:
+    1. Generate a single random AES key
+    2. Encrypt the message with AES once
+    3. Encrypt the AES key with each recipient's RSA public key, in parallel
+    4. Return the shared ciphertext and nonce plus one wrapped key per recipient
+       (in the same order as recipient_public_key_pems)
+    Each recipient decrypts with decrypt_message() using their own wrapped key.
+    """
+    aes_key = generate_aes_key()
+    
+    encrypted_message = aes_encrypt(aes_key, message)
+
+    public_keys = [get_public_key(pem) for pem in recipient_public_key_pems]
+
+    if len(public_keys) <= 1:
+        encrypted_keys = [rsa_encrypt(public_key, aes_key) for public_key in public_keys]
+    else:
+        encrypted_keys = list(_get_wrap_executor().map(
+            lambda public_key: rsa_encrypt(public_key, aes_key), public_keys
+        ))
+
+    return {
+        'encrypted_message': encrypted_message['encrypted'],
+        'encrypted_keys': encrypted_keys,
+        'nonce': encrypted_message['nonce']
+    }
+
+def decrypt_message(private_key_pem, encrypted_message, encrypted_key, nonce, trusted_key=False):
     """
     Full decryption workflow:
     1. Decrypt the AES key with the recipient's RSA private key
     2. Decrypt the message with the AES key
     3. Return the original message
     """
-    private_key = load_private_key(private_key_pem)
+    private_key = load_private_key(private_key_pem, trusted=trusted_key)
     
     aes_key = rsa_decrypt(private_key, encrypted_key)
     
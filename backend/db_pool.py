@@ -0,0 +1,98 @@
+import queue
+import sqlite3
+import threading
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool timeout"""
+
+
+class ConnectionPool:
+    """
+    A fixed-size pool of long-lived SQLite connections.
+    Each connection is used by one request thread at a time and keeps its
+    prepared-statement cache and page cache between requests, which a
+    connect-per-request setup throws away.
+    """
+
+    def __init__(self, database, size=8, timeout=10.0, pragmas=None, statement_cache=128,
+                 factory=sqlite3.Connection, attach=None):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self.statement_cache = statement_cache
+        self.factory = factory
+        self.attach = dict(attach or {})  # schema name -> database path
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            # Connections are handed between threads, never shared concurrently
+            check_same_thread=False,
+            cached_statements=self.statement_cache,
+            factory=self.factory,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        for schema, path in self.attach.items():
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        return conn
+
+    def acquire(self):
+        """Check out a connection, opening a new one if the pool isn't full"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any unfinished transaction"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Don't hand a broken connection to the next request
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def stats(self):
+        """Return (connections open, connections idle)"""
+        with self._lock:
+            return self._created, self._idle.qsize()
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
@@ -1,30 +1,267 @@
 import sqlite3
+from collections import namedtuple
+from types import MappingProxyType
 
-conn = sqlite3.connect('encrypted_echo.db')
-c = conn.cursor()
-
-# Create a table for storing user data
-c.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-          public_key TEXT
-      )
-  ''')
-
-# Create a table for storing messages
-c.execute('''
-CREATE TABLE IF NOT EXISTS messages (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    sender_id INTEGER,
-    receiver_id INTEGER,
-    encrypted_message TEXT,
-    FOREIGN KEY(sender_id) REFERENCES users(id),
-    FOREIGN KEY(receiver_id) REFERENCES users(id)
-)
-''')
-
-conn.commit()
-conn.close()
-print("Database setup complete. Tables created if they didn't exist.")
\ No newline at end of file
+DATABASE = 'encrypted_echo.db'
+
+# Immutable snapshot of the database layout, built once at startup.
+# `tables` maps table name -> tuple of column names.
+Schema = namedtuple('Schema', ['version', 'tables'])
+
+
+def table_columns(cursor, table_name):
+    """Return the column names of a table (empty tuple if it doesn't exist)"""
+    columns = cursor.execute(f"PRAGMA table_info({table_name})").fetchall()
+    return tuple(col[1] for col in columns)  # col[1] is name
+
+
+def _add_column(cursor, table_name, column, declaration):
+    """Add a column unless an older version of the app already added it"""
+    if column not in table_columns(cursor, table_name):
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {declaration}")
+
+
+# --- Migrations ---
+# Each migration brings the database from version N-1 to version N, where N is
+# its position in MIGRATIONS. Databases created before versioning existed report
+# user_version 0, so every migration must tolerate objects that already exist.
+
+def _create_base_tables(cursor):
+    # Create a table for storing user data
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            public_key TEXT
+        )
+    ''')
+
+    # Create a table for storing messages
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER,
+            receiver_id INTEGER,
+            encrypted_message TEXT,
+            FOREIGN KEY(sender_id) REFERENCES users(id),
+            FOREIGN KEY(receiver_id) REFERENCES users(id)
+        )
+    ''')
+
+
+def _add_encryption_columns(cursor):
+    # These used to be added lazily by the /register and /send routes
+    _add_column(cursor, 'users', 'public_key', 'TEXT')
+    _add_column(cursor, 'messages', 'encrypted_key', 'TEXT')
+    _add_column(cursor, 'messages', 'iv', 'TEXT')
+
+
+def _add_inbox_index(cursor):
+    # Inbox reads filter on receiver_id and page by id
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_receiver_id ON messages (receiver_id, id)"
+    )
+
+
+def _add_message_bodies(cursor):
+    # Multi-recipient messages store the ciphertext once in message_bodies;
+    # each recipient's messages row then only holds their wrapped key
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_bodies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER,
+            encrypted_message TEXT,
+            iv TEXT,
+            FOREIGN KEY(sender_id) REFERENCES users(id)
+        )
+    ''')
+    _add_column(cursor, 'messages', 'body_id', 'INTEGER REFERENCES message_bodies(id)')
+
+
+def _add_attachments(cursor):
+    # Attachment ciphertext lives on disk; the row holds its location and
+    # the recipient's wrapped content key
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER,
+            receiver_id INTEGER,
+            encrypted_key TEXT,
+            size INTEGER,
+            path TEXT NOT NULL,
+            FOREIGN KEY(sender_id) REFERENCES users(id),
+            FOREIGN KEY(receiver_id) REFERENCES users(id)
+        )
+    ''')
+
+
+def add_migration_progress(cursor):
+    """
+    Checkpoints for long-running data migrations such as blob_migration.py.
+    Also applied to message shard files.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def create_inbox_summary(cursor):
+    """
+    Delivered/read state on messages plus the inbox_summary table, which
+    triggers keep in step with messages inside the inserting transaction.
+    Also applied to message shard files (see shards.py).
+    """
+    _add_column(cursor, 'messages', 'delivered_at', 'INTEGER')  # unix time, NULL until acked
+    _add_column(cursor, 'messages', 'read_at', 'INTEGER')
+    # One thread (messages from one sender to one receiver) is an index range
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (receiver_id, sender_id, id)"
+    )
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inbox_summary (
+            receiver_id INTEGER NOT NULL,
+            sender_id INTEGER NOT NULL,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            last_message_id INTEGER NOT NULL,
+            PRIMARY KEY (receiver_id, sender_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_inbox_summary_insert AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO inbox_summary (receiver_id, sender_id, unread_count, last_message_id)
+            VALUES (NEW.receiver_id, NEW.sender_id, NEW.read_at IS NULL, NEW.id)
+            ON CONFLICT (receiver_id, sender_id) DO UPDATE SET
+                unread_count = unread_count + excluded.unread_count,
+                last_message_id = MAX(last_message_id, excluded.last_message_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_inbox_summary_read AFTER UPDATE OF read_at ON messages
+        WHEN OLD.read_at IS NULL AND NEW.read_at IS NOT NULL
+        BEGIN
+            UPDATE inbox_summary SET unread_count = unread_count - 1
+            WHERE receiver_id = NEW.receiver_id AND sender_id = NEW.sender_id;
+        END
+    ''')
+    # Existing messages start out unread
+    cursor.execute('''
+        INSERT OR IGNORE INTO inbox_summary (receiver_id, sender_id, unread_count, last_message_id)
+        SELECT receiver_id, sender_id, SUM(read_at IS NULL), MAX(id)
+        FROM messages
+        GROUP BY receiver_id, sender_id
+    ''')
+
+
+def add_message_expiry(cursor):
+    """
+    expires_at on messages for TTLs and delete-after-ack, plus the indexes
+    and trigger the retention reaper needs (see retention.py).
+    Also applied to message shard files.
+    """
+    _add_column(cursor, 'messages', 'expires_at', 'INTEGER')  # unix time; NULL = keep
+    # The reaper's "expires_at <= now" scan and its orphaned-body check
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_expires_at ON messages (expires_at) "
+        "WHERE expires_at IS NOT NULL"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_body_id ON messages (body_id) WHERE body_id IS NOT NULL"
+    )
+    # Keep inbox_summary in step with deletes; the conversation index makes
+    # the MAX(id) lookup a single seek
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_inbox_summary_delete AFTER DELETE ON messages
+        BEGIN
+            UPDATE inbox_summary SET
+                unread_count = unread_count - (OLD.read_at IS NULL),
+                last_message_id = (
+                    SELECT COALESCE(MAX(id), 0) FROM messages
+                    WHERE receiver_id = OLD.receiver_id AND sender_id = OLD.sender_id
+                )
+            WHERE receiver_id = OLD.receiver_id AND sender_id = OLD.sender_id;
+            DELETE FROM inbox_summary
+            WHERE receiver_id = OLD.receiver_id AND sender_id = OLD.sender_id AND last_message_id = 0;
+        END
+    ''')
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_encryption_columns,
+    _add_inbox_index,
+    _add_message_bodies,
+    _add_attachments,
+    add_migration_progress,
+    create_inbox_summary,
+    add_message_expiry,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(db_path=DATABASE, migrations=MIGRATIONS):
+    """Apply any pending migrations and return the resulting schema version"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+        if version == 0 and not cursor.execute("SELECT 1 FROM sqlite_master").fetchone():
+            # auto_vacuum can only be switched on before the first table is
+            # created (or by a full VACUUM, see retention.py); it lets the
+            # retention reaper hand freed pages back with incremental_vacuum
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+        while version < len(migrations):
+            # Take the write lock before re-reading the version so concurrent
+            # workers starting up together apply each migration only once
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(migrations):
+                    cursor.execute("COMMIT")
+                    break
+
+                migrations[version](cursor)
+                version += 1
+                cursor.execute(f"PRAGMA user_version = {version}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+        return version
+    finally:
+        conn.close()
+
+
+def load_schema(db_path=DATABASE):
+    """Read the current schema into an immutable Schema snapshot"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        names = cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+        tables = {name: table_columns(cursor, name) for (name,) in names}
+        return Schema(version, MappingProxyType(tables))
+    finally:
+        conn.close()
+
+
+def setup_database(db_path=DATABASE):
+    """Migrate the database to the latest version and return its schema"""
+    migrate(db_path)
+    return load_schema(db_path)
+
+
+if __name__ == '__main__':
+    schema = setup_database()
+    print(f"Database setup complete. Schema version {schema.version}.")
@@ -0,0 +1,110 @@
+import collections
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import crypto_utils
+from logging_setup import fields, get_logger
+from metrics import registry
+
+log = get_logger('key_pool')
+
+registry.describe('key_pool_requests_total', 'counter', 'RSA key pairs handed out, by whether the pool had one ready')
+
+
+class KeyPairPool:
+    """
+    Keeps up to `high_water` RSA key pairs generated ahead of time.
+    A background thread tops the pool up on worker processes whenever it
+    drops below `low_water`, so get() is a deque pop. When the pool is empty
+    get() generates a key pair inline and counts a miss.
+    With workers=0 the refill thread generates keys itself.
+    Each key pair is handed out once and never reused.
+    Nothing runs until the first get() (or an explicit start()), so an app
+    that never needs a key pair starts no thread and no workers.
+    """
+
+    def __init__(self, high_water=16, low_water=None, workers=1, generate=crypto_utils.generate_rsa_key_pair):
+        self.high_water = high_water
+        self.low_water = high_water // 2 if low_water is None else min(low_water, high_water)
+        self.workers = workers
+        self._generate = generate
+
+        self._keys = collections.deque()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._executor = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start filling the pool in the background"""
+        with self._start_lock:
+            if self._thread is None and self.high_water > 0:
+                self._thread = threading.Thread(target=self._run, name='key-pool-refill', daemon=True)
+                self._thread.start()
+                self._wakeup.set()
+        return self
+
+    def get(self):
+        """Return a fresh {'private_key', 'public_key'} PEM pair"""
+        if self._thread is None and self.high_water > 0:
+            self.start()
+        try:
+            key_pair = self._keys.popleft()
+        except IndexError:
+            key_pair = None
+        if len(self._keys) < self.low_water:
+            self._wakeup.set()
+
+        if key_pair is not None:
+            registry.inc('key_pool_requests_total', (('result', 'hit'),))
+            return key_pair
+        registry.inc('key_pool_requests_total', (('result', 'miss'),))
+        return self._generate()
+
+    def available(self):
+        """Number of pre-generated key pairs ready to hand out"""
+        return len(self._keys)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closed:
+                return
+            try:
+                self._refill()
+            except Exception:
+                # Leave the pool as it is; get() falls back to inline generation
+                log.exception("key pool refill failed", extra=fields(available=len(self._keys)))
+
+    def _refill(self):
+        missing = self.high_water - len(self._keys)
+        if missing <= 0:
+            return
+        if self.workers == 0:
+            for _ in range(missing):
+                if self._closed:
+                    return
+                self._keys.append(self._generate())
+            return
+
+        if self._executor is None:
+            # forkserver, as in passwords.py: forking the running app, other
+            # threads and all, could deadlock a worker on an inherited lock
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+        futures = [self._executor.submit(self._generate) for _ in range(missing)]
+        # Hand each key pair out as soon as it's ready rather than after the batch
+        for future in as_completed(futures):
+            self._keys.append(future.result())
+
+    def shutdown(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
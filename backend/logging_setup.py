@@ -0,0 +1,119 @@
+"""
+Structured, non-blocking logging.
+
+Request threads only build a LogRecord and put it on an in-memory queue; a
+single background listener thread redacts, formats (one JSON object per
+line) and writes it. Low-severity records can be sampled so hot routes log
+a fraction of their traffic.
+
+Attach structured data with `extra=fields(...)`:
+
+    log.info("message sent", extra=fields(sender_id=1, receiver_id=2))
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+LOGGER_NAME = 'encrypted_echo'
+
+# Ciphertext, key material and credentials never reach the log in full
+REDACTED_FIELDS = frozenset({
+    'encrypted_msg', 'encrypted_message', 'encrypted_key', 'iv', 'nonce',
+    'password', 'password_hash', 'public_key', 'private_key', 'token',
+})
+
+
+def fields(**values):
+    """Wrap structured fields for the `extra` argument of a logging call"""
+    return {'fields': values}
+
+
+def get_logger(name=None):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def _redact(value, max_chars, key=None):
+    if key in REDACTED_FIELDS and value is not None:
+        return f"<redacted {len(value) if hasattr(value, '__len__') else '?'} chars>"
+    if isinstance(value, dict):
+        return {k: _redact(v, max_chars, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact(v, max_chars) for v in value]
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + f"...<{len(value) - max_chars} more>"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with redacted and truncated fields"""
+
+    def __init__(self, max_field_chars=64):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        extra = getattr(record, 'fields', None)
+        if extra:
+            entry.update(_redact(extra, self.max_field_chars))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random fraction of records below WARNING; keep everything else"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the record on the calling thread; leave all
+    # formatting to the listener so callers only pay for the enqueue.
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+
+
+def configure_logging(level='INFO', sample_rate=1.0, max_field_chars=64, stream=None):
+    """Route the app's loggers through a queue to a background writer"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    records = queue.SimpleQueue()
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(JsonFormatter(max_field_chars))
+
+    handler = _DeferredQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, writer, respect_handler_level=True)
+    _listener.start()
+    # Flush what's queued on a clean exit
+    atexit.register(_listener.stop)
+    return _listener
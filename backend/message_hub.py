@@ -0,0 +1,46 @@
+import queue
+import threading
+
+
+class MessageHub:
+    """
+    In-process fan-out of newly stored messages, keyed by receiver_id.
+    Waiting clients block on their own queue, so an idle client costs no
+    database queries. Only sends handled by this process are published;
+    clients in other processes pick them up on their next catch-up query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # receiver_id -> set of subscriber queues
+
+    def subscribe(self, receiver_id, subscriber=None):
+        """Register a queue that will receive messages for receiver_id"""
+        if subscriber is None:
+            subscriber = queue.SimpleQueue()
+        with self._lock:
+            self._subscribers.setdefault(receiver_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, receiver_id, subscriber):
+        """Stop delivering messages to a queue returned by subscribe()"""
+        with self._lock:
+            subscribers = self._subscribers.get(receiver_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[receiver_id]
+
+    def publish(self, receiver_id, message):
+        """Hand a committed message to everyone waiting on receiver_id"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(receiver_id, ()))
+        for subscriber in subscribers:
+            subscriber.put_nowait(message)
+        return len(subscribers)
+
+    def subscriber_count(self):
+        """Return the number of clients currently waiting"""
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
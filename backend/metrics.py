@@ -0,0 +1,279 @@
+"""
+In-process metrics exported in Prometheus text format.
+
+Every thread records into its own counters and histograms, so the hot path
+takes no locks: recording is a thread-local lookup plus a dict update.
+/metrics merges the per-thread values when it's scraped. Threads that have
+exited are folded into a shared total so short-lived request threads don't
+pile up.
+"""
+import bisect
+import collections
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from functools import wraps
+
+from logging_setup import fields, get_logger
+
+log = get_logger('profiler')
+
+# Seconds; shared by every histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ThreadStats:
+    """Counters and histograms written by a single thread"""
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+
+class Registry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._retired = _ThreadStats(None)
+        self._help = {}     # name -> (type, help text)
+        self._gauges = []   # (name, help, callback)
+
+    def _stats(self):
+        try:
+            return self._local.stats
+        except AttributeError:
+            stats = _ThreadStats(threading.current_thread())
+            self._local.stats = stats
+            with self._lock:
+                self._threads.append(stats)
+                if len(self._threads) > 2 * threading.active_count():
+                    self._retire_dead_threads()
+            return stats
+
+    def _retire_dead_threads(self):
+        # Caller holds self._lock. A dead thread can't write any more, so its
+        # values can be merged without racing it.
+        alive = []
+        for stats in self._threads:
+            if stats.thread.is_alive():
+                alive.append(stats)
+            else:
+                _merge(self._retired, stats)
+        self._threads = alive
+
+    def describe(self, name, kind, help_text):
+        """Register the TYPE and HELP lines for a metric"""
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), amount=1):
+        counters = self._stats().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        histograms = self._stats().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def timed(self, name, **labels):
+        """Decorator recording how long each call takes"""
+        label_items = tuple(sorted(labels.items()))
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, label_items, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def gauge(self, name, help_text, callback):
+        """Report callback() at scrape time; it returns a number or {labels: number}"""
+        self._gauges.append((name, help_text, callback))
+
+    def snapshot(self):
+        """Merge every thread's values into one _ThreadStats"""
+        total = _ThreadStats(None)
+        with self._lock:
+            self._retire_dead_threads()
+            _merge(total, self._retired)
+            threads = list(self._threads)
+        for stats in threads:
+            _merge(total, stats)
+        return total
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        total = self.snapshot()
+        lines = []
+        seen = set()
+
+        def header(name, default_kind):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, help_text = self._help.get(name, (default_kind, name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(total.counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(total.histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            cumulative += histogram[len(self.buckets)]
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+        for name, help_text, callback in self._gauges:
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for labels, item in sorted(value.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {item}")
+            else:
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _merge(into, stats):
+    for key, value in list(stats.counters.items()):
+        into.counters[key] = into.counters.get(key, 0) + value
+    for key, histogram in list(stats.histograms.items()):
+        target = into.histograms.get(key)
+        if target is None:
+            into.histograms[key] = list(histogram)
+        else:
+            for i, value in enumerate(histogram):
+                target[i] += value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = Registry()
+
+registry.describe('http_requests_total', 'counter', 'HTTP requests by route, method and status')
+registry.describe('http_request_duration_seconds', 'histogram', 'Time spent in the view function')
+registry.describe('sqlite_query_duration_seconds', 'histogram', 'SQLite statement execution time by statement type')
+registry.describe('crypto_operation_duration_seconds', 'histogram', 'Time spent in RSA, AES and bcrypt operations')
+
+
+# --- SQLite instrumentation ---
+
+def _statement_kind(sql):
+    # Only the leading keyword, so label cardinality stays small
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            registry.observe('sqlite_query_duration_seconds', (('statement', _statement_kind(sql)),),
+                             time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            registry.observe('sqlite_query_duration_seconds', (('statement', _statement_kind(sql)),),
+                             time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose cursors time every statement"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts bypass cursor(); route them through a timed cursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# --- Slow request profiler ---
+
+class SlowRequestProfiler:
+    """
+    Opt-in sampling profiler. While a request is running, a background thread
+    samples its stack every `interval` seconds. When a request takes longer
+    than `threshold` seconds, its most frequent stacks are printed.
+    """
+
+    def __init__(self, threshold, interval=0.005, top=5, depth=12):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.depth = depth
+        self._active = {}  # thread id -> Counter of sampled stacks
+        self._lock = threading.Lock()
+        self._sampler = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+        self._sampler.start()
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = collections.Counter()
+
+    def finish(self, label, duration):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or duration < self.threshold:
+            return
+        log.warning("slow request", extra=fields(
+            request=label,
+            duration_ms=round(duration * 1000, 1),
+            samples=sum(samples.values()),
+            # Innermost frame last
+            hot_stacks=[{"count": count, "stack": "\n".join(stack)} for stack, count in samples.most_common(self.top)]
+        ))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    stack = traceback.extract_stack(frame, limit=self.depth)
+                    samples[tuple(f"{entry.filename}:{entry.lineno} {entry.name}" for entry in stack)] += 1
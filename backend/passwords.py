@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from metrics import registry
+
+
+class HasherBusy(Exception):
+    """Raised when too many hash/verify jobs are already queued"""
+
+
+# Module-level so they can be pickled into worker processes
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check_password(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return value
+
+
+def hash_cost(hashed):
+    """Return the work factor of a bcrypt hash such as $2b$12$..."""
+    try:
+        return int(_to_bytes(hashed).split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the request thread in a bounded process pool.
+    At most `max_pending` jobs may be queued or running; beyond that calls
+    fail fast with HasherBusy so the caller can answer 503 instead of
+    piling up requests behind a CPU-bound queue.
+    With workers=0 the work runs inline on the calling thread.
+    """
+
+    def __init__(self, rounds=12, workers=None, max_pending=None):
+        self.rounds = rounds
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending or max(self.workers, 1) * 8
+
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # Started lazily so importing the app doesn't start worker processes
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # Not fork: the app is running threads by now (reaper, writers,
+                    # log listener) and a forked child can deadlock on a lock one
+                    # of them held at the time
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('forkserver')
+                    )
+        return self._executor
+
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            registry.inc('password_hasher_rejected_total')
+            raise HasherBusy("Password hashing queue is full")
+        with self._pending_lock:
+            self._pending += 1
+        start = time.perf_counter()
+        try:
+            if self.workers == 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+            self._slots.release()
+            # Includes time spent queued for a worker
+            registry.observe('crypto_operation_duration_seconds', (('operation', operation),),
+                             time.perf_counter() - start)
+
+    def pending(self):
+        """Number of hash/verify jobs queued or running"""
+        return self._pending
+
+    def hash(self, password):
+        """Hash a password with the configured work factor"""
+        return self._run('bcrypt_hash', _hash_password, _to_bytes(password), self.rounds)
+
+    def verify(self, password, hashed):
+        """Check a password against a stored bcrypt hash"""
+        return self._run('bcrypt_verify', _check_password, _to_bytes(password), _to_bytes(hashed))
+
+    def needs_rehash(self, hashed):
+        """True if a stored hash was made with a different work factor"""
+        return hash_cost(hashed) != self.rounds
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,252 @@
+"""
+Delete expired messages and hand the freed pages back to the filesystem.
+
+A message gets an expires_at when it is sent with a ttl (or under
+config.MESSAGE_TTL) and when it is acknowledged under
+config.RETENTION_DELETE_AFTER. The reaper deletes expired rows in small
+batches, each in its own short write transaction, so /send is never locked
+out for long, then runs a bounded PRAGMA incremental_vacuum so the file
+shrinks instead of only growing its freelist. The app runs it in a
+background thread over the main database and every shard; it can also be
+run by hand:
+
+    python retention.py reap --db encrypted_echo.db
+    python retention.py vacuum --db encrypted_echo.db --full
+
+Databases created before auto_vacuum was enabled need one `vacuum --full`
+(app stopped) before incremental passes can shrink them.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from logging_setup import fields, get_logger
+from metrics import registry
+
+log = get_logger('retention')
+
+registry.describe('retention_deleted_total', 'counter', 'Rows deleted by the retention reaper, by table')
+registry.describe('retention_batch_seconds', 'histogram', 'Time spent in one retention delete transaction')
+registry.describe('retention_vacuum_pages_total', 'counter', 'Pages released by incremental_vacuum')
+
+MAX_BATCH = 500  # ids are bound as parameters; stay under older SQLite builds' limit
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def _connect(db_path):
+    # Autocommit, so every batch is exactly one BEGIN IMMEDIATE ... COMMIT
+    conn = sqlite3.connect(db_path, timeout=config.DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.execute(f"PRAGMA busy_timeout = {config.DB_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def reap_batch(conn, now, batch_size=MAX_BATCH):
+    """
+    Delete up to batch_size messages that expired at or before `now`, and
+    the multi-recipient bodies no message refers to any more.
+    Returns (messages deleted, bodies deleted).
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT id, body_id FROM messages WHERE expires_at <= ? ORDER BY expires_at LIMIT ?",
+            (now, min(batch_size, MAX_BATCH))
+        ).fetchall()
+        bodies = 0
+        if rows:
+            conn.execute(
+                f"DELETE FROM messages WHERE id IN ({', '.join('?' * len(rows))})", [row[0] for row in rows]
+            )
+            body_ids = sorted({row[1] for row in rows if row[1] is not None})
+            if body_ids:
+                bodies = conn.execute(
+                    f"DELETE FROM message_bodies WHERE id IN ({', '.join('?' * len(body_ids))}) "
+                    "AND NOT EXISTS (SELECT 1 FROM messages WHERE body_id = message_bodies.id)", body_ids
+                ).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows), bodies
+
+
+def vacuum_pass(conn, pages):
+    """Release up to `pages` free pages to the filesystem; returns pages released"""
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # The pragma frees one page per step; execute() steps a statement with no
+    # result columns only once, executescript() runs it to the end
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def database_stats(db_path):
+    """File size, free pages and auto_vacuum mode of one database file"""
+    conn = _connect(db_path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    finally:
+        conn.close()
+    wal_path = db_path + '-wal'
+    return {
+        "file_bytes": os.path.getsize(db_path),
+        # Freed pages leave the main file at the next WAL checkpoint
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        "used_bytes": (page_count - free_pages) * page_size,
+        "free_bytes": free_pages * page_size,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(auto_vacuum, auto_vacuum),
+    }
+
+
+class RetentionReaper:
+    """
+    Every `interval` seconds, deletes expired messages from each database in
+    batches of `batch_size` (sleeping `pause` between them), then releases
+    up to `vacuum_pages` free pages. With interval=0, start() does nothing
+    and run_once() can be called directly.
+    """
+
+    def __init__(self, paths, interval=60.0, batch_size=MAX_BATCH, pause=0.05, vacuum_pages=2048):
+        self.paths = list(paths)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._totals = {"messages": 0, "message_bodies": 0, "vacuum_pages": 0}
+        self._last_run = None
+
+    def start(self):
+        """Run passes in a daemon thread"""
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='retention-reaper', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("retention pass failed")
+
+    def run_once(self, now=None):
+        """One pass over every database; returns messages deleted per path"""
+        now = int(time.time()) if now is None else now
+        started = time.perf_counter()
+        deleted = {}
+        for path in self.paths:
+            deleted[path] = self._reap(path, now)
+        elapsed = time.perf_counter() - started
+
+        total = sum(deleted.values())
+        with self._lock:
+            self._last_run = {
+                "at": now,
+                "seconds": round(elapsed, 3),
+                "deleted": total,
+                "rows_per_second": round(total / elapsed) if elapsed > 0 else 0,
+            }
+        if total:
+            log.info("expired messages deleted", extra=fields(deleted=total, seconds=round(elapsed, 3)))
+        return deleted
+
+    def _reap(self, path, now):
+        conn = _connect(path)
+        try:
+            deleted = 0
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                messages, bodies = reap_batch(conn, now, self.batch_size)
+                registry.observe('retention_batch_seconds', (), time.perf_counter() - started)
+                registry.inc('retention_deleted_total', (('table', 'messages'),), messages)
+                registry.inc('retention_deleted_total', (('table', 'message_bodies'),), bodies)
+                with self._lock:
+                    self._totals["messages"] += messages
+                    self._totals["message_bodies"] += bodies
+                deleted += messages
+                if messages < min(self.batch_size, MAX_BATCH):
+                    break
+                if self.pause:
+                    time.sleep(self.pause)
+
+            if self.vacuum_pages and conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                released = vacuum_pass(conn, self.vacuum_pages)
+                registry.inc('retention_vacuum_pages_total', amount=released)
+                with self._lock:
+                    self._totals["vacuum_pages"] += released
+            return deleted
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Totals since startup, the last pass and each database's size (for /dbinfo)"""
+        with self._lock:
+            result = {"deleted": dict(self._totals), "last_run": self._last_run}
+        result["interval"] = self.interval if self._thread is not None else 0
+        result["databases"] = {path: database_stats(path) for path in self.paths}
+        return result
+
+
+def full_vacuum(db_path):
+    """Switch the file to auto_vacuum=INCREMENTAL and rebuild it (locks the database throughout)"""
+    conn = _connect(db_path)
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Delete expired messages and reclaim free pages")
+    commands = parser.add_subparsers(dest='command', required=True)
+    reap = commands.add_parser('reap', help='delete every expired message now')
+    reap.add_argument('--db', nargs='+', default=[config.DATABASE], help='database and shard files')
+    reap.add_argument('--batch-size', type=int, default=config.RETENTION_BATCH)
+    reap.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between batches')
+    reap.add_argument('--vacuum-pages', type=int, default=config.RETENTION_VACUUM_PAGES)
+    vacuum = commands.add_parser('vacuum', help='release free pages')
+    vacuum.add_argument('--db', nargs='+', default=[config.DATABASE])
+    vacuum.add_argument('--pages', type=int, default=config.RETENTION_VACUUM_PAGES)
+    vacuum.add_argument('--full', action='store_true',
+                        help='enable auto_vacuum=INCREMENTAL and VACUUM (app stopped)')
+    args = parser.parse_args()
+
+    if args.command == 'reap':
+        reaper = RetentionReaper(args.db, interval=0, batch_size=args.batch_size, pause=args.pause,
+                                 vacuum_pages=args.vacuum_pages)
+        before = {path: database_stats(path) for path in args.db}
+        deleted = reaper.run_once()
+        for path, count in deleted.items():
+            after = database_stats(path)
+            print(f"{path}: deleted {count} messages, "
+                  f"file {before[path]['file_bytes']} -> {after['file_bytes']} bytes")
+        print(f"Last pass: {reaper.stats()['last_run']}")
+    else:
+        for path in args.db:
+            before = database_stats(path)
+            if args.full:
+                full_vacuum(path)
+            else:
+                conn = _connect(path)
+                try:
+                    vacuum_pass(conn, args.pages)
+                finally:
+                    conn.close()
+            after = database_stats(path)
+            print(f"{path}: {before['file_bytes']} -> {after['file_bytes']} bytes "
+                  f"(auto_vacuum={after['auto_vacuum']})")
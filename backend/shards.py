@@ -0,0 +1,222 @@
+"""
+Messages partitioned across SQLite shard files by receiver.
+
+The main database stays the user directory (users, attachments, migration
+bookkeeping). Each shard file holds the messages and message_bodies of the
+receivers that hash to it, so an inbox read touches exactly one shard and
+senders to different shards don't contend on one write lock.
+
+Shard connections ATTACH the directory as `directory`; shard files have no
+users table, so the existing queries' unqualified `users` resolves there.
+
+Message ids stay unique across shards: shard i allocates ids from i << 40.
+
+To split an existing single-file database, stop the app and run
+
+    python shards.py rebalance --db encrypted_echo.db --shards 4 --shard-dir shards
+
+then start it with ECHO_SHARD_COUNT=4.
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import db_setup
+from db_pool import ConnectionPool
+
+ID_SPACE_BITS = 40  # ids per shard before ranges would overlap
+
+
+def shard_path(directory, index):
+    return os.path.join(directory, f"messages-{index:03d}.db")
+
+
+# --- Shard migrations ---
+# Same scheme as db_setup.MIGRATIONS, tracked in each shard's user_version.
+# Sender/receiver ids refer to the directory's users table, which SQLite
+# can't enforce as a foreign key across files.
+
+def _create_shard_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_bodies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER,
+            encrypted_message BLOB,
+            iv BLOB
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER,
+            receiver_id INTEGER,
+            encrypted_message BLOB,
+            encrypted_key BLOB,
+            iv BLOB,
+            body_id INTEGER REFERENCES message_bodies(id)
+        )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_receiver_id ON messages (receiver_id, id)"
+    )
+
+
+SHARD_MIGRATIONS = [
+    _create_shard_tables,
+    db_setup.create_inbox_summary,
+    db_setup.add_message_expiry,
+    # Rows copied by rebalance() may still be base64 TEXT (see blob_migration.py)
+    db_setup.add_migration_progress,
+]
+
+
+def setup_shard(path, index):
+    """Create or migrate one shard file and reserve its id range"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    db_setup.migrate(path, SHARD_MIGRATIONS)
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'messages', ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'messages')",
+                (index << ID_SPACE_BITS,)
+            )
+    finally:
+        conn.close()
+
+
+class ShardRouter:
+    """
+    Picks the shard for a receiver and keeps one connection pool per shard.
+    Pool options (size, pragmas, factory, ...) are passed to every pool.
+    """
+
+    def __init__(self, directory_db, shard_dir, count, **pool_options):
+        self.count = count
+        self.paths = [shard_path(shard_dir, index) for index in range(count)]
+        for index, path in enumerate(self.paths):
+            setup_shard(path, index)
+        self.pools = [
+            ConnectionPool(path, attach={'directory': os.path.abspath(directory_db)}, **pool_options)
+            for path in self.paths
+        ]
+
+    def shard_for(self, receiver_id):
+        """Index of the shard holding receiver_id's inbox"""
+        return receiver_id % self.count
+
+    def pool_for(self, receiver_id):
+        return self.pools[self.shard_for(receiver_id)]
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+
+
+# --- Offline rebalancing ---
+
+def rebalance(db_path, shard_dir, count, batch_size=5000, delete_source=False):
+    """
+    Copy every message in the single-file database into `count` shards,
+    keeping message ids. Safe to re-run after an interruption: rows already
+    copied are skipped. Returns {shard path: messages in shard}.
+    """
+    paths = [shard_path(shard_dir, index) for index in range(count)]
+    for index, path in enumerate(paths):
+        setup_shard(path, index)
+
+    source = sqlite3.connect(db_path)
+    shards = [sqlite3.connect(path) for path in paths]
+    try:
+        max_id = source.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        if max_id >> ID_SPACE_BITS:
+            raise ValueError(f"Message id {max_id} doesn't fit a shard's id range")
+
+        after_id = 0
+        copied = 0
+        started = time.perf_counter()
+        while True:
+            rows = source.execute(
+                "SELECT id, sender_id, receiver_id, encrypted_message, encrypted_key, iv, body_id, "
+                "delivered_at, read_at, expires_at FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+
+            by_shard = [[] for _ in range(count)]
+            for row in rows:
+                by_shard[row[2] % count].append(row)
+
+            for shard, shard_rows in zip(shards, by_shard):
+                if not shard_rows:
+                    continue
+                body_ids = sorted({row[6] for row in shard_rows if row[6] is not None})
+                bodies = []
+                # Stay under SQLite's bound-parameter limit
+                for start in range(0, len(body_ids), 500):
+                    chunk = body_ids[start:start + 500]
+                    bodies.extend(source.execute(
+                        "SELECT id, sender_id, encrypted_message, iv FROM message_bodies "
+                        f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                    ).fetchall())
+                with shard:
+                    shard.executemany(
+                        "INSERT OR IGNORE INTO message_bodies (id, sender_id, encrypted_message, iv) "
+                        "VALUES (?, ?, ?, ?)", bodies
+                    )
+                    shard.executemany(
+                        "INSERT OR IGNORE INTO messages (id, sender_id, receiver_id, encrypted_message, "
+                        "encrypted_key, iv, body_id, delivered_at, read_at, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        shard_rows
+                    )
+
+            after_id = rows[-1][0]
+            copied += len(rows)
+            elapsed = time.perf_counter() - started
+            print(f"  copied {copied} messages ({copied / elapsed:.0f} rows/s)")
+
+        # Shard 0 allocates from 1, so it must continue after every copied id
+        for shard in shards:
+            with shard:
+                shard.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'messages'", (max_id,))
+
+        counts = {
+            path: shard.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            for path, shard in zip(paths, shards)
+        }
+        total = source.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        if sum(counts.values()) < total:
+            raise RuntimeError(f"Shards hold {sum(counts.values())} messages, source has {total}")
+
+        if delete_source:
+            with source:
+                source.execute("DELETE FROM messages")
+                source.execute("DELETE FROM message_bodies")
+                source.execute("DELETE FROM inbox_summary")
+        return counts
+    finally:
+        source.close()
+        for shard in shards:
+            shard.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage message shards")
+    commands = parser.add_subparsers(dest='command', required=True)
+    split = commands.add_parser('rebalance', help='copy a single-file database into shards (app stopped)')
+    split.add_argument('--db', default=db_setup.DATABASE)
+    split.add_argument('--shards', type=int, required=True)
+    split.add_argument('--shard-dir', default='shards')
+    split.add_argument('--batch', type=int, default=5000)
+    split.add_argument('--delete-source', action='store_true',
+                       help='empty messages and message_bodies in --db once the copy is verified')
+    args = parser.parse_args()
+
+    db_setup.setup_database(args.db)
+    counts = rebalance(args.db, args.shard_dir, args.shards, args.batch, args.delete_source)
+    for path, messages in counts.items():
+        print(f"{path}: {messages} messages")
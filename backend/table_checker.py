@@ -1,16 +1,624 @@
+"""
+Admin tool for the Echo database: a quick health check, streaming export
+and import, and a synthetic data seeder for capacity tests.
+
+    python table_checker.py check --db encrypted_echo.db --rows 5
+    python table_checker.py export --db encrypted_echo.db --format binary -o echo.dump
+    python table_checker.py import --db restored.db echo.dump
+    python table_checker.py seed --db load.db --users 10000 --messages 1000000
+
+export reads users, message_bodies and messages inside one read
+transaction, batch_size rows at a time, so memory stays flat however large
+the tables are. A dump is either NDJSON (a header line, then one object per
+row with binary fields as {"$b64": ...}) or frames in the wire.py framing:
+a HEADER frame holding the same JSON header, then ROWS frames of up to
+batch_size rows, each value a type tag followed by its payload. import
+tells the two apart from the first byte.
+
+import and seed write through BulkLoader: executemany in transactions of
+txn_rows rows, with the secondary indexes and the messages triggers dropped
+for the load and rebuilt once at the end. Until then the dropped
+definitions are kept in the _deferred_schema table, so if a load is killed,
+running import (which skips rows whose id already exists) or seed again
+puts them back when it finishes. Run both with the app stopped.
+
+Messages are loaded into --db. For a sharded deployment, load a single file
+and split it with `python shards.py rebalance`.
+"""
+import argparse
+import base64
+import collections
+import json
+import os
+import random
 import sqlite3
+import string
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+import config
+import crypto_utils
+import db_setup
+import wire
+from retention import database_stats
+
+EXPORT_TABLES = ('users', 'message_bodies', 'messages')  # in foreign key order
+BATCH_SIZE = 5000  # rows per fetchmany(), dump frame and executemany()
+TXN_ROWS = 100000  # rows per import transaction
+SEED_PASSWORD = 'seed-password'
+SEED_ALPHABET = string.ascii_letters + string.digits + ' .,!?'  # one UTF-8 byte each
+
+DUMP_FORMAT = 'echo-dump'
+DUMP_VERSION = 1
+FORMATS = ('ndjson', 'binary')
+
+# Frame kinds in a binary dump (the framing itself is wire.py's)
+HEADER = 16
+ROWS = 17
+
+# Value tags inside a ROWS frame
+_NULL, _INT, _FLOAT, _TEXT, _BLOB = range(5)
+_ROWS_HEAD = struct.Struct('>BI')  # table index in the header, row count
+_INT_VALUE = struct.Struct('>Bq')
+_FLOAT_VALUE = struct.Struct('>Bd')
+_LENGTH = struct.Struct('>BI')
+_I64 = struct.Struct('>q')
+_F64 = struct.Struct('>d')
+_U32 = struct.Struct('>I')
+
+
+# --- Check ---
+
+def _preview(value, width=40):
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > width:
+        return value[:width] + '...'
+    return value
+
+
+def check(db_path, rows=0):
+    """Print the schema version, row counts, integrity and size of a database"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        print(f"{db_path}: schema version {version} (latest {db_setup.SCHEMA_VERSION})")
+
+        tables = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        for table in tables:
+            count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            print(f"  {table}: {count} rows")
+        if '_deferred_schema' in tables:
+            print("  WARNING: an import or seed was interrupted and some indexes are missing; "
+                  "run it again to rebuild them")
+
+        print(f"  quick_check: {conn.execute('PRAGMA quick_check').fetchone()[0]}")
+        stats = database_stats(db_path)
+        print(f"  file: {stats['file_bytes']} bytes ({stats['free_bytes']} free), wal: {stats['wal_bytes']} bytes")
+
+        for table in ('users', 'messages'):
+            if not rows or table not in tables:
+                continue
+            cursor = conn.execute(f"SELECT * FROM {table} ORDER BY id LIMIT ?", (rows,))
+            print(f"\n{table}: {', '.join(column[0] for column in cursor.description)}")
+            for row in cursor:
+                print(tuple(_preview(value) for value in row))
+    finally:
+        conn.close()
+
+
+# --- Dump encoding ---
+
+def _json_value(value):
+    if isinstance(value, bytes):
+        return {"$b64": base64.b64encode(value).decode('ascii')}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value["$b64"])
+    return value
+
+
+def _ndjson_header(header):
+    return json.dumps(header).encode('utf-8') + b'\n'
+
+
+def _ndjson_rows(table, columns, rows):
+    lines = [
+        json.dumps({"table": table, **{column: _json_value(value) for column, value in zip(columns, row)}},
+                   separators=(',', ':'))
+        for row in rows
+    ]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _frame_header(header):
+    return wire.frame(HEADER, json.dumps(header).encode('utf-8'))
+
+
+def _pack_value(value, parts):
+    if value is None:
+        parts.append(b'\x00')
+    elif isinstance(value, int):
+        parts.append(_INT_VALUE.pack(_INT, value))
+    elif isinstance(value, float):
+        parts.append(_FLOAT_VALUE.pack(_FLOAT, value))
+    else:
+        tag = _TEXT if isinstance(value, str) else _BLOB
+        data = value.encode('utf-8') if tag == _TEXT else bytes(value)
+        parts.append(_LENGTH.pack(tag, len(data)))
+        parts.append(data)
+
+
+def _frame_rows(table_index, rows):
+    parts = [_ROWS_HEAD.pack(table_index, len(rows))]
+    for row in rows:
+        for value in row:
+            _pack_value(value, parts)
+    return wire.frame(ROWS, b''.join(parts))
+
+
+def _unpack_rows(body, width):
+    """Rows of a ROWS frame body as (table index, [tuple, ...]); raises ValueError"""
+    try:
+        table_index, count = _ROWS_HEAD.unpack_from(body, 0)
+        offset = _ROWS_HEAD.size
+        rows = []
+        for _ in range(count):
+            row = []
+            for _ in range(width):
+                tag = body[offset]
+                offset += 1
+                if tag == _NULL:
+                    row.append(None)
+                elif tag == _INT:
+                    row.append(_I64.unpack_from(body, offset)[0])
+                    offset += _I64.size
+                elif tag == _FLOAT:
+                    row.append(_F64.unpack_from(body, offset)[0])
+                    offset += _F64.size
+                elif tag in (_TEXT, _BLOB):
+                    length = _U32.unpack_from(body, offset)[0]
+                    offset += _U32.size
+                    if offset + length > len(body):
+                        raise ValueError("truncated value")
+                    data = body[offset:offset + length]
+                    offset += length
+                    row.append(data.decode('utf-8') if tag == _TEXT else data)
+                else:
+                    raise ValueError(f"unknown value tag {tag}")
+            rows.append(tuple(row))
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ValueError("malformed ROWS frame")
+    return table_index, rows
+
+
+def _batched(records, batch_size):
+    """Group (table, columns, row) records into (table, columns, rows) batches"""
+    table, columns, rows = None, None, []
+    for record_table, record_columns, row in records:
+        if record_table != table or len(rows) >= batch_size:
+            if rows:
+                yield table, columns, rows
+            table, columns, rows = record_table, record_columns, []
+        rows.append(row)
+    if rows:
+        yield table, columns, rows
+
+
+def _read_ndjson(stream, batch_size):
+    header = json.loads(stream.readline())
+
+    def records():
+        for line in stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            table = record.pop("table")
+            columns = header["tables"][table]
+            yield table, columns, tuple(_from_json(record.get(column)) for column in columns)
+
+    return header, _batched(records(), batch_size)
+
+
+def _read_frames(stream):
+    frames = wire.read_frames(stream)
+    kind, body = next(frames, (None, None))
+    if kind != HEADER:
+        raise ValueError("binary dump doesn't start with a HEADER frame")
+    header = json.loads(bytes(body))
+    tables = list(header["tables"].items())
+
+    def batches():
+        for kind, body in frames:
+            if kind != ROWS:
+                continue  # unknown kinds are skipped, as in wire.py
+            if not body or body[0] >= len(tables):
+                raise ValueError("ROWS frame for a table missing from the header")
+            table, columns = tables[body[0]]
+            _table_index, rows = _unpack_rows(body, len(columns))
+            yield table, columns, rows
+
+    return header, batches()
+
+
+def read_dump(stream, batch_size=BATCH_SIZE):
+    """
+    Open a dump in either format from a buffered binary file object.
+    Returns (header, iterator of (table, columns, rows) batches).
+    """
+    first = stream.peek(1)[:1]
+    if first == bytes([HEADER]):
+        header, batches = _read_frames(stream)
+    else:
+        header, batches = _read_ndjson(stream, batch_size)
+    if header.get("format") != DUMP_FORMAT or header.get("version") != DUMP_VERSION:
+        raise ValueError("Not an echo dump, or a dump version this tool can't read")
+    return header, batches
+
+
+# --- Export ---
+
+def export(db_path, out, fmt='ndjson', batch_size=BATCH_SIZE):
+    """Stream users, message_bodies and messages to the binary file object out; returns rows per table"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # One snapshot across all three tables, even with the app writing
+        conn.execute("BEGIN")
+        cursor = conn.cursor()
+        tables = {table: db_setup.table_columns(cursor, table) for table in EXPORT_TABLES}
+        tables = {table: columns for table, columns in tables.items() if columns}
+        if fmt == 'binary':
+            table_index = {table: index for index, table in enumerate(tables)}
+            encode_header = _frame_header
+            encode_rows = lambda table, columns, rows: _frame_rows(table_index[table], rows)  # noqa: E731
+        else:
+            encode_header, encode_rows = _ndjson_header, _ndjson_rows
+        out.write(encode_header({
+            "format": DUMP_FORMAT,
+            "version": DUMP_VERSION,
+            "schema_version": conn.execute("PRAGMA user_version").fetchone()[0],
+            "tables": {table: list(columns) for table, columns in tables.items()},
+        }))
+
+        counts = {}
+        for table, columns in tables.items():
+            counts[table] = 0
+            cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                out.write(encode_rows(table, columns, rows))
+                counts[table] += len(rows)
+        conn.execute("COMMIT")
+        return counts
+    finally:
+        conn.close()
+
+
+# --- Import ---
+
+def restore_deferred(conn):
+    """
+    Recreate the indexes and triggers a BulkLoader dropped and recompute
+    inbox_summary, in one transaction. Returns the seconds it took.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = '_deferred_schema'").fetchone():
+        return 0.0
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for (sql,) in conn.execute("SELECT sql FROM _deferred_schema").fetchall():
+            conn.execute(sql)
+        # The insert trigger that maintains it was off during the load
+        conn.execute("DELETE FROM inbox_summary")
+        conn.execute('''
+            INSERT INTO inbox_summary (receiver_id, sender_id, unread_count, last_message_id)
+            SELECT receiver_id, sender_id, SUM(read_at IS NULL), MAX(id)
+            FROM messages
+            GROUP BY receiver_id, sender_id
+        ''')
+        conn.execute("DROP TABLE _deferred_schema")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return time.perf_counter() - started
+
+
+class BulkLoader:
+    """
+    Inserts batches with executemany, committing every `txn_rows` rows.
+    With defer_indexes, the secondary indexes on the loaded tables and the
+    triggers on messages are dropped until close(), which rebuilds them.
+    Use as a context manager; call stats() afterwards.
+    """
+
+    def __init__(self, db_path, txn_rows=TXN_ROWS, defer_indexes=True):
+        db_setup.migrate(db_path)
+        self.txn_rows = txn_rows
+        self.counts = collections.Counter()
+        self.index_seconds = 0.0
+        self._pending = 0
+        self._columns = {}
+        self._conn = sqlite3.connect(db_path, isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout = {config.DB_BUSY_TIMEOUT_MS}")
+        self._conn.execute(f"PRAGMA cache_size = {config.DB_CACHE_SIZE}")
+        self._conn.execute("BEGIN IMMEDIATE")
+        if defer_indexes:
+            self._defer()
+        self._started = time.perf_counter()
+        self._elapsed = None
+
+    def _defer(self):
+        conn = self._conn
+        conn.execute("CREATE TABLE IF NOT EXISTS _deferred_schema (name TEXT PRIMARY KEY, sql TEXT NOT NULL)")
+        deferred = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL AND ("
+            f"(type = 'index' AND tbl_name IN ({', '.join('?' * len(EXPORT_TABLES))})) "
+            "OR (type = 'trigger' AND tbl_name = 'messages'))",
+            EXPORT_TABLES
+        ).fetchall()
+        for kind, name, sql in deferred:
+            conn.execute("INSERT OR REPLACE INTO _deferred_schema (name, sql) VALUES (?, ?)", (name, sql))
+            conn.execute(f"DROP {kind.upper()} {name}")
+
+    def _table_columns(self, table):
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Can't load table {table!r}")
+        if table not in self._columns:
+            self._columns[table] = db_setup.table_columns(self._conn.cursor(), table)
+        return self._columns[table]
+
+    def insert(self, table, columns, rows, skip_existing=True):
+        """Insert rows (tuples in `columns` order); columns the table doesn't have are dropped"""
+        target = self._table_columns(table)
+        keep = [index for index, column in enumerate(columns) if column in target]
+        if len(keep) < len(columns):
+            rows = [tuple(row[index] for index in keep) for row in rows]
+        names = [columns[index] for index in keep]
+        self._conn.executemany(
+            f"INSERT {'OR IGNORE ' if skip_existing else ''}INTO {table} ({', '.join(names)}) "
+            f"VALUES ({', '.join('?' * len(names))})",
+            rows
+        )
+        self.counts[table] += len(rows)
+        self._pending += len(rows)
+        if self._pending >= self.txn_rows:
+            self._conn.execute("COMMIT")
+            self._pending = 0
+            total = sum(self.counts.values())
+            print(f"  loaded {total} rows ({total / (time.perf_counter() - self._started):.0f} rows/s)")
+            self._conn.execute("BEGIN IMMEDIATE")
+
+    def close(self, commit=True):
+        """Commit (or roll back) the last transaction and rebuild what was deferred"""
+        try:
+            if self._conn.in_transaction:
+                self._conn.execute("COMMIT" if commit else "ROLLBACK")
+            self._elapsed = time.perf_counter() - self._started
+            self.index_seconds = restore_deferred(self._conn)
+        finally:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+    def stats(self):
+        elapsed = self._elapsed if self._elapsed is not None else time.perf_counter() - self._started
+        total = sum(self.counts.values())
+        return {
+            "rows": dict(self.counts),
+            "load_seconds": round(elapsed, 3),
+            "rows_per_sec": round(total / elapsed) if elapsed else None,
+            "index_seconds": round(self.index_seconds, 3),
+        }
+
+
+def import_dump(db_path, stream, batch_size=BATCH_SIZE, txn_rows=TXN_ROWS, defer_indexes=True):
+    """Load a dump from a buffered binary file object; returns BulkLoader.stats()"""
+    _header, batches = read_dump(stream, batch_size)
+    with BulkLoader(db_path, txn_rows, defer_indexes) as loader:
+        for table, columns, rows in batches:
+            loader.insert(table, columns, rows)
+    return loader.stats()
+
+
+# --- Seed ---
+
+_recipient_keys = {}
+
+
+def _generate_key_pairs(count):
+    return [crypto_utils.generate_rsa_key_pair() for _ in range(count)]
+
+
+def _init_encrypt_worker(public_keys):
+    global _recipient_keys
+    _recipient_keys = public_keys
+
+
+def _encrypt_messages(task):
+    """
+    Seal `payload` characters of random text for each (sender_id, receiver_id)
+    pair, as message rows. Text, because decrypt_message() returns a str.
+    """
+    pairs, payload = task
+    rows = []
+    for sender_id, receiver_id in pairs:
+        text = ''.join(random.choices(SEED_ALPHABET, k=payload))
+        sealed = crypto_utils.encrypt_message(_recipient_keys[receiver_id], text)
+        rows.append((
+            sender_id,
+            receiver_id,
+            base64.b64decode(sealed['encrypted_message']),
+            base64.b64decode(sealed['encrypted_key']),
+            base64.b64decode(sealed['nonce']),
+        ))
+    return rows
+
+
+def _bounded_map(pool, fn, tasks, window):
+    """pool.map() that keeps at most `window` tasks in flight instead of submitting them all"""
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def seed(db_path, users, messages, payload=256, workers=None, password=SEED_PASSWORD, prefix='seed',
+         keys_out=None, batch_size=BATCH_SIZE, txn_rows=TXN_ROWS, defer_indexes=True, rng_seed=None):
+    """
+    Add `users` users, each with a freshly generated RSA key pair, and
+    `messages` messages between random pairs of them, encrypted to the
+    receiver's key like the client does. Key generation and encryption run
+    on `workers` processes. All seeded users share `password`. If keys_out
+    is given, {"username", "private_key"} lines are written to it so load
+    tests can read what they fetch. Returns counts and rows/s per phase.
+    """
+    workers = workers or os.cpu_count() or 1
+    rng = random.Random(rng_seed)
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(config.BCRYPT_ROUNDS))
+
+    db_setup.migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0] + 1
+    finally:
+        conn.close()
+
+    public_keys = {}
+    result = {"users": users, "messages": messages, "workers": workers}
+    with BulkLoader(db_path, txn_rows, defer_indexes) as loader:
+        started = time.perf_counter()
+        # Small chunks keep every process busy to the end
+        chunk = max(1, min(64, users // (workers * 4)))
+        counts = [min(chunk, users - start) for start in range(0, users, chunk)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            user_id = first_id
+            batch = []
+            for key_pairs in _bounded_map(pool, _generate_key_pairs, counts, workers * 2):
+                for key_pair in key_pairs:
+                    username = f"{prefix}{user_id:07d}"
+                    public_keys[user_id] = key_pair['public_key']
+                    batch.append((user_id, username, password_hash, key_pair['public_key']))
+                    if keys_out is not None:
+                        keys_out.write(json.dumps({"username": username, "private_key": key_pair['private_key']}) + '\n')
+                    user_id += 1
+                if len(batch) >= batch_size:
+                    loader.insert('users', ('id', 'username', 'password_hash', 'public_key'), batch, skip_existing=False)
+                    batch = []
+            if batch:
+                loader.insert('users', ('id', 'username', 'password_hash', 'public_key'), batch, skip_existing=False)
+        elapsed = time.perf_counter() - started
+        result.update(users_seconds=round(elapsed, 3), users_per_sec=round(users / elapsed) if elapsed else None)
+        print(f"  {users} users with RSA keys in {elapsed:.1f}s ({result['users_per_sec']} rows/s)")
+
+        if messages and users:
+            started = time.perf_counter()
+            chunk = min(batch_size, 1000)
+
+            def tasks():
+                for start in range(0, messages, chunk):
+                    pairs = [
+                        (first_id + rng.randrange(users), first_id + rng.randrange(users))
+                        for _ in range(min(chunk, messages - start))
+                    ]
+                    yield pairs, payload
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_encrypt_worker,
+                                     initargs=(public_keys,)) as pool:
+                for rows in _bounded_map(pool, _encrypt_messages, tasks(), workers * 2):
+                    loader.insert('messages', ('sender_id', 'receiver_id', 'encrypted_message', 'encrypted_key', 'iv'),
+                                  rows, skip_existing=False)
+            elapsed = time.perf_counter() - started
+            result.update(messages_seconds=round(elapsed, 3),
+                          messages_per_sec=round(messages / elapsed) if elapsed else None)
+            print(f"  {messages} encrypted messages in {elapsed:.1f}s ({result['messages_per_sec']} rows/s)")
+    result["index_seconds"] = round(loader.index_seconds, 3)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect, export, import and seed the Echo database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    check_cmd = commands.add_parser('check', help='schema version, row counts, integrity and size')
+    check_cmd.add_argument('--db', default=config.DATABASE)
+    check_cmd.add_argument('--rows', type=int, default=0, help='also print the first N users and messages')
 
-conn = sqlite3.connect('encrypted_echo.db')
-cursor = conn.cursor()
+    export_cmd = commands.add_parser('export', help='stream users and messages to a dump')
+    export_cmd.add_argument('--db', default=config.DATABASE)
+    export_cmd.add_argument('--format', choices=FORMATS, default='ndjson')
+    export_cmd.add_argument('-o', '--output', default='-', help="dump file ('-' = stdout)")
+    export_cmd.add_argument('--batch-size', type=int, default=BATCH_SIZE)
 
-cursor.execute("SELECT * FROM users")
-rows = cursor.fetchall()
-for row in rows:
-    print(row)
+    import_cmd = commands.add_parser('import', help='load a dump (either format) into a database (app stopped)')
+    import_cmd.add_argument('dump', nargs='?', default='-', help="dump file ('-' = stdin)")
+    import_cmd.add_argument('--db', default=config.DATABASE)
+    import_cmd.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    import_cmd.add_argument('--txn-rows', type=int, default=TXN_ROWS, help='rows per transaction')
+    import_cmd.add_argument('--keep-indexes', action='store_true',
+                            help="maintain indexes row by row instead of rebuilding them at the end")
 
-cursor.execute("SELECT * FROM messages")
-rows = cursor.fetchall()
-for row in rows:
-    print(row)
+    seed_cmd = commands.add_parser('seed', help='add synthetic users and encrypted messages (app stopped)')
+    seed_cmd.add_argument('--db', default=config.DATABASE)
+    seed_cmd.add_argument('--users', type=int, required=True)
+    seed_cmd.add_argument('--messages', type=int, default=0)
+    seed_cmd.add_argument('--payload', type=int, default=256, help='characters of random text per message')
+    seed_cmd.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='key generation/encryption processes')
+    seed_cmd.add_argument('--password', default=SEED_PASSWORD, help='password of every seeded user')
+    seed_cmd.add_argument('--prefix', default='seed', help='usernames are <prefix><id>')
+    seed_cmd.add_argument('--keys-out', help='write each user\'s private key here as NDJSON')
+    seed_cmd.add_argument('--txn-rows', type=int, default=TXN_ROWS, help='rows per transaction')
+    seed_cmd.add_argument('--keep-indexes', action='store_true')
+    seed_cmd.add_argument('--seed', type=int, default=None, help='random seed for sender/receiver pairs')
+    args = parser.parse_args()
 
-conn.close()
\ No newline at end of file
+    if args.command == 'check':
+        check(args.db, args.rows)
+    elif args.command == 'export':
+        started = time.perf_counter()
+        if args.output == '-':
+            counts = export(args.db, sys.stdout.buffer, args.format, args.batch_size)
+            sys.stdout.buffer.flush()
+        else:
+            with open(args.output, 'wb', buffering=1 << 20) as out:
+                counts = export(args.db, out, args.format, args.batch_size)
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        # stdout may be the dump itself
+        print(f"Exported {counts} in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)", file=sys.stderr)
+    elif args.command == 'import':
+        stream = sys.stdin.buffer if args.dump == '-' else open(args.dump, 'rb', buffering=1 << 20)
+        try:
+            stats = import_dump(args.db, stream, args.batch_size, args.txn_rows, not args.keep_indexes)
+        finally:
+            stream.close()
+        print(f"Imported {stats['rows']} in {stats['load_seconds']}s ({stats['rows_per_sec']} rows/s), "
+              f"indexes rebuilt in {stats['index_seconds']}s")
+    else:
+        keys_out = open(args.keys_out, 'w') if args.keys_out else None
+        try:
+            stats = seed(args.db, args.users, args.messages, payload=args.payload, workers=args.workers,
+                         password=args.password, prefix=args.prefix, keys_out=keys_out,
+                         txn_rows=args.txn_rows, defer_indexes=not args.keep_indexes, rng_seed=args.seed)
+        finally:
+            if keys_out is not None:
+                keys_out.close()
+        print(json.dumps(stats, indent=2))
@@ -0,0 +1,47 @@
+"""
+Shared fixtures. config.py reads the ECHO_* settings when the app is first
+imported, so they are pointed at a scratch database here, before any test
+module imports it.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_scratch = tempfile.mkdtemp(prefix='echo-tests-')
+os.environ.update({
+    'ECHO_DATABASE': os.path.join(_scratch, 'test.db'),
+    'ECHO_BLOB_MIGRATION_AUTOSTART': '0',
+    'ECHO_RETENTION_INTERVAL': '0',
+    'ECHO_KEY_POOL_SIZE': '0',
+    'ECHO_BCRYPT_ROUNDS': '4',
+    'ECHO_SECRET_KEY': 'test-secret',
+    'ECHO_LOG_LEVEL': 'WARNING',
+})
+
+_usernames = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def echo_app():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(echo_app):
+    return echo_app.app.test_client()
+
+
+def register(client, prefix='user'):
+    """Register a fresh user; returns their username"""
+    username = f"{prefix}{next(_usernames):05d}"
+    response = client.post('/register', json={'username': username, 'password': 'test-password',
+                                               'public_key': 'PK'})
+    assert response.status_code == 201, response.get_json()
+    return username
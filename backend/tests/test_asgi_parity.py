@@ -0,0 +1,261 @@
+"""
+The sync (Flask) and async (asgi_app.py) entry points must behave the same.
+Every test here runs once through Flask's test client and once through the
+ASGI app via httpx's ASGITransport, where /messages/stream is served
+natively on the event loop instead of by the Flask route.
+"""
+import asyncio
+import base64
+import itertools
+import json
+import threading
+import time
+from collections import namedtuple
+
+import httpx
+import pytest
+
+MESSAGE = {
+    'encrypted_msg': base64.b64encode(b'ciphertext').decode('ascii'),
+    'encrypted_key': base64.b64encode(b'key').decode('ascii'),
+    'iv': base64.b64encode(b'nonce').decode('ascii'),
+}
+
+_usernames = itertools.count(1)
+
+
+class Result(namedtuple('Result', ['status', 'content_type', 'data'])):
+    def json(self):
+        return json.loads(self.data)
+
+
+class FlaskClient:
+    def __init__(self, echo_app):
+        self.client = echo_app.app.test_client()
+
+    def request(self, method, path, json=None, headers=None):
+        response = self.client.open(path, method=method, json=json, headers=headers)
+        return Result(response.status_code, response.content_type or '', response.get_data())
+
+
+class ASGIClient:
+    """Synchronous facade over an httpx.AsyncClient running on its own event loop"""
+
+    def __init__(self, asgi_app):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='asgi-test-loop', daemon=True)
+        self.thread.start()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url='http://testserver')
+
+    def request(self, method, path, json=None, headers=None):
+        response = asyncio.run_coroutine_threadsafe(
+            self.client.request(method, path, json=json, headers=headers), self.loop
+        ).result(timeout=30)
+        return Result(response.status_code, response.headers.get('content-type', ''), response.content)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+@pytest.fixture(scope='module')
+def asgi_client(echo_app):
+    import asgi_app
+    client = ASGIClient(asgi_app.app)
+    yield client
+    client.close()
+
+
+@pytest.fixture(params=['wsgi', 'asgi'])
+def http(request, echo_app):
+    if request.param == 'wsgi':
+        return FlaskClient(echo_app)
+    return request.getfixturevalue('asgi_client')
+
+
+def register(http, public_key='PK'):
+    username = f"parity{next(_usernames):05d}"
+    result = http.request('POST', '/register', json={'username': username, 'password': 'pw', 'public_key': public_key})
+    assert result.status == 201, result.data
+    return username
+
+
+def login(http, username):
+    result = http.request('POST', '/login', json={'username': username, 'password': 'pw'})
+    assert result.status == 200, result.data
+    return result.json()['token']
+
+
+def bearer(token):
+    return {'Authorization': f"Bearer {token}"}
+
+
+def send(http, sender, receiver):
+    result = http.request('POST', '/send', json={'sender': sender, 'receiver': receiver, **MESSAGE})
+    assert result.status == 201, result.data
+
+
+def inbox_ids(http, username):
+    return [msg['id'] for msg in http.request('GET', f'/messages?username={username}').json()['messages']]
+
+
+# --- Accounts and keys ---
+
+def test_register_rejects_duplicates_and_missing_fields(http):
+    username = register(http)
+    assert http.request('POST', '/register', json={'username': username, 'password': 'pw'}).status == 400
+    assert http.request('POST', '/register', json={'username': 'no-password'}).status == 400
+
+
+def test_login(http):
+    username = register(http)
+    result = http.request('POST', '/login', json={'username': username, 'password': 'pw'})
+    assert result.status == 200
+    assert sorted(result.json()) == ['expires_in', 'message', 'token', 'user_id']
+    assert http.request('POST', '/login', json={'username': username, 'password': 'nope'}).status == 401
+
+
+def test_public_keys(http):
+    alice, bob = register(http, 'PK-A'), register(http, 'PK-B')
+    result = http.request('GET', f'/user_public_key?username={bob}')
+    assert result.status == 200 and result.json()['public_key'] == 'PK-B'
+
+    result = http.request('POST', '/user_public_keys', json={'usernames': [alice, bob, 'nobody']})
+    assert result.json()['missing'] == ['nobody']
+    assert [key['username'] for key in result.json()['keys']] == [alice, bob]
+
+
+def test_users_prefix_search(http):
+    username = register(http)
+    result = http.request('GET', f'/users?q={username}')
+    assert result.status == 200
+    assert [user['username'] for user in result.json()['users']] == [username]
+
+
+# --- Sending and reading ---
+
+def test_send_and_page_messages(http):
+    alice, bob = register(http), register(http)
+    send(http, alice, bob)
+    send(http, alice, bob)
+
+    result = http.request('GET', f'/messages?username={bob}')
+    assert result.status == 200
+    messages = result.json()['messages']
+    assert [msg['sender'] for msg in messages] == [alice, alice]
+    assert messages[0]['encrypted_msg'] == MESSAGE['encrypted_msg']
+
+    page = http.request('GET', f'/messages?username={bob}&limit=1').json()
+    assert len(page['messages']) == 1 and page['has_more']
+
+    lines = http.request('GET', f'/messages?username={bob}&format=ndjson').data.decode('utf-8').splitlines()
+    assert [json.loads(line)['id'] for line in lines[:2]] == [msg['id'] for msg in messages]
+
+    assert http.request('GET', '/messages?username=nobody').status == 400
+
+
+def test_send_rejects_bad_base64(http):
+    alice, bob = register(http), register(http)
+    result = http.request('POST', '/send', json={'sender': alice, 'receiver': bob, **MESSAGE, 'iv': '!!'})
+    assert result.status == 400
+
+
+def test_send_batch_reports_each_message(http):
+    alice, bob = register(http), register(http)
+    result = http.request('POST', '/send_batch', json={'sender': alice, 'messages': [
+        {'receiver': bob, **MESSAGE},
+        {'receiver': 'nobody', **MESSAGE},
+    ]})
+    body = result.json()
+    assert (body['sent'], body['failed']) == (1, 1)
+    assert [item['status'] for item in body['results']] == ['sent', 'failed']
+
+
+# --- Session tokens ---
+
+def test_token_authenticates_message_routes(http):
+    alice, bob = register(http), register(http)
+    alice_token, bob_token = login(http, alice), login(http, bob)
+
+    assert http.request('POST', '/send', json={'receiver': bob, **MESSAGE}, headers=bearer(alice_token)).status == 201
+    result = http.request('GET', '/messages', headers=bearer(bob_token))
+    assert [msg['sender'] for msg in result.json()['messages']] == [alice]
+    assert http.request('GET', '/inbox', headers=bearer(bob_token)).json()['unread_count'] == 1
+    result = http.request('GET', f'/conversation?with={alice}', headers=bearer(bob_token))
+    assert len(result.json()['messages']) == 1
+
+    result = http.request('POST', '/refresh', headers=bearer(bob_token))
+    assert result.status == 200 and result.json()['token']
+
+
+def test_token_errors(http):
+    alice, bob = register(http), register(http)
+    alice_token = login(http, alice)
+    result = http.request('POST', '/send', json={'sender': bob, 'receiver': alice, **MESSAGE},
+                          headers=bearer(alice_token))
+    assert result.status == 403
+    assert http.request('GET', '/messages', headers=bearer('not-a-token')).status == 401
+    assert http.request('GET', '/messages/stream?timeout=0', headers=bearer('not-a-token')).status == 401
+
+
+# --- /messages/stream ---
+
+def test_stream_validates_arguments(http):
+    username = register(http)
+    assert http.request('GET', '/messages/stream').status == 400
+    assert http.request('GET', f'/messages/stream?username={username}&since_id=x').status == 400
+    assert http.request('GET', '/messages/stream?username=nobody').status == 400
+
+
+def test_stream_backlog_and_timeout(http):
+    alice, bob = register(http), register(http)
+    send(http, alice, bob)
+    ids = inbox_ids(http, bob)
+
+    result = http.request('GET', f'/messages/stream?username={bob}&since_id=0&timeout=0')
+    assert result.status == 200
+    assert [msg['id'] for msg in result.json()['messages']] == ids
+
+    result = http.request('GET', f'/messages/stream?username={bob}&since_id={ids[0]}&timeout=0')
+    assert result.status == 200 and result.json()['messages'] == []
+
+    result = http.request('GET', '/messages/stream?since_id=0&timeout=0', headers=bearer(login(http, bob)))
+    assert [msg['id'] for msg in result.json()['messages']] == ids
+
+
+def test_stream_sse_backlog(http):
+    alice, bob = register(http), register(http)
+    send(http, alice, bob)
+    result = http.request('GET', f'/messages/stream?username={bob}&since_id=0&timeout=0',
+                          headers={'Accept': 'text/event-stream'})
+    assert result.status == 200
+    assert result.content_type.startswith('text/event-stream')
+    assert f"id: {inbox_ids(http, bob)[0]}" in result.data.decode('utf-8')
+
+
+def test_long_poll_woken_by_send(http):
+    alice, bob = register(http), register(http)
+    send(http, bob, alice)
+    since_id = inbox_ids(http, alice)[0]
+
+    woken = {}
+    waiter = threading.Thread(target=lambda: woken.update(
+        result=http.request('GET', f'/messages/stream?username={alice}&since_id={since_id}&timeout=10')
+    ))
+    started = time.monotonic()
+    waiter.start()
+    time.sleep(0.3)
+    send(http, bob, alice)
+    waiter.join(timeout=15)
+
+    assert time.monotonic() - started < 5
+    messages = woken['result'].json()['messages']
+    assert [msg['id'] for msg in messages] == [max(inbox_ids(http, alice))]
+
+
+def test_crypto_demo(http):
+    result = http.request('POST', '/crypto_demo', json={'message': 'hello'})
+    assert result.status == 200
+    body = result.json()
+    assert body['original'] == body['decrypted'] == 'hello'
@@ -0,0 +1,81 @@
+import os
+
+import config
+import crypto_utils
+from conftest import register
+
+
+def _encrypted(plaintext):
+    return b''.join(crypto_utils.encrypt_stream(crypto_utils.generate_aes_key(), [plaintext], chunk_size=1024))
+
+
+def _login(client, username):
+    token = client.post('/login', json={'username': username, 'password': 'test-password'}).get_json()['token']
+    return {'Authorization': f"Bearer {token}"}
+
+
+def _upload(client, query, body, headers=None):
+    return client.post(f'/attachments?{query}', data=body, content_type='application/octet-stream',
+                       headers={'X-Encrypted-Key': 'wrapped', **(headers or {})})
+
+
+def test_upload_and_download(client):
+    alice, bob, carol = register(client), register(client), register(client)
+    body = _encrypted(os.urandom(5000))
+
+    response = _upload(client, f'sender={alice}&receiver={bob}', body)
+    assert response.status_code == 201, response.get_json()
+    attachment_id = response.get_json()['attachment_id']
+    assert response.get_json()['size'] == len(body)
+
+    for username in (alice, bob):
+        response = client.get(f'/attachments/{attachment_id}?username={username}')
+        assert response.status_code == 200
+        assert response.get_data() == body
+        assert response.headers['X-Encrypted-Key'] == 'wrapped' and response.headers['X-Sender'] == alice
+    assert client.get(f'/attachments/{attachment_id}?username={carol}').status_code == 404
+
+
+def test_upload_rejects_bodies_that_are_not_encrypted_streams(client):
+    alice, bob = register(client), register(client)
+    assert _upload(client, f'sender={alice}&receiver={bob}', b'plain text, not a stream').status_code == 400
+    assert _upload(client, f'sender={alice}&receiver=nobody', _encrypted(b'x')).status_code == 400
+
+
+def test_tokens_are_checked_against_sender_and_username(client):
+    alice, bob, carol = register(client), register(client), register(client)
+    alice_auth, carol_auth = _login(client, alice), _login(client, carol)
+    body = _encrypted(b'attachment')
+
+    assert _upload(client, f'sender={bob}&receiver={carol}', body, alice_auth).status_code == 403
+    response = _upload(client, f'receiver={bob}', body, alice_auth)
+    assert response.status_code == 201
+    attachment_id = response.get_json()['attachment_id']
+
+    assert client.get(f'/attachments/{attachment_id}', headers=alice_auth).get_data() == body
+    assert client.get(f'/attachments/{attachment_id}?username={bob}', headers=alice_auth).status_code == 403
+    assert client.get(f'/attachments/{attachment_id}', headers=carol_auth).status_code == 404
+
+
+def test_auth_required_refuses_usernames_alone(client, monkeypatch):
+    alice, bob = register(client), register(client)
+    attachment_id = _upload(client, f'sender={alice}&receiver={bob}', _encrypted(b'x')).get_json()['attachment_id']
+
+    monkeypatch.setattr(config, 'AUTH_REQUIRED', 1)
+    assert _upload(client, f'sender={alice}&receiver={bob}', _encrypted(b'x')).status_code == 401
+    assert client.get(f'/attachments/{attachment_id}?username={bob}').status_code == 401
+    assert client.get(f'/attachments/{attachment_id}', headers=_login(client, bob)).status_code == 200
+
+
+def test_downloads_do_not_depend_on_the_working_directory(client, tmp_path, monkeypatch):
+    alice, bob = register(client), register(client)
+    body = _encrypted(b'attachment')
+
+    monkeypatch.chdir(tmp_path)
+    attachment_id = _upload(client, f'sender={alice}&receiver={bob}', body).get_json()['attachment_id']
+    assert os.listdir(tmp_path) == []  # stored next to the database instead
+
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    assert client.get(f'/attachments/{attachment_id}?username={bob}').get_data() == body
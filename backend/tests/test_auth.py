@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from auth import Identity, SessionTokens, TokenError
+from conftest import register
+
+
+class Clock:
+    def __init__(self, monkeypatch):
+        self.now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: self.now)
+
+
+def test_refresh_stops_at_the_session_limit(monkeypatch):
+    clock = Clock(monkeypatch)
+    tokens = SessionTokens('secret', ttl=900, refresh_window=3600)
+    token = tokens.issue(1, 'alice')
+
+    clock.now += 1000
+    with pytest.raises(TokenError):
+        tokens.verify(token)
+    identity, token = tokens.refresh(token)  # expired, but the session isn't
+    assert identity == Identity(1, 'alice')
+    assert tokens.verify(token) == identity
+
+    # Refreshing again doesn't move the limit, which counts from the login
+    clock.now += 2500
+    _identity, token = tokens.refresh(token)
+    clock.now += 200
+    assert tokens.verify(token) == identity
+    with pytest.raises(TokenError):
+        tokens.refresh(token)
+
+
+def test_refresh_route_rejects_tokens_past_the_session_limit(echo_app, client, monkeypatch):
+    username = register(client)
+    user_id = client.post('/login', json={'username': username, 'password': 'test-password'}).get_json()['user_id']
+
+    clock = Clock(monkeypatch)
+    clock.now -= echo_app.tokens.refresh_window + 60
+    token = echo_app.tokens.issue(user_id, username)
+    clock.now += echo_app.tokens.refresh_window + 60
+
+    response = client.post('/refresh', headers={'Authorization': f"Bearer {token}"})
+    assert response.status_code == 401
+
+    token = echo_app.tokens.issue(user_id, username)
+    response = client.post('/refresh', headers={'Authorization': f"Bearer {token}"})
+    assert response.status_code == 200 and response.get_json()['user_id'] == user_id
@@ -0,0 +1,70 @@
+import base64
+import sqlite3
+
+import blob_migration
+import db_setup
+import shards
+
+
+def _insert_text_messages(db_path, count):
+    """Messages stored the old way, as base64 TEXT"""
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv) VALUES (1, 2, ?, ?, ?)",
+            [tuple(base64.b64encode(f"{field}-{i}".encode()).decode('ascii') for field in ('msg', 'key', 'iv'))
+             for i in range(count)]
+        )
+
+
+def _stored(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT id, encrypted_message, encrypted_key, iv FROM messages ORDER BY id").fetchall()
+
+
+def test_converts_text_rows_to_blobs(tmp_path):
+    db_path = str(tmp_path / 'echo.db')
+    db_setup.migrate(db_path)
+    _insert_text_messages(db_path, 5)
+
+    assert blob_migration.run(db_path, batch_size=2) == {'messages': 5, 'message_bodies': 0}
+    assert [row[1:] for row in _stored(db_path)] == [(f"msg-{i}".encode(), f"key-{i}".encode(), f"iv-{i}".encode())
+                                                   for i in range(5)]
+    assert all(state['done'] for state in blob_migration.progress(db_path).values())
+    assert blob_migration.start_background([db_path]) is None
+
+
+def test_resumes_from_its_checkpoint(tmp_path):
+    db_path = str(tmp_path / 'echo.db')
+    db_setup.migrate(db_path)
+    _insert_text_messages(db_path, 5)
+
+    # Interrupted after its first batch
+    conn = sqlite3.connect(db_path)
+    last_id, converted = blob_migration.migrate_batch(conn, 'messages', 0, 2)
+    conn.close()
+    assert (last_id, converted) == (2, 2)
+    assert blob_migration.progress(db_path)['messages'] == {'last_id': 2, 'done': False}
+
+    # Rows before the checkpoint aren't read again
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE messages SET encrypted_message = 'bWFya2Vy' WHERE id = 1")
+    assert blob_migration.run(db_path)['messages'] == 3
+    stored = _stored(db_path)
+    assert stored[0][1] == 'bWFya2Vy'
+    assert all(isinstance(value, bytes) for row in stored[1:] for value in row[1:])
+
+
+def test_migrates_shard_files(tmp_path):
+    db_path = str(tmp_path / 'echo.db')
+    db_setup.migrate(db_path)
+    paths = [shards.shard_path(str(tmp_path / 'shards'), index) for index in range(2)]
+    for index, path in enumerate(paths):
+        shards.setup_shard(path, index)
+        _insert_text_messages(path, 3)
+
+    thread = blob_migration.start_background([db_path] + paths, pause=0)
+    thread.join(timeout=10)
+
+    for path in paths:
+        assert all(isinstance(value, bytes) for row in _stored(path) for value in row[1:])
+        assert blob_migration.progress(path)['messages']['done']
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+import crypto_utils
+from crypto_utils import PublicKeyCache
+
+
+def test_public_key_cache_follows_key_changes():
+    cache = PublicKeyCache(maxsize=2)
+    first, second, third = (crypto_utils.generate_rsa_key_pair()['public_key'] for _ in range(3))
+
+    key = cache.get(first)
+    assert cache.get(first) is key
+    # A rotated key is a different PEM, so it can't be served the old entry
+    assert cache.get(second).public_numbers() != key.public_numbers()
+    cache.get(third)
+    assert len(cache) == 2
+    assert cache.get(first) is not key  # evicted, parsed again
+
+
+def test_encrypt_message_round_trip():
+    key_pair = crypto_utils.generate_rsa_key_pair()
+    sealed = crypto_utils.encrypt_message(key_pair['public_key'], 'hello')
+    assert crypto_utils.decrypt_message(
+        key_pair['private_key'], sealed['encrypted_message'], sealed['encrypted_key'], sealed['nonce']
+    ) == 'hello'
+
+
+def _sealed(plaintext, chunk_size=1024):
+    key = crypto_utils.generate_aes_key()
+    pieces = [plaintext[i:i + 300] for i in range(0, len(plaintext), 300)] or [b'']
+    return key, b''.join(crypto_utils.encrypt_stream(key, pieces, chunk_size=chunk_size))
+
+
+def _opened(key, data, piece=500):
+    return b''.join(crypto_utils.decrypt_stream(key, (data[i:i + piece] for i in range(0, len(data), piece))))
+
+
+@pytest.mark.parametrize('size', [0, 1, 1023, 1024, 3072, 5000])
+def test_stream_round_trip(size):
+    plaintext = os.urandom(size)
+    key, data = _sealed(plaintext)
+    segments = max(1, -(-size // 1024))
+    assert len(data) == crypto_utils.STREAM_HEADER_SIZE + size + segments * crypto_utils.STREAM_TAG_SIZE
+    assert _opened(key, data) == plaintext
+
+
+def test_stream_truncated_at_a_segment_boundary_fails():
+    key, data = _sealed(os.urandom(3000))
+    segment = 1024 + crypto_utils.STREAM_TAG_SIZE
+    with pytest.raises(InvalidTag):
+        _opened(key, data[:crypto_utils.STREAM_HEADER_SIZE + 2 * segment])
+    with pytest.raises(ValueError):
+        _opened(key, data[:crypto_utils.STREAM_HEADER_SIZE - 1])
+
+
+@pytest.mark.parametrize('offset', [5, crypto_utils.STREAM_HEADER_SIZE + 10, -1])
+def test_stream_tampering_fails(offset):
+    key, data = _sealed(os.urandom(3000))
+    tampered = bytearray(data)
+    tampered[offset] ^= 1
+    with pytest.raises(InvalidTag):
+        _opened(key, bytes(tampered))
+
+
+def test_stream_segments_cannot_be_reordered():
+    key, data = _sealed(os.urandom(3000))
+    header, segment = crypto_utils.STREAM_HEADER_SIZE, 1024 + crypto_utils.STREAM_TAG_SIZE
+    first, second = data[header:header + segment], data[header + segment:header + 2 * segment]
+    with pytest.raises(InvalidTag):
+        _opened(key, data[:header] + second + first + data[header + 2 * segment:])
+
+
+def test_encrypt_for_recipients_wraps_one_key_per_recipient():
+    key_pairs = [crypto_utils.generate_rsa_key_pair() for _ in range(3)]
+    sealed = crypto_utils.encrypt_for_recipients([pair['public_key'] for pair in key_pairs], 'hello all')
+
+    assert len(sealed['encrypted_keys']) == 3
+    for key_pair, encrypted_key in zip(key_pairs, sealed['encrypted_keys']):
+        assert crypto_utils.decrypt_message(
+            key_pair['private_key'], sealed['encrypted_message'], encrypted_key, sealed['nonce']
+        ) == 'hello all'
+    # Each wrapped key opens only for its own recipient
+    with pytest.raises(ValueError):
+        crypto_utils.decrypt_message(
+            key_pairs[0]['private_key'], sealed['encrypted_message'], sealed['encrypted_keys'][1], sealed['nonce']
+        )
@@ -0,0 +1,91 @@
+import base64
+import sqlite3
+import time
+
+import config
+from conftest import register
+
+MESSAGE = {
+    'encrypted_msg': base64.b64encode(b'ciphertext').decode('ascii'),
+    'encrypted_key': base64.b64encode(b'key').decode('ascii'),
+    'iv': base64.b64encode(b'nonce').decode('ascii'),
+}
+
+
+def _send(client, sender, receiver, count=1):
+    for _ in range(count):
+        assert client.post('/send', json={'sender': sender, 'receiver': receiver, **MESSAGE}).status_code == 201
+
+
+def _inbox(client, username):
+    body = client.get(f'/inbox?username={username}').get_json()
+    return body['unread_count'], {c['sender']: c['unread_count'] for c in body['conversations']}
+
+
+def _message_ids(client, username):
+    return [msg['id'] for msg in client.get(f'/messages?username={username}').get_json()['messages']]
+
+
+def _ack(client, username, **body):
+    response = client.post('/messages/ack', json={'username': username, **body})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['updated']
+
+
+def test_unread_counts_follow_sends_and_acks(client):
+    alice, bob, carol = register(client), register(client), register(client)
+    _send(client, alice, carol, 3)
+    _send(client, bob, carol, 2)
+    assert _inbox(client, carol) == (5, {alice: 3, bob: 2})
+
+    conversations = client.get(f'/inbox?username={carol}').get_json()['conversations']
+    assert [c['sender'] for c in conversations] == [bob, alice]  # newest first
+    assert conversations[0]['last_message_id'] == max(_message_ids(client, carol))
+
+    # Delivered isn't read
+    bob_ids = [msg['id'] for msg in client.get(f'/conversation?username={carol}&with={bob}').get_json()['messages']]
+    assert _ack(client, carol, ids=bob_ids, state='delivered') == 2
+    assert _inbox(client, carol) == (5, {alice: 3, bob: 2})
+
+    assert _ack(client, carol, ids=bob_ids[:1]) == 1
+    assert _ack(client, carol, ids=bob_ids[:1]) == 0  # acking twice changes nothing
+    assert _inbox(client, carol) == (4, {alice: 3, bob: 1})
+
+    alice_ids = sorted(msg['id'] for msg in
+                       client.get(f'/conversation?username={carol}&with={alice}').get_json()['messages'])
+    assert _ack(client, carol, **{'with': alice, 'up_to_id': alice_ids[1]}) == 2
+    assert _inbox(client, carol) == (2, {alice: 1, bob: 1})
+
+
+def test_only_the_receiver_can_ack(client):
+    alice, bob = register(client), register(client)
+    _send(client, alice, bob)
+    assert _ack(client, alice, ids=_message_ids(client, bob)) == 0
+    assert _inbox(client, bob) == (1, {alice: 1})
+
+
+def test_expired_messages_are_not_counted(client):
+    alice, bob = register(client), register(client)
+    _send(client, alice, bob, 3)
+    ids = sorted(_message_ids(client, bob))
+
+    # Expired, but not yet deleted by the reaper
+    with sqlite3.connect(config.DATABASE) as conn:
+        conn.execute("UPDATE messages SET expires_at = ? WHERE id IN (?, ?)", (int(time.time()) - 1, *ids[:2]))
+    assert _message_ids(client, bob) == ids[2:]
+    assert _inbox(client, bob) == (1, {alice: 1})
+
+
+def test_deleting_messages_updates_the_summary(client):
+    alice, bob = register(client), register(client)
+    _send(client, alice, bob, 2)
+    ids = sorted(_message_ids(client, bob))
+
+    with sqlite3.connect(config.DATABASE) as conn:
+        conn.execute("DELETE FROM messages WHERE id = ?", (ids[1],))
+    conversations = client.get(f'/inbox?username={bob}').get_json()['conversations']
+    assert conversations == [{'sender': alice, 'unread_count': 1, 'last_message_id': ids[0]}]
+
+    with sqlite3.connect(config.DATABASE) as conn:
+        conn.execute("DELETE FROM messages WHERE id = ?", (ids[0],))
+    assert client.get(f'/inbox?username={bob}').get_json() == {'conversations': [], 'unread_count': 0}
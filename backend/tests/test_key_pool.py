@@ -0,0 +1,42 @@
+import itertools
+import time
+
+from key_pool import KeyPairPool
+
+
+def test_pool_starts_on_first_get_and_then_hits():
+    counter = itertools.count()
+    pool = KeyPairPool(high_water=4, low_water=2, workers=0, generate=lambda: {'n': next(counter)})
+    try:
+        assert pool._thread is None and pool.available() == 0
+
+        first = pool.get()  # miss: generated inline, starts the refill thread
+        assert pool._thread is not None
+        deadline = time.monotonic() + 5
+        while pool.available() < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.available() == 4
+
+        second = pool.get()
+        assert first != second and pool.available() == 3
+    finally:
+        pool.shutdown()
+
+
+def test_disabled_pool_generates_inline():
+    pool = KeyPairPool(high_water=0, workers=0, generate=lambda: {'n': 1})
+    assert pool.get() == {'n': 1}
+    assert pool._thread is None
+
+
+def test_worker_processes_come_from_a_fork_server():
+    pool = KeyPairPool(high_water=1, low_water=1, workers=1)
+    try:
+        pool.get()
+        deadline = time.monotonic() + 10
+        while pool.available() < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.available() == 1
+        assert pool._executor._mp_context.get_start_method() == 'forkserver'
+    finally:
+        pool.shutdown()
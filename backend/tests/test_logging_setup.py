@@ -0,0 +1,68 @@
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+
+from logging_setup import JsonFormatter, SamplingFilter, _DeferredQueueHandler, fields
+
+
+def _record(level=logging.INFO, msg="hello", args=(), **values):
+    record = logging.LogRecord('encrypted_echo.test', level, __file__, 1, msg, args, None)
+    if values:
+        record.fields = values
+    return record
+
+
+def test_secrets_are_redacted_and_long_fields_truncated():
+    line = JsonFormatter(max_field_chars=8).format(_record(
+        sender_id=1,
+        password='hunter2',
+        payload={'encrypted_msg': 'A' * 100, 'receiver': 'bob', 'token': None},
+        items=[{'iv': 'nonce'}, 'a much longer string'],
+        raw=b'\x00' * 5,
+    ))
+    entry = json.loads(line)
+
+    assert entry['msg'] == 'hello' and entry['level'] == 'INFO'
+    assert entry['sender_id'] == 1
+    assert entry['password'] == '<redacted 7 chars>'
+    assert entry['payload'] == {'encrypted_msg': '<redacted 100 chars>', 'receiver': 'bob', 'token': None}
+    assert entry['items'] == [{'iv': '<redacted 5 chars>'}, 'a much l...<12 more>']
+    assert entry['raw'] == '<5 bytes>'
+    assert 'hunter2' not in line and 'AAAA' not in line
+
+
+def test_sampling_drops_only_low_severity_records():
+    drop_all = SamplingFilter(0.0)
+    assert not drop_all.filter(_record(logging.INFO))
+    assert drop_all.filter(_record(logging.WARNING))
+    assert SamplingFilter(1.0).filter(_record(logging.DEBUG))
+
+
+def test_records_are_formatted_on_the_listener_thread():
+    formatted_on = []
+
+    class Payload:
+        def __str__(self):
+            formatted_on.append(threading.current_thread())
+            return 'payload'
+
+    out = io.StringIO()
+    writer = logging.StreamHandler(out)
+    writer.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, writer)
+    logger = logging.getLogger('encrypted_echo_test_queue')
+    logger.propagate = False
+    logger.addHandler(_DeferredQueueHandler(records))
+    listener.start()
+    try:
+        logger.warning("sent %s", Payload(), extra=fields(token='secret'))
+    finally:
+        listener.stop()
+
+    entry = json.loads(out.getvalue())
+    assert entry['msg'] == 'sent payload' and entry['token'] == '<redacted 6 chars>'
+    assert formatted_on and formatted_on[0] is not threading.current_thread()
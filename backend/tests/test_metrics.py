@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+from metrics import InstrumentedConnection, registry
+
+
+def _observations(statement):
+    histogram = registry.snapshot().histograms.get(
+        ('sqlite_query_duration_seconds', (('statement', statement),))
+    )
+    return sum(histogram[:-1]) if histogram else 0
+
+
+@pytest.mark.parametrize('run', [
+    lambda conn: conn.execute("SELECT 1"),
+    lambda conn: conn.cursor().execute("SELECT 1"),
+], ids=['connection', 'cursor'])
+def test_execute_is_timed(run):
+    conn = sqlite3.connect(':memory:', factory=InstrumentedConnection)
+    before = _observations('SELECT')
+    assert run(conn).fetchone() == (1,)
+    assert _observations('SELECT') == before + 1
+
+
+@pytest.mark.parametrize('run', [
+    lambda conn, rows: conn.executemany("INSERT INTO t (x) VALUES (?)", rows),
+    lambda conn, rows: conn.cursor().executemany("INSERT INTO t (x) VALUES (?)", rows),
+], ids=['connection', 'cursor'])
+def test_executemany_is_timed(run):
+    conn = sqlite3.connect(':memory:', factory=InstrumentedConnection)
+    conn.execute("CREATE TABLE t (x)")
+    before = _observations('INSERT')
+    run(conn, [(1,), (2,)])
+    assert _observations('INSERT') == before + 1
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (2,)
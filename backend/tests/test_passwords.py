@@ -0,0 +1,32 @@
+import pytest
+
+from passwords import HasherBusy, PasswordHasher, hash_cost
+
+
+@pytest.mark.parametrize('workers', [0, 1])
+def test_hash_and_verify(workers):
+    hasher = PasswordHasher(rounds=4, workers=workers)
+    try:
+        hashed = hasher.hash('correct horse')
+        assert hash_cost(hashed) == 4 and not hasher.needs_rehash(hashed)
+        assert hasher.verify('correct horse', hashed)
+        assert not hasher.verify('wrong', hashed)
+        assert PasswordHasher(rounds=5, workers=0).needs_rehash(hashed)
+    finally:
+        hasher.shutdown()
+
+
+def test_workers_are_not_forked_from_the_app():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        hasher.hash('pw')
+        assert hasher._executor._mp_context.get_start_method() == 'forkserver'
+    finally:
+        hasher.shutdown()
+
+
+def test_full_queue_is_rejected():
+    hasher = PasswordHasher(rounds=4, workers=0, max_pending=1)
+    hasher._slots.acquire()  # one job already running
+    with pytest.raises(HasherBusy):
+        hasher.hash('pw')
@@ -0,0 +1,18 @@
+from conftest import register
+
+
+def test_public_key_revalidates_with_etag(client):
+    username = register(client)
+    response = client.get(f'/user_public_key?username={username}', headers={'Origin': 'http://localhost:4200'})
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    # Browsers only let the client read the ETag if CORS exposes it
+    assert 'ETag' in response.headers['Access-Control-Expose-Headers']
+
+    response = client.get(f'/user_public_key?username={username}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    response = client.get(f'/user_public_key?username={username}', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert response.get_json()['public_key'] == 'PK'
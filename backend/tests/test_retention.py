@@ -0,0 +1,80 @@
+import os
+import sqlite3
+
+import db_setup
+import retention
+
+
+def _add_messages(db_path, expires_at, count, body_size=0):
+    with sqlite3.connect(db_path) as conn:
+        body_id = conn.execute(
+            "INSERT INTO message_bodies (sender_id, encrypted_message, iv) VALUES (1, ?, x'01')",
+            (os.urandom(body_size),)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv, body_id, expires_at) "
+            "VALUES (1, 2, ?, x'02', x'01', ?, ?)",
+            [(os.urandom(body_size), body_id, expires_at) for _ in range(count)]
+        )
+
+
+def _count(db_path, table):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_reaper_deletes_only_expired_messages(tmp_path):
+    db_path = str(tmp_path / 'echo.db')
+    db_setup.migrate(db_path)
+    _add_messages(db_path, 100, 7)   # expired, body shared by all seven
+    _add_messages(db_path, 200, 2)   # expires later
+    _add_messages(db_path, None, 1)  # kept forever
+
+    reaper = retention.RetentionReaper([db_path], interval=0, batch_size=3, pause=0)
+    assert reaper.run_once(now=150) == {db_path: 7}
+    assert _count(db_path, 'messages') == 3
+    assert _count(db_path, 'message_bodies') == 2
+    assert reaper.stats()['deleted']['messages'] == 7 and reaper.stats()['deleted']['message_bodies'] == 1
+
+    assert reaper.run_once(now=150) == {db_path: 0}
+    assert reaper.run_once(now=200) == {db_path: 2}
+    assert _count(db_path, 'messages') == 1
+
+
+def test_a_body_is_kept_while_a_message_still_uses_it(tmp_path):
+    db_path = str(tmp_path / 'echo.db')
+    db_setup.migrate(db_path)
+    _add_messages(db_path, 100, 2)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE messages SET expires_at = 300 WHERE id = 2")
+
+    conn = retention._connect(db_path)
+    try:
+        assert retention.reap_batch(conn, 150) == (1, 0)
+        assert retention.reap_batch(conn, 300) == (1, 1)
+    finally:
+        conn.close()
+
+
+def test_vacuum_shrinks_the_file(tmp_path):
+    db_path = str(tmp_path / 'echo.db')
+    db_setup.migrate(db_path)
+    _add_messages(db_path, 100, 200, body_size=4096)
+    assert retention.database_stats(db_path)['auto_vacuum'] == 'incremental'
+    before = retention.database_stats(db_path)
+
+    reaper = retention.RetentionReaper([db_path], interval=0, pause=0, vacuum_pages=100000)
+    reaper.run_once(now=150)
+    after = retention.database_stats(db_path)
+    assert reaper.stats()['deleted']['vacuum_pages'] > 0
+    assert after['free_bytes'] == 0
+    assert after['file_bytes'] < before['file_bytes'] // 4
+
+
+def test_full_vacuum_enables_incremental_mode(tmp_path):
+    db_path = str(tmp_path / 'old.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    assert retention.database_stats(db_path)['auto_vacuum'] == 'none'
+    retention.full_vacuum(db_path)
+    assert retention.database_stats(db_path)['auto_vacuum'] == 'incremental'
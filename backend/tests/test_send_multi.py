@@ -0,0 +1,55 @@
+import sqlite3
+
+import config
+import crypto_utils
+from conftest import register
+
+
+def _body_count():
+    with sqlite3.connect(config.DATABASE) as conn:
+        return conn.execute("SELECT COUNT(*) FROM message_bodies").fetchone()[0]
+
+
+def _latest(client, username):
+    return client.get(f'/messages?username={username}&limit=1').get_json()['messages'][0]
+
+
+def test_one_body_is_stored_for_every_recipient(client):
+    alice, bob, carol = register(client), register(client), register(client)
+    key_pairs = {name: crypto_utils.generate_rsa_key_pair() for name in (bob, carol)}
+    sealed = crypto_utils.encrypt_for_recipients([pair['public_key'] for pair in key_pairs.values()], 'hi both')
+    before = _body_count()
+
+    response = client.post('/send_multi', json={
+        'sender': alice,
+        'encrypted_msg': sealed['encrypted_message'],
+        'iv': sealed['nonce'],
+        'recipients': [
+            {'receiver': name, 'encrypted_key': encrypted_key}
+            for name, encrypted_key in zip(key_pairs, sealed['encrypted_keys'])
+        ] + [{'receiver': 'nobody', 'encrypted_key': sealed['encrypted_keys'][0]}, {'receiver': bob}],
+    })
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['sent'], body['failed']) == (2, 2)
+    assert [item['status'] for item in body['results']] == ['sent', 'sent', 'failed', 'failed']
+    assert _body_count() == before + 1
+
+    for name, key_pair in key_pairs.items():
+        message = _latest(client, name)
+        assert message['sender'] == alice
+        assert message['encrypted_msg'] == sealed['encrypted_message'] and message['iv'] == sealed['nonce']
+        assert crypto_utils.decrypt_message(
+            key_pair['private_key'], message['encrypted_msg'], message['encrypted_key'], message['iv']
+        ) == 'hi both'
+    assert body['results'][0]['id'] == _latest(client, bob)['id']
+
+
+def test_send_multi_validates_the_request(client):
+    alice, bob = register(client), register(client)
+    message = {'sender': alice, 'encrypted_msg': 'bXNn', 'iv': 'aXY='}
+    assert client.post('/send_multi', json={**message, 'recipients': []}).status_code == 400
+    assert client.post('/send_multi', json={**message, 'iv': '!!', 'recipients': [
+        {'receiver': bob, 'encrypted_key': 'a2V5'}]}).status_code == 400
+    assert client.post('/send_multi', json={**message, 'sender': 'nobody', 'recipients': [
+        {'receiver': bob, 'encrypted_key': 'a2V5'}]}).status_code == 400
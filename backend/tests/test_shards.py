@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+import db_setup
+import shards
+
+
+def _messages(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT id, receiver_id, body_id FROM messages ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def single_file(tmp_path):
+    db_path = str(tmp_path / 'echo.db')
+    db_setup.migrate(db_path)
+    with sqlite3.connect(db_path) as conn:
+        body_id = conn.execute(
+            "INSERT INTO message_bodies (sender_id, encrypted_message, iv) VALUES (1, x'00', x'01')"
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO messages (sender_id, receiver_id, encrypted_message, encrypted_key, iv, body_id) "
+            "VALUES (1, ?, x'00', x'02', x'01', ?)",
+            [(receiver_id, body_id if receiver_id in (2, 3) else None) for receiver_id in range(1, 9)]
+        )
+    return db_path
+
+
+def test_router_picks_a_shard_per_receiver(tmp_path):
+    router = shards.ShardRouter(str(tmp_path / 'echo.db'), str(tmp_path / 'shards'), 3, size=1)
+    try:
+        assert [router.shard_for(receiver_id) for receiver_id in range(6)] == [0, 1, 2, 0, 1, 2]
+        assert router.pool_for(4) is router.pools[1]
+
+        # Each shard allocates ids from its own range
+        for index, path in enumerate(router.paths):
+            with sqlite3.connect(path) as conn:
+                message_id = conn.execute(
+                    "INSERT INTO messages (sender_id, receiver_id) VALUES (1, ?)", (index,)
+                ).lastrowid
+            assert message_id >> shards.ID_SPACE_BITS == index
+    finally:
+        router.close()
+
+
+def test_rebalance_splits_by_receiver_and_keeps_ids(single_file, tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    counts = shards.rebalance(single_file, shard_dir, 2, batch_size=3)
+    paths = [shards.shard_path(shard_dir, index) for index in range(2)]
+    assert counts == {path: 4 for path in paths}
+
+    source = _messages(single_file)
+    for index, path in enumerate(paths):
+        assert _messages(path) == [row for row in source if row[1] % 2 == index]
+    # The shared body is copied to both shards its receivers hash to
+    for path in paths:
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM message_bodies").fetchone()[0] == 1
+
+    # New ids continue after the copied ones, in every shard
+    with sqlite3.connect(paths[0]) as conn:
+        assert conn.execute("INSERT INTO messages (sender_id, receiver_id) VALUES (1, 2)").lastrowid > source[-1][0]
+
+    # Re-running copies nothing twice
+    assert shards.rebalance(single_file, shard_dir, 2) == {path: 5 if path == paths[0] else 4 for path in paths}
+
+
+def test_rebalance_can_empty_the_source(single_file, tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    source = _messages(single_file)
+    counts = shards.rebalance(single_file, shard_dir, 2, delete_source=True)
+    assert sum(counts.values()) == len(source)
+    assert _messages(single_file) == []
+    with sqlite3.connect(single_file) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM message_bodies").fetchone()[0] == 0
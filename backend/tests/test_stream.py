@@ -0,0 +1,101 @@
+"""/messages/stream through Flask's test client: long-poll and SSE"""
+import base64
+import threading
+import time
+
+from werkzeug.test import EnvironBuilder
+
+from conftest import register
+
+MESSAGE = {
+    'encrypted_msg': base64.b64encode(b'ciphertext').decode('ascii'),
+    'encrypted_key': base64.b64encode(b'key').decode('ascii'),
+    'iv': base64.b64encode(b'nonce').decode('ascii'),
+}
+
+
+def send(client, sender, receiver):
+    response = client.post('/send', json={'sender': sender, 'receiver': receiver, **MESSAGE})
+    assert response.status_code == 201, response.get_json()
+
+
+def inbox(client, username):
+    """Messages in id order"""
+    return sorted(client.get(f'/messages?username={username}').get_json()['messages'], key=lambda msg: msg['id'])
+
+
+def test_long_poll_returns_when_a_message_arrives(echo_app, client):
+    alice, bob = register(client), register(client)
+    send(client, alice, bob)
+    since_id = inbox(client, bob)[-1]['id']
+
+    result = {}
+
+    def poll():
+        response = echo_app.app.test_client().get(f'/messages/stream?username={bob}&since_id={since_id}&timeout=10')
+        result.update(status=response.status_code, body=response.get_json(), elapsed=time.monotonic() - started)
+
+    started = time.monotonic()
+    waiter = threading.Thread(target=poll)
+    waiter.start()
+    time.sleep(0.3)
+    send(client, alice, bob)
+    waiter.join(timeout=15)
+
+    latest = inbox(client, bob)[-1]['id']
+    assert result['status'] == 200
+    assert result['elapsed'] < 5
+    assert [msg['id'] for msg in result['body']['messages']] == [latest]
+    assert result['body']['next_cursor'] == latest
+
+
+def test_long_poll_times_out_empty(client):
+    alice, bob = register(client), register(client)
+    send(client, alice, bob)
+    since_id = inbox(client, bob)[-1]['id']
+
+    started = time.monotonic()
+    response = client.get(f'/messages/stream?username={bob}&since_id={since_id}&timeout=1')
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 200
+    assert response.get_json() == {'messages': [], 'next_cursor': since_id, 'has_more': False}
+    assert 0.9 <= elapsed < 5
+
+
+def test_sse_resumes_from_last_event_id_without_duplicates(echo_app, client):
+    alice, bob = register(client), register(client)
+    for _ in range(3):
+        send(client, alice, bob)
+    delivered = inbox(client, bob)
+    bob_id = client.post('/login', json={'username': bob, 'password': 'test-password'}).get_json()['user_id']
+
+    response = client.get(f'/messages/stream?username={bob}&timeout=1', buffered=False, headers={
+        'Accept': 'text/event-stream',
+        'Last-Event-ID': str(delivered[0]['id']),
+    })
+    assert response.status_code == 200
+    # Subscribed and caught up: a message the catch-up query already
+    # returned can still reach the hub (sent between the two), then a new one
+    echo_app.hub.publish(bob_id, delivered[-1])
+    send(client, alice, bob)
+    body = response.get_data(as_text=True)
+    response.close()
+
+    event_ids = [int(line[len('id: '):]) for line in body.splitlines() if line.startswith('id: ')]
+    assert event_ids == [msg['id'] for msg in delivered[1:]] + [inbox(client, bob)[-1]['id']]
+
+
+def test_sse_client_leaving_before_the_first_event_leaves_no_subscription(echo_app, client):
+    alice, bob = register(client), register(client)
+    send(client, alice, bob)
+    before = echo_app.hub.subscriber_count()
+
+    # Straight through WSGI: the test client would read the first chunk itself
+    environ = EnvironBuilder(f'/messages/stream?username={bob}&since_id=0&timeout=30',
+                             headers={'Accept': 'text/event-stream'}).get_environ()
+    statuses = []
+    body = echo_app.app.wsgi_app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    assert statuses == ['200 OK']
+    body.close()  # the server saw the client disconnect before sending anything
+    assert echo_app.hub.subscriber_count() == before
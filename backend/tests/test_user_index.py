@@ -0,0 +1,31 @@
+import sqlite3
+
+from user_index import UsernameIndex
+
+
+def _users_table(*users):
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE)")
+    conn.executemany("INSERT INTO users (id, username) VALUES (?, ?)", users)
+    return conn
+
+
+def test_prefix_page_and_lookup():
+    index = UsernameIndex().load(_users_table((1, 'carl'), (2, 'bob'), (3, 'bobby'), (4, 'alice')))
+    assert index.page(prefix='bob') == [(2, 'bob'), (3, 'bobby')]
+    assert index.page(after='bob', limit=2) == [(3, 'bobby'), (1, 'carl')]
+    assert index.lookup('alice') == 4
+    assert index.lookup('dave') is None
+
+
+def test_refresh_finds_lower_id_registered_elsewhere():
+    # Another worker commits id 2 while this one registers id 3
+    conn = _users_table((1, 'a'))
+    index = UsernameIndex(refresh_interval=0).load(conn)
+    conn.executemany("INSERT INTO users (id, username) VALUES (?, ?)", [(2, 'bob'), (3, 'carl')])
+    index.add(3, 'carl')
+    index.refresh(lambda: conn)
+
+    assert index.page() == [(1, 'a'), (2, 'bob'), (3, 'carl')]
+    assert index.lookup('bob') == 2
+    assert len(index) == 3
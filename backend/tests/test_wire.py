@@ -0,0 +1,65 @@
+import io
+
+import pytest
+
+import wire
+
+
+def test_send_round_trip():
+    body = wire.encode_send('alice', 'bøb', b'\x00ciphertext', b'key', b'nonce', ttl=60)
+    assert wire.decode_send(body) == {
+        'sender': 'alice', 'receiver': 'bøb', 'encrypted_msg': b'\x00ciphertext',
+        'encrypted_key': b'key', 'iv': b'nonce', 'ttl': 60,
+    }
+    # Empty optional fields come back absent
+    decoded = wire.decode_send(wire.encode_send('alice', 'bob', b'ciphertext'))
+    assert (decoded['encrypted_key'], decoded['iv'], decoded['ttl']) == (None, None, None)
+
+
+def test_messages_round_trip():
+    rows = [
+        {'id': 1, 'sender': 'alice', 'encrypted_message': b'one', 'encrypted_key': b'k1', 'iv': b'n1'},
+        # Legacy rows still hold base64 TEXT
+        {'id': 2 << 40, 'sender': 'bob', 'encrypted_message': 'dHdv', 'encrypted_key': 'azI=', 'iv': 'bjI='},
+    ]
+    data = b''.join(wire.encode_message(row) for row in rows) + wire.encode_page_end(2 << 40, True)
+    messages, next_cursor, has_more = wire.decode_messages(data)
+    assert messages == [
+        {'id': 1, 'sender': 'alice', 'encrypted_msg': b'one', 'encrypted_key': b'k1', 'iv': b'n1'},
+        {'id': 2 << 40, 'sender': 'bob', 'encrypted_msg': b'two', 'encrypted_key': b'k2', 'iv': b'n2'},
+    ]
+    assert (next_cursor, has_more) == (2 << 40, True)
+    assert wire.decode_messages(wire.encode_page_end(None, False)) == ([], None, False)
+
+
+def test_unknown_frames_are_skipped():
+    data = wire.frame(99, b'from a newer server') + wire.encode_send('alice', 'bob', b'msg')
+    assert wire.decode_send(data)['encrypted_msg'] == b'msg'
+    assert wire.decode_messages(wire.frame(99, b'') + wire.encode_page_end(5, False)) == ([], 5, False)
+
+
+@pytest.mark.parametrize('cut', [1, 4, 10])
+def test_truncated_frames_are_rejected(cut):
+    data = wire.encode_send('alice', 'bob', b'ciphertext')
+    with pytest.raises(ValueError):
+        wire.decode_send(data[:-cut])
+    with pytest.raises(ValueError):
+        list(wire.read_frames(io.BytesIO(data[:-cut])))
+
+
+def test_short_frame_bodies_are_rejected():
+    # The frame itself is complete, but its fields claim more than it holds
+    with pytest.raises(ValueError):
+        wire.decode_messages(wire.frame(wire.MESSAGE, b'\x00' * 8 + b'\x00\x05ab'))
+    with pytest.raises(ValueError):
+        wire.decode_send(wire.frame(wire.SEND, b'\x00\x02\xff\xfe'))
+    with pytest.raises(ValueError):
+        wire.decode_send(wire.encode_send('a', 'b', b'x') * 2)
+
+
+def test_read_frames_from_a_stream():
+    frames = [(wire.SEND, b'first'), (wire.PAGE_END, b''), (7, b'x' * 70000)]
+    stream = io.BufferedReader(io.BytesIO(b''.join(wire.frame(kind, body) for kind, body in frames)))
+    assert [(kind, bytes(body)) for kind, body in wire.read_frames(stream)] == frames
+    assert [(kind, bytes(body)) for kind, body in wire.iter_frames(b''.join(
+        wire.frame(kind, body) for kind, body in frames))] == frames
@@ -0,0 +1,97 @@
+import sqlite3
+import time
+
+import pytest
+
+from db_pool import ConnectionPool
+from metrics import registry
+from write_queue import GroupCommitWriter, WriterClosed
+
+INSERT = "INSERT INTO t (x) VALUES (?)"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'writes.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, x UNIQUE)")
+    return path
+
+
+@pytest.fixture
+def writer(db_path):
+    writer = GroupCommitWriter(ConnectionPool(db_path, size=2), max_batch=16, max_latency=0.05)
+    yield writer
+    writer.shutdown()
+
+
+def _values(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {x for (x,) in conn.execute("SELECT x FROM t")}
+
+
+def _queued_behind_lock(db_path, writer, statements):
+    """
+    Submit statements while another connection holds the write lock, so
+    they queue up behind a first insert and commit as one group.
+    """
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    first = writer.submit(INSERT, ('first',))
+    time.sleep(0.1)  # the writer is now waiting for the lock
+    futures = [writer.submit(sql, parameters) for sql, parameters in statements]
+    blocker.execute("COMMIT")
+    blocker.close()
+    first.result(timeout=5)
+    return futures
+
+
+def _batches():
+    return registry.snapshot().counters.get(('write_batches_total', ()), 0)
+
+
+def test_queued_statements_share_one_commit(db_path, writer):
+    before = _batches()
+    futures = _queued_behind_lock(db_path, writer, [(INSERT, (i,)) for i in range(10)])
+    rowids = [future.result(timeout=5) for future in futures]
+
+    assert _batches() == before + 2  # the first insert, then the other ten together
+    assert len(set(rowids)) == 10
+    assert _values(db_path) == {'first', *range(10)}
+
+
+def test_failed_statement_fails_only_its_own_future(db_path, writer):
+    futures = _queued_behind_lock(db_path, writer, [(INSERT, ('a',)), (INSERT, ('first',)), (INSERT, ('b',))])
+
+    assert futures[0].result(timeout=5) and futures[2].result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(timeout=5)
+    assert _values(db_path) == {'first', 'a', 'b'}
+
+
+def test_error_that_rolls_back_the_transaction_fails_the_group(db_path, writer):
+    futures = _queued_behind_lock(db_path, writer, [
+        (INSERT, ('a',)),
+        ("INSERT OR ROLLBACK INTO t (x) VALUES (?)", ('first',)),
+        (INSERT, ('b',)),
+    ])
+
+    for future in futures:
+        with pytest.raises(sqlite3.Error):
+            future.result(timeout=5)
+    assert _values(db_path) == {'first'}
+
+    # The writer carries on with the next group
+    assert writer.submit(INSERT, ('c',)).result(timeout=5)
+    assert _values(db_path) == {'first', 'c'}
+
+
+def test_shutdown_commits_queued_statements(db_path):
+    writer = GroupCommitWriter(ConnectionPool(db_path, size=1))
+    futures = [writer.submit(INSERT, (i,)) for i in range(5)]
+    writer.shutdown()
+
+    assert all(future.done() for future in futures)
+    assert _values(db_path) == set(range(5))
+    with pytest.raises(WriterClosed):
+        writer.submit(INSERT, (6,))
@@ -0,0 +1,92 @@
+"""
+Sorted in-memory username index for the /users directory and typeahead.
+
+Usernames live in one sorted list with their ids in a parallel list, so a
+prefix search or a keyset page is two bisects and a slice, however many
+users there are. register() adds names as they are created; registrations
+made by other worker processes are picked up by refresh(), which only reads
+users with an id above the highest one load() or refresh() has read.
+add() doesn't move that mark: another worker may have committed a lower id
+that this one hasn't read yet.
+"""
+import bisect
+import threading
+import time
+
+# Sorts after any character a username can continue with, so
+# [prefix, prefix + PREFIX_END) is the range of names starting with prefix.
+# SQLite's BINARY collation orders UTF-8 the same way.
+PREFIX_END = '\U0010ffff'
+
+
+class UsernameIndex:
+    def __init__(self, refresh_interval=1.0):
+        self.refresh_interval = refresh_interval
+        self._names = []
+        self._ids = []
+        self._refreshed_id = 0  # every user up to this id has been read from the table
+        self._lock = threading.Lock()
+        self._refreshed = 0.0  # time.monotonic() of the last refresh
+
+    def load(self, conn):
+        """Read every username; startup only, one pass over the users table"""
+        rows = conn.execute("SELECT id, username FROM users ORDER BY username").fetchall()
+        with self._lock:
+            self._ids = [row[0] for row in rows]
+            self._names = [row[1] for row in rows]
+            self._refreshed_id = max(self._ids, default=0)
+        self._refreshed = time.monotonic()
+        return self
+
+    def __len__(self):
+        return len(self._names)
+
+    def _insert(self, user_id, username):
+        # Caller holds self._lock
+        index = bisect.bisect_left(self._names, username)
+        if index < len(self._names) and self._names[index] == username:
+            return  # Already added by register() or an earlier refresh
+        self._names.insert(index, username)
+        self._ids.insert(index, user_id)
+
+    def add(self, user_id, username):
+        """Record a user registered by this process"""
+        with self._lock:
+            self._insert(user_id, username)
+
+    def lookup(self, username):
+        """Id of username, or None if the index hasn't seen it"""
+        with self._lock:
+            index = bisect.bisect_left(self._names, username)
+            if index < len(self._names) and self._names[index] == username:
+                return self._ids[index]
+        return None
+
+    def refresh(self, connect):
+        """
+        Catch up with users registered elsewhere, at most once per
+        refresh_interval. connect() is only called when a refresh is due.
+        """
+        now = time.monotonic()
+        if now - self._refreshed < self.refresh_interval:
+            return
+        self._refreshed = now
+        rows = connect().execute(
+            "SELECT id, username FROM users WHERE id > ? ORDER BY id", (self._refreshed_id,)
+        ).fetchall()
+        if rows:
+            with self._lock:
+                for user_id, username in rows:
+                    self._insert(user_id, username)
+                self._refreshed_id = max(self._refreshed_id, rows[-1][0])
+
+    def page(self, after=None, prefix='', limit=50):
+        """Up to `limit` (id, username) pairs in username order, after `after` and starting with `prefix`"""
+        with self._lock:
+            start = 0 if after is None else bisect.bisect_right(self._names, after)
+            end = len(self._names)
+            if prefix:
+                start = max(start, bisect.bisect_left(self._names, prefix))
+                end = bisect.bisect_left(self._names, prefix + PREFIX_END, start)
+            stop = min(end, start + limit)
+            return list(zip(self._ids[start:stop], self._names[start:stop]))
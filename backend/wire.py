@@ -0,0 +1,190 @@
+"""
+Length-prefixed binary framing for /send and /messages.
+
+JSON carries ciphertext, wrapped keys and IVs as base64, a third more bytes
+plus an encode/decode on each side. Clients that send
+`Content-Type: application/x-echo-frames` (or ask for it in Accept) get the
+raw bytes instead. JSON stays the default.
+
+A body is a sequence of frames. Integers are big-endian.
+
+    frame     := kind:u8 length:u32 body[length]
+    MESSAGE   := id:u64 sender:str16 encrypted_msg:bytes32 encrypted_key:bytes16 iv:bytes16
+    PAGE_END  := next_cursor:i64 (-1 = none) has_more:u8
+    SEND      := sender:str16 receiver:str16 encrypted_msg:bytes32 encrypted_key:bytes16
+                 iv:bytes16 ttl:u32 (0 = none)
+
+strN/bytesN are a uN length followed by that many bytes (UTF-8 for str);
+an empty optional field means "absent". Readers skip frames of unknown
+kinds, so new kinds can be added without breaking older clients.
+"""
+import base64
+import struct
+
+MIMETYPE = 'application/x-echo-frames'
+
+MESSAGE = 1
+PAGE_END = 2
+SEND = 3
+
+_FRAME = struct.Struct('>BI')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_PAGE_END = struct.Struct('>qB')
+
+
+def frame(kind, body):
+    return _FRAME.pack(kind, len(body)) + body
+
+
+def _raw(value):
+    """Stored binary field as bytes; legacy rows still hold base64 TEXT"""
+    if value is None:
+        return b''
+    if isinstance(value, str):
+        return base64.b64decode(value)
+    return value
+
+
+def _bytes16(value):
+    value = _raw(value)
+    return _U16.pack(len(value)) + value
+
+
+def _bytes32(value):
+    value = _raw(value)
+    return _U32.pack(len(value)) + value
+
+
+def _str16(value):
+    return _bytes16(value.encode('utf-8'))
+
+
+def encode_message(msg):
+    """MESSAGE frame for a message row (id, sender, encrypted_message, encrypted_key, iv)"""
+    return frame(MESSAGE, b''.join((
+        _U64.pack(msg['id']),
+        _str16(msg['sender']),
+        _bytes32(msg['encrypted_message']),
+        _bytes16(msg['encrypted_key']),
+        _bytes16(msg['iv']),
+    )))
+
+
+def encode_page_end(next_cursor, has_more):
+    return frame(PAGE_END, _PAGE_END.pack(-1 if next_cursor is None else next_cursor, has_more))
+
+
+def encode_send(sender, receiver, encrypted_msg, encrypted_key=None, iv=None, ttl=None):
+    """SEND frame, the binary body of a /send request"""
+    return frame(SEND, b''.join((
+        _str16(sender),
+        _str16(receiver),
+        _bytes32(encrypted_msg),
+        _bytes16(encrypted_key),
+        _bytes16(iv),
+        _U32.pack(ttl or 0),
+    )))
+
+
+class _Reader:
+    """Reads fields from one frame body, raising ValueError if it runs out"""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def _take(self, size):
+        end = self.offset + size
+        if end > len(self.data):
+            raise ValueError("truncated frame")
+        chunk = self.data[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def unpack(self, fmt):
+        values = fmt.unpack(self._take(fmt.size))
+        return values[0] if len(values) == 1 else values
+
+    def bytes(self, length_fmt):
+        return bytes(self._take(self.unpack(length_fmt))) or None
+
+    def str(self, length_fmt):
+        value = self.bytes(length_fmt)
+        try:
+            return value.decode('utf-8') if value else None
+        except UnicodeDecodeError:
+            raise ValueError("invalid UTF-8 in frame")
+
+
+def iter_frames(data):
+    """Yield (kind, body) for each frame in data"""
+    view = memoryview(data)
+    offset = 0
+    while offset < len(view):
+        if offset + _FRAME.size > len(view):
+            raise ValueError("truncated frame header")
+        kind, length = _FRAME.unpack_from(view, offset)
+        offset += _FRAME.size
+        if offset + length > len(view):
+            raise ValueError("truncated frame")
+        yield kind, view[offset:offset + length]
+        offset += length
+
+
+def read_frames(stream):
+    """Yield (kind, body) for each frame read from a binary file object, one frame in memory at a time"""
+    while True:
+        header = stream.read(_FRAME.size)
+        if not header:
+            return
+        if len(header) < _FRAME.size:
+            raise ValueError("truncated frame header")
+        kind, length = _FRAME.unpack(header)
+        body = stream.read(length)
+        if len(body) < length:
+            raise ValueError("truncated frame")
+        yield kind, body
+
+
+def decode_send(data):
+    """
+    Parse a binary /send body into the same fields as its JSON form, with
+    raw bytes for the binary ones. Raises ValueError.
+    """
+    sends = [body for kind, body in iter_frames(data) if kind == SEND]
+    if len(sends) != 1:
+        raise ValueError("expected exactly one SEND frame")
+    reader = _Reader(sends[0])
+    return {
+        "sender": reader.str(_U16),
+        "receiver": reader.str(_U16),
+        "encrypted_msg": reader.bytes(_U32),
+        "encrypted_key": reader.bytes(_U16),
+        "iv": reader.bytes(_U16),
+        "ttl": reader.unpack(_U32) or None,
+    }
+
+
+def decode_messages(data):
+    """
+    Parse a binary /messages page into (messages, next_cursor, has_more);
+    each message is a dict with raw bytes fields. Raises ValueError.
+    """
+    messages = []
+    next_cursor, has_more = None, False
+    for kind, body in iter_frames(data):
+        reader = _Reader(body)
+        if kind == MESSAGE:
+            messages.append({
+                "id": reader.unpack(_U64),
+                "sender": reader.str(_U16),
+                "encrypted_msg": reader.bytes(_U32),
+                "encrypted_key": reader.bytes(_U16),
+                "iv": reader.bytes(_U16),
+            })
+        elif kind == PAGE_END:
+            cursor, more = reader.unpack(_PAGE_END)
+            next_cursor, has_more = (None if cursor < 0 else cursor), bool(more)
+    return messages, next_cursor, has_more
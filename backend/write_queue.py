@@ -0,0 +1,138 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from logging_setup import fields, get_logger
+from metrics import registry
+
+log = get_logger('write_queue')
+
+registry.describe('write_batches_total', 'counter', 'Transactions committed by the group-commit writer')
+registry.describe('write_rows_total', 'counter', 'Statements committed by the group-commit writer')
+
+_STOP = object()
+
+
+class WriterClosed(Exception):
+    """Raised by submit() once the writer has been shut down"""
+
+
+class GroupCommitWriter:
+    """
+    Funnels INSERTs from every request thread through one writer thread,
+    which commits them in groups: a transaction closes after `max_batch`
+    statements or `max_latency` seconds after its first one, whichever
+    comes first. Statements that queue up while a commit is in progress
+    form the next group, and a single queued statement is committed
+    without waiting. Concurrent senders then share one commit (and one fsync)
+    instead of queueing on the write lock for their own.
+
+    submit() returns a Future that resolves to the row's lastrowid only
+    after its transaction has committed, or raises the statement's error.
+    A failing statement fails only its own Future and the rest of the group
+    still commits, unless its error rolled back the whole transaction (a
+    full disk, an I/O error, a busy timeout, ON CONFLICT ROLLBACK). Then
+    every statement in the group fails rather than report rows that were
+    never committed.
+    """
+
+    def __init__(self, pool, max_batch=64, max_latency=0.002):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._conn = pool.acquire()  # held by the writer thread for its lifetime
+        self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, parameters=()):
+        """Queue one statement; the Future resolves once it is committed"""
+        if self._closed:
+            raise WriterClosed("The write queue has been shut down")
+        future = Future()
+        self._queue.put((sql, parameters, future))
+        return future
+
+    def pending(self):
+        """Statements queued but not yet picked up by the writer"""
+        return self._queue.qsize()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            try:
+                # Take whatever is already queued, then wait out the latency budget
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                # A lone sender commits straight away; waiting only pays off
+                # when others are writing concurrently
+                if remaining <= 0 or len(batch) == 1:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                # Commit what we have; the loop stops on the next _collect()
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            self._commit(batch)
+
+    def _commit(self, batch):
+        cursor = self._conn.cursor()
+        done = []  # (future, rowid) for statements that succeeded
+        try:
+            for sql, parameters, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    cursor.execute(sql, parameters)
+                except sqlite3.Error as e:
+                    future.set_exception(e)
+                    if not self._conn.in_transaction:
+                        # The earlier statements went with it; fail the group below
+                        raise
+                    # SQLite undid just the failed statement
+                    continue
+                done.append((future, cursor.lastrowid))
+            self._conn.commit()
+        except Exception as e:
+            log.exception("group commit failed", extra=fields(statements=len(batch)))
+            try:
+                self._conn.rollback()
+            except sqlite3.Error:
+                pass
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        registry.inc('write_batches_total')
+        registry.inc('write_rows_total', amount=len(done))
+        for future, rowid in done:
+            future.set_result(rowid)
+
+    def shutdown(self):
+        """Commit everything already queued, then stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self.pool.release(self._conn)
@@ -1,7 +1,7 @@
 // src/app/auth.service.ts
 import { Injectable, inject, PLATFORM_ID } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable, from, catchError, switchMap, map, of } from 'rxjs';
+import { Observable, from, catchError, switchMap, map, of, tap } from 'rxjs';
 import { isPlatformBrowser } from '@angular/common';
 import { CryptoService } from '../crypto.service';
 
@@ -14,9 +14,20 @@ export interface User {
 export interface AuthResponse {
   message: string;
   user_id?: number;
+  token?: string;
+  expires_in?: number;
   error?: string;
 }
 
+interface TokenResponse {
+  user_id: number;
+  token: string;
+  expires_in: number;
+}
+
+// Refresh the session token when it has less than this long left
+const TOKEN_REFRESH_MARGIN_MS = 60 * 1000;
+
 @Injectable({
   providedIn: 'root'
 })
@@ -58,7 +69,59 @@ export class AuthService {
   }
 
   login(user: User): Observable<AuthResponse> {
-    return this.http.post<AuthResponse>(`${this.apiUrl}/login`, user);
+    return this.http.post<AuthResponse>(`${this.apiUrl}/login`, user).pipe(
+      tap(response => {
+        if (response.token && response.expires_in) {
+          this.storeToken(response.token, response.expires_in);
+        }
+      })
+    );
+  }
+
+  /**
+   * Headers authenticating an API call with the session token, refreshing
+   * the token first when it is about to expire. Empty if there is no token.
+   */
+  authHeaders(): Observable<Record<string, string>> {
+    if (!this.isBrowser) {
+      return of({});
+    }
+    const token = localStorage.getItem('token');
+    const expiresAt = Number(localStorage.getItem('token_expires_at') || 0);
+    if (!token) {
+      return of({});
+    }
+    if (expiresAt - Date.now() > TOKEN_REFRESH_MARGIN_MS) {
+      return of({ Authorization: `Bearer ${token}` });
+    }
+
+    // Trade the old token for a new one instead of asking for the password again
+    return this.http.post<TokenResponse>(`${this.apiUrl}/refresh`, null, {
+      headers: { Authorization: `Bearer ${token}` }
+    }).pipe(
+      map(response => {
+        this.storeToken(response.token, response.expires_in);
+        return { Authorization: `Bearer ${response.token}` };
+      }),
+      catchError(error => {
+        console.error('Error refreshing session token:', error);
+        this.clearToken();
+        return of({});
+      })
+    );
+  }
+
+  private storeToken(token: string, expiresIn: number): void {
+    if (!this.isBrowser) {
+      return;
+    }
+    localStorage.setItem('token', token);
+    localStorage.setItem('token_expires_at', String(Date.now() + expiresIn * 1000));
+  }
+
+  private clearToken(): void {
+    localStorage.removeItem('token');
+    localStorage.removeItem('token_expires_at');
   }
 
   /**
@@ -104,5 +167,6 @@ export class AuthService {
     localStorage.removeItem('username');
     localStorage.removeItem('user_id');
     localStorage.removeItem('privateKey');
+    this.clearToken();
   }
 }
\ No newline at end of file
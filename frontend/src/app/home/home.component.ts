@@ -4,6 +4,7 @@ import { CommonModule, isPlatformBrowser } from '@angular/common';
 import { FormBuilder, FormGroup, Validators, ReactiveFormsModule } from '@angular/forms';
 import { HttpClientModule } from '@angular/common/http';
 import { Router } from '@angular/router';
+import { Observable, catchError, debounceTime, distinctUntilChanged, map, of, switchMap } from 'rxjs';
 import { MessageService, DecryptedMessage } from '../message.service';
 import { UserService } from '../user.service';
 import { AuthService } from '../auth/auth.service';
@@ -66,20 +67,30 @@ export class HomeComponent implements OnInit {
   }
 
   loadUsers(): void {
-    this.userService.getUsers().subscribe({
-      next: (users) => {
-        // Filter out current user if we're in the browser
-        if (this.isBrowser) {
-          this.users = users.filter(user => user.username !== this.currentUser);
-        } else {
-          this.users = users;
-        }
-      },
-      error: (error) => {
+    this.searchUsers('').subscribe(users => this.showUsers(users));
+
+    // Suggest recipients matching what has been typed so far, one small
+    // page per pause in typing rather than the whole directory up front
+    this.messageForm.get('recipient')!.valueChanges.pipe(
+      debounceTime(150),
+      distinctUntilChanged(),
+      switchMap(query => this.searchUsers(query || ''))
+    ).subscribe(users => this.showUsers(users));
+  }
+
+  private searchUsers(query: string): Observable<User[]> {
+    return this.userService.getUsers(query).pipe(
+      map(page => page.users),
+      catchError(error => {
         console.error('Error loading users', error);
         this.errorMessage = 'Failed to load users. Please try again later.';
-      }
-    });
+        return of(this.users);
+      })
+    );
+  }
+
+  private showUsers(users: User[]): void {
+    this.users = users.filter(user => user.username !== this.currentUser);
   }
 
   loadMessages(): void {
@@ -101,6 +112,25 @@ export class HomeComponent implements OnInit {
     });
   }
 
+  loadNewMessages(): void {
+    if (!this.isBrowser) {
+      return; // Skip on the server side
+    }
+    
+    // Only fetch messages newer than the newest one we already have
+    const latestId = this.messages.length > 0 ? this.messages[0].id : 0;
+    this.messageService.getMessages(latestId).subscribe({
+      next: (messages) => {
+        // The delta comes back oldest first; the list is newest first
+        this.messages = [...messages.reverse(), ...this.messages];
+      },
+      error: (error) => {
+        console.error('Error loading messages', error);
+        this.errorMessage = 'Failed to load messages. Please try again later.';
+      }
+    });
+  }
+
   onSubmit(): void {
     if (this.messageForm.invalid || !this.isBrowser) {
       return;
@@ -119,7 +149,7 @@ export class HomeComponent implements OnInit {
         console.log('Message sent successfully', response);
         this.successMessage = 'Message sent successfully!';
         this.messageForm.reset();
-        this.loadMessages(); // Reload messages
+        this.loadNewMessages(); // Fetch only new messages
         this.isLoading = false;
 
         // Clear success message after 3 seconds
@@ -1,10 +1,11 @@
 // src/app/message.service.ts
 import { Injectable, inject, PLATFORM_ID } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
-import { Observable, from, of, catchError, switchMap, map } from 'rxjs';
+import { HttpClient, HttpErrorResponse } from '@angular/common/http';
+import { Observable, from, of, catchError, switchMap, map, firstValueFrom } from 'rxjs';
 import { isPlatformBrowser } from '@angular/common';
 import { CryptoService } from './crypto.service';
 import { AuthService } from './auth/auth.service';
+import { WIRE_MIMETYPE, decodePage, encodeSend } from './wire';
 
 export interface MessageResponse {
   id: number;
@@ -14,6 +15,12 @@ export interface MessageResponse {
   iv?: string;
 }
 
+export interface MessagePage {
+  messages: MessageResponse[];
+  next_cursor: number | null;
+  has_more: boolean;
+}
+
 export interface MessageRequest {
   receiver: string;
   encrypted_msg: string;
@@ -33,6 +40,11 @@ export interface UserPublicKey {
   public_key: string;
 }
 
+interface CachedPublicKey {
+  publicKey: string;
+  etag: string | null;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -40,6 +52,7 @@ export class MessageService {
   private apiUrl = 'http://localhost:5000';
   private platformId = inject(PLATFORM_ID);
   private isBrowser = isPlatformBrowser(this.platformId);
+  private publicKeys = new Map<string, CachedPublicKey>();
   
   constructor(
     private http: HttpClient,
@@ -53,10 +66,26 @@ export class MessageService {
    * @returns Observable with the user's public key
    */
   getUserPublicKey(username: string): Observable<string> {
-    return this.http.get<UserPublicKey>(`${this.apiUrl}/user_public_key?username=${username}`)
+    // Revalidate a cached key with its ETag: an unchanged key costs a bodyless
+    // 304, and a rotated one is picked up on the next send
+    const cached = this.publicKeys.get(username);
+    const headers: Record<string, string> = cached?.etag ? { 'If-None-Match': cached.etag } : {};
+    
+    return this.http.get<UserPublicKey>(`${this.apiUrl}/user_public_key?username=${username}`, {
+      headers,
+      observe: 'response'
+    })
       .pipe(
-        map(response => response.public_key),
+        map(response => {
+          const publicKey = response.body!.public_key;
+          this.publicKeys.set(username, { publicKey, etag: response.headers.get('ETag') });
+          return publicKey;
+        }),
         catchError(error => {
+          // HttpClient reports 304 Not Modified as an error
+          if (cached && error instanceof HttpErrorResponse && error.status === 304) {
+            return of(cached.publicKey);
+          }
           console.error('Error getting public key:', error);
           throw error;
         })
@@ -65,9 +94,10 @@ export class MessageService {
 
   /**
    * Get messages for the current user and decrypt them
+   * @param sinceId - Only fetch messages newer than this id (oldest first)
    * @returns Observable with decrypted messages
    */
-  getMessages(): Observable<DecryptedMessage[]> {
+  getMessages(sinceId?: number): Observable<DecryptedMessage[]> {
     // Return empty array if not in browser
     if (!this.isBrowser) {
       return of([]);
@@ -86,10 +116,22 @@ export class MessageService {
       return of([]);
     }
     
-    // Get messages from the server
-    return this.http.get<MessageResponse[]>(`${this.apiUrl}/messages?username=${username}`)
+    // Get messages from the server, only the delta when polling
+    let url = `${this.apiUrl}/messages?username=${username}`;
+    if (sinceId !== undefined) {
+      url += `&since_id=${sinceId}`;
+    }
+    
+    // Binary frames carry the ciphertext as raw bytes, no base64 to undo
+    return this.authService.authHeaders()
       .pipe(
-        switchMap(async messages => {
+        switchMap(auth => this.http.get(url, {
+          headers: { ...auth, Accept: WIRE_MIMETYPE },
+          responseType: 'arraybuffer'
+        })),
+        map(body => decodePage(body)),
+        switchMap(async page => {
+          const messages = page.messages;
           try {
             // Import the private key
             const privateKey = await this.cryptoService.importPrivateKey(privateKeyJwk);
@@ -100,33 +142,29 @@ export class MessageService {
             for (const message of messages) {
               try {
                 // Skip messages without encryption data
-                if (!message.encrypted_key || !message.iv) {
+                if (!message.encryptedKey || !message.iv) {
                   decryptedMessages.push({
                     id: message.id,
                     sender: message.sender,
                     decrypted: '(Unable to decrypt - missing encryption data)',
-                    encrypted_msg: message.encrypted_msg
+                    encrypted_msg: this.cryptoService.arrayBufferToBase64(message.encryptedMsg.slice().buffer)
                   });
                   continue;
                 }
                 
-                // Decode the encrypted key and IV
-                const encryptedKey = this.cryptoService.base64ToArrayBuffer(message.encrypted_key);
-                const iv = new Uint8Array(this.cryptoService.base64ToArrayBuffer(message.iv));
-                
-                // Decrypt the AES key
-                const aesKeyData = await this.cryptoService.decryptAesKey(encryptedKey, privateKey);
+                // Decrypt the AES key (slice() copies the field out of the response buffer)
+                const aesKeyData = await this.cryptoService.decryptAesKey(message.encryptedKey.slice().buffer, privateKey);
                 const aesKey = await this.cryptoService.importAesKey(aesKeyData);
                 
                 // Decrypt the message
-                const encryptedMessage = this.cryptoService.base64ToArrayBuffer(message.encrypted_msg);
-                const decryptedMessage = await this.cryptoService.decryptMessage(encryptedMessage, aesKey, iv);
+                const encryptedMessage = message.encryptedMsg.slice().buffer;
+                const decryptedMessage = await this.cryptoService.decryptMessage(encryptedMessage, aesKey, message.iv.slice());
                 
                 decryptedMessages.push({
                   id: message.id,
                   sender: message.sender,
                   decrypted: decryptedMessage,
-                  encrypted_msg: message.encrypted_msg
+                  encrypted_msg: this.cryptoService.arrayBufferToBase64(encryptedMessage)
                 });
               } catch (error) {
                 console.error('Error decrypting message:', error);
@@ -134,7 +172,7 @@ export class MessageService {
                   id: message.id,
                   sender: message.sender,
                   decrypted: '(Unable to decrypt message)',
-                  encrypted_msg: message.encrypted_msg
+                  encrypted_msg: this.cryptoService.arrayBufferToBase64(message.encryptedMsg.slice().buffer)
                 });
               }
             }
@@ -188,23 +226,11 @@ export class MessageService {
           // Encrypt the AES key with the recipient's public key
           const encryptedKey = await this.cryptoService.encryptAesKey(aesKeyData, publicKey);
           
-          // Convert binary data to base64 for transmission
-          const encryptedMessage = this.cryptoService.arrayBufferToBase64(ciphertext);
-          const encryptedKeyBase64 = this.cryptoService.arrayBufferToBase64(encryptedKey);
-          const ivBase64 = this.cryptoService.arrayBufferToBase64(iv.buffer);
-          
-          // Create the message request
-          const messageRequest: MessageRequest = {
-            receiver: messageData.receiver,
-            encrypted_msg: encryptedMessage,
-            encrypted_key: encryptedKeyBase64,
-            iv: ivBase64
-          };
-          
-          // Send the encrypted message to the server
-          return this.http.post(`${this.apiUrl}/send`, {
-            sender,
-            ...messageRequest
+          // Send the raw bytes as a binary frame rather than base64 in JSON
+          const body = encodeSend(sender, messageData.receiver, ciphertext, encryptedKey, iv.buffer as ArrayBuffer);
+          const auth = await firstValueFrom(this.authService.authHeaders());
+          return this.http.post(`${this.apiUrl}/send`, body, {
+            headers: { ...auth, 'Content-Type': WIRE_MIMETYPE }
           }).toPromise();
         } catch (error) {
           console.error('Error encrypting message:', error);
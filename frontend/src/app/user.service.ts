@@ -1,6 +1,6 @@
 // src/app/user.service.ts
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
+import { HttpClient, HttpParams } from '@angular/common/http';
 import { Observable } from 'rxjs';
 
 export interface User {
@@ -9,6 +9,12 @@ export interface User {
   public_key: string;
 }
 
+export interface UserPage {
+  users: User[];
+  next_cursor: string | null;
+  has_more: boolean;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -17,7 +23,20 @@ export class UserService {
 
   constructor(private http: HttpClient) { }
 
-  getUsers(): Observable<User[]> {
-    return this.http.get<User[]>(`${this.apiUrl}/users`);
+  /**
+   * Get one page of the user directory in username order
+   * @param query - Only return usernames starting with this prefix
+   * @param after - next_cursor from the previous page
+   * @param limit - Page size (the server caps it at 200)
+   */
+  getUsers(query: string = '', after?: string, limit: number = 20): Observable<UserPage> {
+    let params = new HttpParams().set('limit', limit);
+    if (query) {
+      params = params.set('q', query);
+    }
+    if (after) {
+      params = params.set('after', after);
+    }
+    return this.http.get<UserPage>(`${this.apiUrl}/users`, { params });
   }
 }
\ No newline at end of file
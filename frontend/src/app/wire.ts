@@ -0,0 +1,125 @@
+// src/app/wire.ts
+// Binary framing for /send and /messages (see backend/wire.py for the layout).
+// Ciphertext, wrapped keys and IVs travel as raw bytes instead of base64.
+
+export const WIRE_MIMETYPE = 'application/x-echo-frames';
+
+const MESSAGE = 1;
+const PAGE_END = 2;
+const SEND = 3;
+
+export interface WireMessage {
+  id: number;
+  sender: string;
+  encryptedMsg: Uint8Array;
+  encryptedKey: Uint8Array | null;
+  iv: Uint8Array | null;
+}
+
+export interface WirePage {
+  messages: WireMessage[];
+  nextCursor: number | null;
+  hasMore: boolean;
+}
+
+const encoder = new TextEncoder();
+const decoder = new TextDecoder();
+
+/**
+ * Encode a /send request body
+ */
+export function encodeSend(
+  sender: string,
+  receiver: string,
+  encryptedMsg: ArrayBuffer,
+  encryptedKey: ArrayBuffer,
+  iv: ArrayBuffer,
+  ttl: number = 0
+): ArrayBuffer {
+  const fields: [Uint8Array, number][] = [
+    [encoder.encode(sender), 2],
+    [encoder.encode(receiver), 2],
+    [new Uint8Array(encryptedMsg), 4],
+    [new Uint8Array(encryptedKey), 2],
+    [new Uint8Array(iv), 2],
+  ];
+  const bodyLength = fields.reduce((total, [bytes, prefix]) => total + prefix + bytes.length, 0) + 4;
+  const buffer = new ArrayBuffer(5 + bodyLength);
+  const view = new DataView(buffer);
+  const out = new Uint8Array(buffer);
+
+  view.setUint8(0, SEND);
+  view.setUint32(1, bodyLength);
+  let offset = 5;
+  for (const [bytes, prefix] of fields) {
+    if (prefix === 2) {
+      view.setUint16(offset, bytes.length);
+    } else {
+      view.setUint32(offset, bytes.length);
+    }
+    offset += prefix;
+    out.set(bytes, offset);
+    offset += bytes.length;
+  }
+  view.setUint32(offset, ttl);
+  return buffer;
+}
+
+/**
+ * Decode a /messages response body
+ */
+export function decodePage(buffer: ArrayBuffer): WirePage {
+  const view = new DataView(buffer);
+  const page: WirePage = { messages: [], nextCursor: null, hasMore: false };
+  let offset = 0;
+
+  const take = (length: number): Uint8Array => {
+    if (offset + length > buffer.byteLength) {
+      throw new Error('Truncated frame');
+    }
+    const bytes = new Uint8Array(buffer, offset, length);
+    offset += length;
+    return bytes;
+  };
+  const field16 = (): Uint8Array => {
+    const length = view.getUint16(offset);
+    offset += 2;
+    return take(length);
+  };
+  const field32 = (): Uint8Array => {
+    const length = view.getUint32(offset);
+    offset += 4;
+    return take(length);
+  };
+
+  while (offset < buffer.byteLength) {
+    const kind = view.getUint8(offset);
+    const length = view.getUint32(offset + 1);
+    const end = offset + 5 + length;
+    offset += 5;
+
+    if (kind === MESSAGE) {
+      // Message ids fit in 53 bits (shards allocate from index << 40)
+      const id = Number(view.getBigUint64(offset));
+      offset += 8;
+      const sender = decoder.decode(field16());
+      const encryptedMsg = field32();
+      const encryptedKey = field16();
+      const iv = field16();
+      page.messages.push({
+        id,
+        sender,
+        encryptedMsg,
+        encryptedKey: encryptedKey.length ? encryptedKey : null,
+        iv: iv.length ? iv : null,
+      });
+    } else if (kind === PAGE_END) {
+      const cursor = Number(view.getBigInt64(offset));
+      page.nextCursor = cursor < 0 ? null : cursor;
+      page.hasMore = view.getUint8(offset + 8) === 1;
+    }
+    // Unknown kinds are skipped
+    offset = end;
+  }
+  return page;
+}